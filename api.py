@@ -1,44 +1,71 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
 import threading
 import os
+import hashlib
+import importlib
 import cv2
 import tempfile
 import base64
 import time
 import json
+import uuid
 import subprocess
 import signal
 import asyncio
-from typing import Optional, Dict, Any, Union
+import re
+import logging
+import socket
+from collections import OrderedDict
+from dataclasses import asdict, replace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Union, List
 import numpy as np
-from supabase import create_client
 from os import environ
-from notion_tools import NotionTools
-
-# Set matplotlib backend before importing
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from state_snapshot import EMPTY_SNAPSHOT, SessionSnapshot, SnapshotStore
+from jobs import CountingExecutor, JobManager
+from video_uploads import UploadError, UploadStore
+from detection_utils import (
+    ANOMALY_ACTIONS, DEFAULT_VOCABULARY, VIOLENCE_CLASS, VOCABULARIES, Vocabulary, embedding_cache,
+    determine_action, load_anomaly_model, load_pose_model, load_violence_model, set_vocabulary,
+)
+from offline_analysis import analyze_video, analyze_video_parallel, write_timeline
+from video_sources import open_capture
+from motion import MotionGate
+from metrics import MetricsRegistry
+from profiling import ProfileCapture
+from structured_logging import configure_logging, log_event, route_ultralytics_logging
+from event_clips import ClipRecorder, ClipRetention
+from event_store import EventStore
+from frame_store import FrameStore
+from debounce import Debouncer
+from tracking import Tracker
+from roi import RegionMask
+from tiling import TiledDetector
+from process_workers import StreamProcess
+from state_backend import InProcessStateBackend, SQLiteStateBackend
+from thread_budget import MODEL_STAGES, ThreadBudget
+from stream_watchdog import StreamWatchdog, is_live_source
+from telegram_fanout import AlertDispatcher, ForwardingDispatcher, create_bot, deliver_forwarded, expire_spool
+# torch, ultralytics, supervision, matplotlib, telegram, agno and supabase
+# take seconds to import: they are imported where first used, or in the
+# background by warm_up, so the server listens right away
+# numpy and OpenCV stay eager: the pipeline modules above import them at
+# the top too, and they take a fraction of a second
 
-from ultralytics import YOLO, YOLOE
 import io
-from telegram import Bot
-from telegram.ext import Application, ApplicationBuilder, CommandHandler, MessageHandler, filters
 from datetime import datetime
 from dotenv import load_dotenv, find_dotenv
-import supervision as sv
-import torch
-from agno.agent import Agent
-from agno.models.google import Gemini
-from agno.storage.sqlite import SqliteStorage
-from agno.tools import Toolkit
 
 
 load_dotenv(find_dotenv(filename=".env"))
 
+# JSON logs through a background queue; per-frame library output is silenced
+configure_logging()
+logger = logging.getLogger("api")
+
 # Save the notion Token and DB ID 
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 DATABASE_ID = os.getenv("DATABASE_ID")
@@ -58,40 +85,164 @@ app.add_middleware(
 
 
 # Global variables
-inference_running = False
-processing_thread = None
-stop_event = threading.Event()
-detections = {
-    'violence': 0,
-    'poseAnomalies': 0,
-    'otherAnomalies': 0
-}
-cap = None
-process_lock = threading.Lock()
+sessions = {}  # session_id -> Session
+process_lock = threading.Lock()  # guards the sessions registry, held only briefly
+models_lock = threading.Lock()
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1"))
+
+# Session start/stop runs as background jobs so HTTP requests return immediately
+jobs = JobManager(max_workers=int(os.getenv("LIFECYCLE_WORKERS", "2")))
+
+# On-demand profiling of live sessions (admin endpoints, protected by ADMIN_TOKEN when set)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = 120
+profile_captures = OrderedDict()  # capture_id -> ProfileCapture
+profile_history_size = 50
+
+# Hot-path metrics exposed at /metrics in Prometheus format
+metrics = MetricsRegistry()
+
+# Immutable per-session state published by the inference worker; readers never lock
+snapshots = SnapshotStore(history_size=int(os.getenv("SNAPSHOT_HISTORY", "100")))
+fps_smoothing = 0.1
+
+# Session ownership, snapshots, jobs and control commands shared between API
+# workers: "memory" for a single worker, "sqlite" for uvicorn --workers > 1
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB = os.getenv("STATE_DB", "state.db")
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "0.5"))
+STATE_STALE_SECONDS = float(os.getenv("STATE_STALE_SECONDS", "10"))
+state = SQLiteStateBackend(STATE_DB) if STATE_BACKEND == "sqlite" else InProcessStateBackend()
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# (live sessions of other workers, snapshot fields by session id) as last read by run_state_sync,
+# so that request handlers never wait on the database
+remote_view = ([], {})
 
 # Telegram configuration
 TOKEN = os.getenv("TELEGRAM_BOT_ID")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID2")
-os.environ["AGNO_API_KEY"] = os.getenv("AGNO_API_KEY")
+# Extra chats that receive every session's alerts, comma separated
+TELEGRAM_ALERT_CHAT_IDS = [chat_id.strip() for chat_id in os.getenv("TELEGRAM_ALERT_CHAT_IDS", "").split(",") if chat_id.strip()]
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "8"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # messages per second, all chats
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # messages per second, per private chat
+TELEGRAM_GROUP_PER_MINUTE = int(os.getenv("TELEGRAM_GROUP_PER_MINUTE", "20"))
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Inference defaults, overridable per session
+IMGSZ = int(os.getenv("IMGSZ", "320"))
+CONCURRENT_MODELS = os.getenv("CONCURRENT_MODELS", "false").lower() == "true"
+MOTION_GATING = os.getenv("MOTION_GATING", "false").lower() == "true"
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.01"))
+ANOMALY_TILING = os.getenv("ANOMALY_TILING", "false").lower() == "true"
+ANOMALY_TILE_SIZE = int(os.getenv("ANOMALY_TILE_SIZE", "640"))
+
+# Detection hysteresis: enter after N hits in the last M frames, exit after the hold time
+DEBOUNCE_ENTER_FRAMES = int(os.getenv("DEBOUNCE_ENTER_FRAMES", "3"))
+DEBOUNCE_WINDOW_FRAMES = int(os.getenv("DEBOUNCE_WINDOW_FRAMES", "5"))
+DEBOUNCE_HOLD_SECONDS = float(os.getenv("DEBOUNCE_HOLD_SECONDS", "2.0"))
+
+# Confidence thresholds of the models; each tracker activates tracks at its model's threshold
+VIOLENCE_CONF = 0.5
+POSE_CONF = 0.25  # ultralytics' default
+ANOMALY_CONF = 0.1
+
+# Multi-object tracking of people (pose) and objects (anomaly model)
+TRACK_HISTORY = int(os.getenv("TRACK_HISTORY", "5"))  # frames a track's action or class is voted over
+TRACK_SMOOTHING = float(os.getenv("TRACK_SMOOTHING", "0.5"))  # weight of the past in keypoint smoothing
+TRACK_LOST_FRAMES = int(os.getenv("TRACK_LOST_FRAMES", "30"))
+TRACK_REALERT_SECONDS = float(os.getenv("TRACK_REALERT_SECONDS", "60"))
+
+# "thread" runs each session in the API process, "process" in a supervised worker process
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "thread")
+WORKER_MAX_RESTARTS = int(os.getenv("WORKER_MAX_RESTARTS", "5"))
+WORKER_COMMAND_INTERVAL = 0.1  # seconds between checks for control commands in a worker process
+WORKER_FRAME_BYTES = int(os.getenv("WORKER_FRAME_BYTES", str(1920 * 1080 * 3)))
+
+# Threads for running the three models of a frame concurrently
+model_executor = ThreadPoolExecutor(max_workers=3 * MAX_SESSIONS, thread_name_prefix="model")
+
+# Cores shared by all sessions' model calls (0 = unmanaged, torch and OpenCV defaults)
+CPU_THREAD_BUDGET = int(os.getenv("CPU_THREAD_BUDGET", "0"))
+CPU_RESERVED_CORES = int(os.getenv("CPU_RESERVED_CORES", "1"))
+CPU_PINNING = os.getenv("CPU_PINNING", "false").lower() == "true"
+thread_budget = ThreadBudget(CPU_THREAD_BUDGET, reserved=CPU_RESERVED_CORES, pin=CPU_PINNING) if CPU_THREAD_BUDGET else None
+
+# Default capture backend: "opencv" or "ffmpeg" (decoder-side scaling and fps decimation)
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "opencv")
+
+# Live stream watchdog: stall and freeze detection, buffer flushing and reconnects
+STREAM_STALE_SECONDS = float(os.getenv("STREAM_STALE_SECONDS", "10"))
+STREAM_FREEZE_SECONDS = float(os.getenv("STREAM_FREEZE_SECONDS", "60"))  # 0 = stall checks only
+STREAM_FREEZE_TOLERANCE = float(os.getenv("STREAM_FREEZE_TOLERANCE", "1.0"))  # Gray levels
+STREAM_MAX_LAG = float(os.getenv("STREAM_MAX_LAG", "2"))
+STREAM_RECONNECT_BACKOFF = float(os.getenv("STREAM_RECONNECT_BACKOFF", "1"))
+STREAM_MAX_RECONNECTS = int(os.getenv("STREAM_MAX_RECONNECTS", "0")) or None  # 0 = keep trying
+
 # Temporary file paths
 temp_dir = tempfile.mkdtemp()
-temp_video = os.path.join(temp_dir, 'temp_video.mp4')
 
-# Directories for saving frames
-os.makedirs("violence_frames", exist_ok=True)
-os.makedirs("anomaly_frames", exist_ok=True)
+# Chunked video uploads, referenced from /api/start by uploadId
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(20 * 1024 ** 3)))
+upload_store = UploadStore(UPLOAD_DIR, max_size=UPLOAD_MAX_SIZE)
+# Incomplete uploads without a new chunk for this long are deleted
+UPLOAD_EXPIRY_HOURS = float(os.getenv("UPLOAD_EXPIRY_HOURS", "24"))
+UPLOAD_SWEEP_INTERVAL = 3600  # seconds
+
+# Offline analysis of recorded video runs on its own job pool
+ANALYSIS_DIR = os.getenv("ANALYSIS_DIR", "analysis_results")
+os.makedirs(ANALYSIS_DIR, exist_ok=True)
+analysis_jobs = JobManager(max_workers=int(os.getenv("ANALYSIS_WORKERS", "1")))
+
+# Detection events and the pre/post-event clips attached to them
+EVENT_DIR = os.getenv("EVENT_DIR", "events")
+events = EventStore(EVENT_DIR)
+CLIPS_ENABLED = os.getenv("CLIPS_ENABLED", "true").lower() == "true"
+CLIP_PRE_SECONDS = float(os.getenv("CLIP_PRE_SECONDS", "5"))
+CLIP_POST_SECONDS = float(os.getenv("CLIP_POST_SECONDS", "5"))
+CLIP_FPS = float(os.getenv("CLIP_FPS", "10"))
+CLIP_MAX_WIDTH = int(os.getenv("CLIP_MAX_WIDTH", "640"))
+CLIP_FOURCC = os.getenv("CLIP_FOURCC", "mp4v")
+clip_executor = ThreadPoolExecutor(max_workers=int(os.getenv("CLIP_WORKERS", "1")), thread_name_prefix="clip")
+CLIP_DIR = os.path.join(EVENT_DIR, "clips")
+# Photos and clips of alerts a worker process hands to the API process to send
+ALERT_SPOOL_DIR = os.path.join(EVENT_DIR, "alert_spool")
+# Applied by the API process only, after every clip it learns about
+clip_retention = ClipRetention(
+    CLIP_DIR,
+    max_bytes=int(float(os.getenv("CLIP_STORE_MAX_MB", "2048")) * 1024 ** 2),
+    max_age=float(os.getenv("CLIP_STORE_MAX_AGE_DAYS", "7")) * 24 * 3600,
+)
+
+# Alert snapshots with thumbnails, bounded by size and age
+FRAME_DIR = os.getenv("FRAME_DIR", "frames")
+frame_store = FrameStore(
+    FRAME_DIR,
+    max_bytes=int(float(os.getenv("FRAME_STORE_MAX_MB", "1024")) * 1024 ** 2),
+    max_age=float(os.getenv("FRAME_STORE_MAX_AGE_DAYS", "7")) * 24 * 3600,
+)
+# Age quotas also apply on a quiet system, where no new write triggers them
+RETENTION_SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_INTERVAL", "600"))  # seconds
 
-# Define device
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-print(f"Using device: {device}")
+# Model device, resolved on first use since it needs torch
+device = None
+
+# Import the heavy libraries (and optionally load the models) in the background after startup
+WARM_UP = os.getenv("WARM_UP", "true").lower() == "true"
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
 
 # Initialize models on the selected device
 violence_model = None
 pose_model = None
 anomaly_model = None
 
+# The anomaly model is shared by all sessions; its classes are switched to
+# each session's vocabulary under this lock, without reloading the weights
+anomaly_lock = threading.Lock()
+anomaly_vocabulary = DEFAULT_VOCABULARY
+
 # Tracking variables for detections
 violence_detection_count = 0
 violence_detection_threshold = 1
@@ -99,76 +250,74 @@ pose_anomaly_count = 0
 pose_anomaly_threshold = 1
 anomaly_count = 0
 anomaly_threshold = 1
-last_alert_time = 0
 alert_cooldown = 60  # seconds
-detection_times = []
-frames_sent_count = 0
 send_threshold = 1
-pose_frames_sent_count = 0
 pose_send_threshold = 1
-anomaly_frames_sent_count = 0
 anomaly_send_threshold = 1
 
-# State variables for alerting
-is_violence_active = False
-is_pose_anomaly_active = False
-is_anomaly_active = False
-
 # Telegram bot instance and related variables
 bot = None
+alert_dispatcher = None  # Fans alerts out to a session's subscribers through `bot`
 alert_loop = None
 alert_thread = None
 telegram_thread = None
+telegram_app = None  # Application polling for chat messages, and the loop it runs on
+telegram_loop = None
 bot_initialized = False
 bot_lock = threading.Lock()
 
-# Classes to detect
-NAMES_ANOMALY = ["Fire", "Black Smoke","White Smoke", "Knife", "Gun", "Blood"]
-NAMES_OBJECT = ["Person", "Mask", "Vest", "Hat"]
-NAMES_ANOMALY_OBJECT = NAMES_ANOMALY + NAMES_OBJECT
-ANOMALY_INDICES = [0, 1, 2, 3, 4]
-
-# Constants for pose estimation
-ACTION_ANGLES = {
-    'standing': {'hip': (170, 180), 'knee': (170, 180)},
-    'sitting': {'hip': (85, 120), 'knee': (85, 120)},
-    'walking': {'hip': (130, 170), 'knee': (130, 170)},
-    'bending': {'hip': (45, 85), 'knee': (170, 180)},
-    'falling': {'hip': (30, 80), 'knee': (30, 80)},
-    'lying': {'hip': (160, 180), 'knee': (160, 180), 'vertical': False},
-    'crouching': {'hip': (45, 90), 'knee': (30, 70)}
-}
-ANOMALY_ACTIONS = ['falling', 'lying', 'crouching']
-
 # User ID for the agent
 user_id = None  # Will be set dynamically based on the current user
 
-# Add these global variables near the other tracking variables
-pose_detection_times = []
-anomaly_detection_times = []
-
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY) if SUPABASE_URL and SUPABASE_KEY else None
+supabase = None  # created on first use by get_supabase
+supabase_lock = threading.Lock()
 
-# Custom tool for Agno agent
-class SurveillanceState(Toolkit):
-    name = "get_surveillance_state"
-    description = "Get the current state of the surveillance system"
-    
-    def __init__(self):
-        super().__init__()
-        self.register(self.run)
-    
-    def run(self, query: str) -> str:
-        with process_lock:
-            state = {
-                'violence_count': detections['violence'],
-                'pose_anomaly_count': detections['poseAnomalies'],
-                'anomaly_count': detections['otherAnomalies']
-            }
-        return f"Violence detections: {state['violence_count']}\nPose anomalies: {state['pose_anomaly_count']}\nOther anomalies: {state['anomaly_count']}"
+def get_supabase():
+    """The Supabase client, or None when it is not configured"""
+    global supabase
+    if supabase is None and SUPABASE_URL and SUPABASE_KEY:
+        with supabase_lock:
+            if supabase is None:
+                from supabase import create_client
+                supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return supabase
+
+def get_device():
+    """'cuda' when available, else 'cpu'"""
+    global device
+    if device is None:
+        import torch
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        logger.info(f"Using device: {device}")
+    return device
+
+def cuda_memory_allocated():
+    if device != 'cuda':
+        return 0
+    import torch
+    return torch.cuda.memory_allocated()
+
+# Custom tool for Agno agent, defined on first use so agno is only imported then
+def surveillance_state_toolkit():
+    from agno.tools import Toolkit
+
+    class SurveillanceState(Toolkit):
+        name = "get_surveillance_state"
+        description = "Get the current state of the surveillance system"
+
+        def __init__(self):
+            super().__init__()
+            self.register(self.run)
+
+        def run(self, query: str) -> str:
+            state = find_snapshot()
+            return (f"Violence detections: {state.violence}\nPose anomalies: {state.pose_anomalies}\nOther anomalies: {state.other_anomalies}\n"
+                    f"Running: {state.running}\nProcessing FPS: {state.fps:.1f}")
+
+    return SurveillanceState()
 
 # Create Agno agent with optimized settings
 agent = None
@@ -176,154 +325,585 @@ agent = None
 # Agent lock
 agent_lock = threading.Lock()
 
-# Rate limiting for chat handler
-last_chat_time = 0
+# Rate limiting for chat handler (per chat)
+last_chat_time = {}
 chat_cooldown = 10  # seconds between agent invocations
 
+# Agent calls run on a bounded pool so the Telegram polling loop never blocks
+AGENT_MAX_WORKERS = int(os.getenv("AGENT_MAX_WORKERS", "2"))
+AGENT_MAX_PENDING_PER_CHAT = int(os.getenv("AGENT_MAX_PENDING_PER_CHAT", "3"))
+agent_executor = CountingExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix="agent")
+agent_local = threading.local()
+
+# Short-TTL cache for identical repeated questions
+response_cache = OrderedDict()
+response_cache_ttl = 30  # seconds
+response_cache_size = 256
+
+# Questions that can be answered straight from the detection counters: a whole-message
+# status request, or a count word together with a detection noun
+STATE_QUERY_TRIGGER = re.compile(
+    r"^\s*(?:what(?:'s| is) the |show (?:me )?(?:the )?|give me (?:the )?)?(?:current )?"
+    r"(?:status|state|stats|detections|detection (?:counts?|stats))(?: please| now)?\s*[?.!]*\s*$", re.IGNORECASE)
+STATE_QUERY_COUNT = re.compile(r"\b(how many|count|counts|number of|total)\b", re.IGNORECASE)
+STATE_QUERY_NOUN = re.compile(r"\b(detect|alert|incident|violen|pose|posture|fall|anomal|fire|smoke|weapon|knife|gun|blood)", re.IGNORECASE)
+STATE_QUERY_EXCLUDE = re.compile(r"\b(save|create|report|notion|page|block|update|delete|append|why|explain|trend|summari[sz]e)", re.IGNORECASE)
+STATE_QUERY_TOPICS = {
+    'violence': re.compile(r"\bviolen", re.IGNORECASE),
+    'poseAnomalies': re.compile(r"\b(pose|posture|fall|lying|crouch)", re.IGNORECASE),
+    'otherAnomalies': re.compile(r"\b(other|anomal|object|fire|smoke|weapon|knife|gun|blood)", re.IGNORECASE),
+}
+STATE_QUERY_LABELS = {
+    'violence': "Violence detections",
+    'poseAnomalies': "Pose anomalies",
+    'otherAnomalies': "Other anomalies",
+}
+
 # Define models for request/response validation
 class StartInferenceRequest(BaseModel):
     sourceType: str
     rtspUrl: Optional[str] = None
-    videoData: Optional[str] = None
+    videoData: Optional[str] = None  # Legacy base64 upload, prefer uploadId
+    uploadId: Optional[str] = None  # Id returned by /api/uploads
+    captureBackend: Optional[str] = None  # "opencv" or "ffmpeg", defaults to CAPTURE_BACKEND
+    decodeWidth: Optional[int] = None  # ffmpeg only: scale frames to this width in the decoder
+    decodeFps: Optional[float] = None  # ffmpeg only: drop frames in the decoder down to this rate
+    hwaccel: Optional[str] = None  # ffmpeg only: e.g. "auto", "cuda", "vaapi"
+    imgsz: Optional[int] = None  # Model input size, defaults to IMGSZ
+    concurrentModels: Optional[bool] = None  # Run the three models of a frame in parallel threads
+    motionGating: Optional[bool] = None  # Skip inference on frames without motion
+    motionThreshold: Optional[float] = None  # Fraction of changed pixels that counts as motion
+    rois: Optional[List[List[List[float]]]] = None  # Polygons [[x, y], ...] to run inference on, pixels or 0..1
+    exclusions: Optional[List[List[List[float]]]] = None  # Polygons whose detections are dropped
+    tiledAnomaly: Optional[bool] = None  # Run the anomaly model on tiles with motion or people
+    tileSize: Optional[int] = None  # Tile size in pixels, defaults to ANOMALY_TILE_SIZE
+    vocabulary: Optional[str] = None  # Named anomaly class set, see /api/vocabularies
+    anomalyClasses: Optional[List[str]] = None  # Custom anomaly classes, overrides vocabulary
+    objectClasses: Optional[List[str]] = None  # Custom non-anomaly classes to detect alongside
+    isolated: Optional[bool] = None  # Run capture and inference in a worker process, defaults to EXECUTION_MODE
     telegramEnabled: Optional[bool] = False
     telegramToken: Optional[str] = None
     telegramChatId: Optional[str] = None
+    telegramChatIds: Optional[List[str]] = None  # Additional chats that receive this session's alerts
     username: Optional[str] = None  # Username
     email: Optional[str] = None  # Add email field to identify user in database
 
+class CreateUploadRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+class AnalyzeRequest(BaseModel):
+    uploadId: str
+    batchSize: int = 8
+    frameStride: int = 1  # Analyze every Nth frame
+    workers: int = 1  # Worker processes, each decoding its own keyframe-aligned segment
+    imgsz: int = 320
+    format: str = "json"  # json or parquet
+    vocabulary: Optional[str] = None  # Named anomaly class set, as for live sessions
+    anomalyClasses: Optional[List[str]] = None
+    objectClasses: Optional[List[str]] = None
+
+class ProfileRequest(BaseModel):
+    sessionId: Optional[str] = None  # Defaults to the only running session
+    seconds: float = 10
+    torchProfiler: bool = True
+    topN: int = 25
+
+class VocabularyRequest(BaseModel):
+    vocabulary: Optional[str] = None
+    anomalyClasses: Optional[List[str]] = None
+    objectClasses: Optional[List[str]] = None
+
+class SubscribersRequest(BaseModel):
+    chatIds: List[str]
+
 class StatusResponse(BaseModel):
     running: bool
-    detections: Dict[str, int]
+    detections: Dict[str, int]  # Totals over the running sessions when there are several
+    session: Optional[Dict[str, Any]] = None  # None when several sessions are running
+    sessions: List[Dict[str, Any]] = []  # Every running session
+
+class StopInferenceRequest(BaseModel):
+    sessionId: Optional[str] = None  # Stop every active session when omitted
 
 class ApiResponse(BaseModel):
     status: str
     message: str
+    sessionId: Optional[str] = None
+    jobId: Optional[str] = None
+
+class Session:
+    """Runtime state of one surveillance session: capture, counters and alert bookkeeping"""
+    
+    def __init__(self, session_id, request):
+        self.session_id = session_id
+        self.request = request
+        self.source = None
+        self.status = "starting"  # starting, running, stopping, stopped, failed
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.cap = None
+        self.running = False
+        self.temp_files = []
+        self.created_at = time.time()
+        
+        # Inference options
+        self.imgsz = request.imgsz or IMGSZ
+        self.concurrent_models = CONCURRENT_MODELS if request.concurrentModels is None else request.concurrentModels
+        self.motion_gating = MOTION_GATING if request.motionGating is None else request.motionGating
+        self.motion_threshold = request.motionThreshold if request.motionThreshold is not None else MOTION_THRESHOLD
+        self.vocabulary = resolve_vocabulary(request)
+        self.region = RegionMask(request.rois, request.exclusions) if request.rois or request.exclusions else None
+        tiled = ANOMALY_TILING if request.tiledAnomaly is None else request.tiledAnomaly
+        self.tiler = TiledDetector(tile_size=request.tileSize or ANOMALY_TILE_SIZE,
+                                   motion_threshold=self.motion_threshold) if tiled else None
+        self.watchdog = None  # StreamWatchdog of the session's capture, set by the worker
+        self.person_boxes = None  # Person boxes of the last frame, used to pick anomaly tiles
+        self.motion_mask = None
+        self.frames_skipped = 0
+        self.stage_observer = None  # Optional callable(stage, milliseconds), used by the benchmark
+        self.profile_capture = None  # Set by the admin profiling endpoint
+        self.isolated = EXECUTION_MODE == "process" if request.isolated is None else request.isolated
+        self.supervisor = None  # StreamProcess of an isolated session, in the API process
+        self.publisher = None  # RingPublisher of an isolated session, in its worker process
+        self.forwarded_alerts = None  # asyncio.Lock ordering the alert sends its worker forwards
+        self.finished = False  # set by finish_session
+        self.subscribers = []  # Telegram chat ids that receive this session's alerts
+        self.clip_recorder = ClipRecorder(
+            CLIP_DIR, clip_executor, pre_seconds=CLIP_PRE_SECONDS,
+            post_seconds=CLIP_POST_SECONDS, fps=CLIP_FPS, max_width=CLIP_MAX_WIDTH, fourcc=CLIP_FOURCC,
+        ) if CLIPS_ENABLED else None
+        
+        # Pre-created metric series so the hot loop never looks them up
+        self.stage_metrics = {
+            'decode': metrics.histogram('surveillance_decode_seconds', "Time to read and decode a frame", session=session_id),
+            'violence': metrics.histogram('surveillance_model_latency_seconds', "Model inference latency", session=session_id, model='violence'),
+            'pose': metrics.histogram('surveillance_model_latency_seconds', "Model inference latency", session=session_id, model='pose'),
+            'anomaly': metrics.histogram('surveillance_model_latency_seconds', "Model inference latency", session=session_id, model='anomaly'),
+            'annotate': metrics.histogram('surveillance_annotate_seconds', "Detection logic and annotation time per frame", session=session_id),
+            'capture_to_detection': metrics.histogram('surveillance_capture_to_detection_seconds', "Time from frame capture to detection decision", session=session_id),
+            'end_to_end': metrics.histogram('surveillance_end_to_end_latency_seconds', "Time from capture at the source, including stream lag, to detection decision", session=session_id),
+            'frame': metrics.histogram('surveillance_frame_seconds', "End-to-end processing time per frame", session=session_id),
+        }
+        self.frames_counter = metrics.counter('surveillance_frames_total', "Frames run through the models", session=session_id)
+        self.anomaly_tiles = metrics.histogram('surveillance_anomaly_tiles', "Images per frame sent to the anomaly model in tiled mode",
+                                               buckets=(1, 2, 4, 8, 16, 32, 64), session=session_id)
+        self.frames_dropped = metrics.counter('surveillance_frames_dropped_total', "Frames read but not run through the models", session=session_id, reason='motion')
+        self.alerts_scheduled = metrics.counter('surveillance_alerts_scheduled_total', "Alerts handed to the alert loop", session=session_id)
+        self.alerts_completed = metrics.counter('surveillance_alerts_completed_total', "Alerts finished by the alert loop", session=session_id)
+        # Held here so that an alert finishing after the session's series were removed cannot re-create them
+        self.alert_latency = {
+            alert_type: metrics.histogram('surveillance_alert_send_seconds', "Time to deliver an alert to Telegram",
+                                          session=session_id, type=alert_type)
+            for alert_type in ('violence', 'pose', 'anomaly')
+        }
+        metrics.gauge('surveillance_alert_queue_depth', "Alerts waiting on the alert loop",
+                      callback=lambda: self.alerts_scheduled.value - self.alerts_completed.value, session=session_id)
+        metrics.gauge('surveillance_fps', "Smoothed processing frame rate",
+                      callback=lambda: snapshots.get(session_id).fps, session=session_id)
+        metrics.gauge('surveillance_stream_lag_seconds', "Estimated lag of processed frames behind the live stream",
+                      callback=lambda: self.watchdog.lag if self.watchdog is not None else 0.0, session=session_id)
+        metrics.gauge('surveillance_stream_reconnects', "Stream reconnects since the session started",
+                      callback=lambda: self.watchdog.reconnects if self.watchdog is not None else 0, session=session_id)
+        
+        # Detection counters and times (written only by the session's worker)
+        self.detections = {
+            'violence': 0,
+            'poseAnomalies': 0,
+            'otherAnomalies': 0
+        }
+        self.detection_times = []
+        self.pose_detection_times = []
+        self.anomaly_detection_times = []
+        
+        # Detection state per family and label, debounced over frames
+        self.debounce = Debouncer(DEBOUNCE_ENTER_FRAMES, DEBOUNCE_WINDOW_FRAMES, DEBOUNCE_HOLD_SECONDS)
+        # Tracked people ('pose') and objects ('anomaly'), created by the worker
+        self.trackers = {}
+        
+        # State variables for alerting
+        self.last_alert_time = 0
+        self.frames_sent_count = 0
+        self.pose_frames_sent_count = 0
+        self.anomaly_frames_sent_count = 0
+    
+    @property
+    def active(self):
+        return self.status in ("starting", "running", "stopping")
+    
+    def observe(self, stage, milliseconds):
+        self.stage_metrics[stage].observe(milliseconds / 1000)
+        if self.stage_observer is not None:
+            self.stage_observer(stage, milliseconds)
+    
+    def to_dict(self):
+        return {
+            'sessionId': self.session_id,
+            'status': self.status,
+            'running': self.running,
+            'sourceType': self.request.sourceType,
+            'vocabulary': self.vocabulary.name,
+            'subscribers': list(self.subscribers),
+            'worker': self.supervisor.to_dict() if self.supervisor is not None else None,
+            'stream': self.watchdog.to_dict() if self.watchdog is not None else None,
+            'tracks': {family: tracker.to_dict(time.monotonic()) for family, tracker in list(self.trackers.items())},
+            'createdAt': self.created_at,
+        }
+
+def resolve_vocabulary(request):
+    """The anomaly vocabulary a request asks for: custom classes, a named preset or the default"""
+    if request.anomalyClasses:
+        names = request.anomalyClasses + (request.objectClasses or [])
+        if len(set(names)) != len(names) or not all(name.strip() for name in names):
+            raise HTTPException(status_code=400, detail="Class names must be unique and non-empty")
+        return Vocabulary("custom", tuple(request.anomalyClasses), tuple(request.objectClasses or ()))
+    if request.vocabulary is None:
+        return DEFAULT_VOCABULARY
+    if request.vocabulary not in VOCABULARIES:
+        raise HTTPException(status_code=400, detail=f"Unknown vocabulary: {request.vocabulary}")
+    return VOCABULARIES[request.vocabulary]
+
+def active_sessions():
+    """Return the sessions that are starting, running or stopping"""
+    return [session for session in list(sessions.values()) if session.active]
+
+def remote_sessions():
+    """Live sessions owned by other API workers, as published to a shared state backend"""
+    return remote_view[0]
+
+def remote_snapshots():
+    """Snapshots of sessions this worker does not own; those of vanished owners are reported as not running"""
+    if not state.shared:
+        return {}
+    sessions_view, snapshots_view = remote_view
+    live = {info['sessionId'] for info in sessions_view}
+    local = snapshots.all()
+    remote = {}
+    for session_id, fields in snapshots_view.items():
+        if session_id in local:
+            continue
+        snapshot = SessionSnapshot(**fields)
+        remote[session_id] = snapshot if not snapshot.running or session_id in live else replace(snapshot, running=False)
+    return remote
+
+def find_snapshot(session_id=None):
+    """A session's snapshot (or the latest one) from this worker or the worker that owns the session"""
+    snapshot = snapshots.get(session_id)
+    if snapshot.session_id or not state.shared:
+        return snapshot
+    remote = remote_snapshots()
+    if session_id is not None:
+        return remote.get(session_id, snapshot)
+    return max(remote.values(), key=lambda other: other.updated_at, default=snapshot)
+
+def all_snapshots():
+    """Latest snapshot of every session known to this worker or the shared state backend"""
+    return {**remote_snapshots(), **snapshots.all()}
+
+def sync_state(published_snapshots, published_jobs):
+    """Publish this worker's sessions, snapshots and jobs to the state backend and apply commands sent to it"""
+    global remote_view
+    active = active_sessions()
+    for session in active:
+        # Re-publishing the session every round doubles as the owner's heartbeat
+        state.publish_session(session.session_id, WORKER_ID, session.to_dict())
+        snapshot = snapshots.get(session.session_id)
+        if snapshot.session_id and published_snapshots.get(session.session_id) is not snapshot:
+            state.publish_snapshot(session.session_id, asdict(snapshot))
+            published_snapshots[session.session_id] = snapshot
+    for session_id in set(published_snapshots) - {session.session_id for session in active}:
+        del published_snapshots[session_id]
+
+    current = {}
+    for job in jobs.list() + analysis_jobs.list():
+        job = job.to_dict()
+        current[job['jobId']] = (job['status'], job['progress'], job['message'])
+        if published_jobs.get(job['jobId']) != current[job['jobId']]:
+            state.publish_job(job)
+    published_jobs.clear()
+    published_jobs.update(current)
+
+    remote_view = ([info for info in state.sessions(max_age=STATE_STALE_SECONDS) if info['owner'] != WORKER_ID],
+                   state.snapshots())
+    renew_telegram_lease()
+
+    for session_id, command, payload in state.take_commands(WORKER_ID):
+        try:
+            apply_command(session_id, command, payload)
+        except Exception as e:
+            logger.error(f"Error applying {command} command to session {session_id}: {e}")
+
+def apply_command(session_id, command, payload):
+    """Run a control command forwarded by another API worker for a session this worker owns"""
+    session = sessions.get(session_id)
+    if session is None or not session.active:
+        logger.warning(f"Ignoring {command} command for inactive session {session_id}")
+        return
+    logger.info(f"Applying forwarded {command} command to session {session_id}")
+    if command == "stop":
+        with process_lock:
+            session.status = "stopping"
+            session.stop_event.set()
+        jobs.submit("stop", run_stop_job, [session], session_id=session_id)
+    elif command == "subscribers":
+        if not apply_subscribers(session, payload.get('add', ()), payload.get('remove', ())):
+            logger.warning(f"Worker of session {session_id} is gone, subscribers not changed")
+    elif command == "vocabulary":
+        vocabulary = resolve_vocabulary(VocabularyRequest(**payload))
+        if anomaly_model is not None:
+            embedding_cache.get(anomaly_model, vocabulary.names)
+        if not set_session_vocabulary(session, vocabulary):
+            logger.warning(f"Worker of session {session_id} is gone, vocabulary not switched")
+    else:
+        logger.warning(f"Unknown command {command} for session {session_id}")
+
+def run_state_sync():
+    """Background thread: keep the shared state backend up to date with this worker"""
+    published_snapshots = {}
+    published_jobs = {}
+    while True:
+        try:
+            sync_state(published_snapshots, published_jobs)
+        except Exception as e:
+            logger.error(f"Error syncing state backend: {e}")
+        time.sleep(STATE_SYNC_INTERVAL)
 
 def initialize_models():
     """Initialize all ML models if they haven't been loaded yet"""
-    global violence_model, pose_model, anomaly_model
+    with models_lock:
+        load_models()
+
+def load_models():
+    """Load any model that is still missing onto the selected device"""
+    global violence_model, pose_model, anomaly_model, anomaly_vocabulary
     
     if violence_model is None:
-        print("Loading violence detection model...")
-        violence_model = YOLO("Violence/best.pt").to(device)
+        logger.info("Loading violence detection model...")
+        violence_model = load_violence_model(get_device())
     
     if pose_model is None:
-        print("Loading pose estimation model...")
-        pose_model = YOLO("Pose/yolov8n-pose.pt").to(device)
+        logger.info("Loading pose estimation model...")
+        pose_model = load_pose_model(get_device())
     
     if anomaly_model is None:
-        print("Loading anomaly detection model...")
-        anomaly_model = YOLOE("yoloe-11m-seg.pt").to(device)
-        anomaly_model.set_classes(NAMES_ANOMALY_OBJECT, anomaly_model.get_text_pe(NAMES_ANOMALY_OBJECT))
+        logger.info("Loading anomaly detection model...")
+        anomaly_model = load_anomaly_model(get_device())
+        anomaly_vocabulary = DEFAULT_VOCABULARY
+    # Loading a model may be the first import of ultralytics, which reconfigures its logger
+    route_ultralytics_logging()
+
+def warm_up():
+    """Import the heavy libraries a session needs (and load the models when PRELOAD_MODELS is set) off the request path"""
+    started = time.perf_counter()
+    modules = ['torch', 'ultralytics', 'supervision']
+    if TOKEN:
+        modules.append('telegram.ext')
+    if GOOGLE_API_KEY:
+        modules += ['agno.agent', 'agno.models.google']
+    imports = {}
+    for name in modules:
+        module_started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.error(f"Error importing {name} during warm-up: {e}")
+        imports[name] = round(time.perf_counter() - module_started, 3)
+    route_ultralytics_logging()
+    get_device()
+    if PRELOAD_MODELS:
+        initialize_models()
+    log_event(logger, logging.INFO, "warm_up", "Warm-up finished", seconds=round(time.perf_counter() - started, 3),
+              imports=imports, models=PRELOAD_MODELS)
 
 def initialize_agent():
     """Initialize the Agno agent if it hasn't been loaded yet"""
-    global agent, user_id
+    global agent
     
     if agent is None and GOOGLE_API_KEY:
-        print("Initializing Agno agent...")
-        agent = Agent(
-            name="Surveillance Agent",
-            role="You are an Surveillance Assistant named REVA who provides information about the current state of the surveillance system",
-            model=Gemini(id="gemini-2.5-flash-lite", api_key=GOOGLE_API_KEY),
-            tools=[SurveillanceState(), NotionTools(NOTION_TOKEN, DATABASE_ID)],
-            instructions=["You will be given a question on the surviellance system",
-                        "You should be using the SurveillanceState Toolkit to answer the question",
-                        "Provide a neat and concise answer",
-                        "You should also be friendly and more engaging, offering a very good assistance to the user",
-                        "Addtionally if the user tells to save the analytics or create a report on it , then you should use the NotionTools to save the analytics(got from the SurveillanceState Toolkit) or create a report on it",
-                        "Use NotionTools for all CRUD operations: create_page to add new pages, get_pages to list pages, update_page to modify page properties, delete_page to archive pages, get_blocks to fetch page blocks, append_block to add blocks, update_block to modify block content, and delete_block to archive blocks.",
-                        "The DB ID and API key for Notion are already provided to you",
-                        f"User name is {user_id if user_id else 'Guest'}",
-                        ],
-            user_id=user_id if user_id else "Guest",
-            storage=SqliteStorage(table_name="surveillance_agent_history", db_file="surveillance_agent.db"),
-            monitoring=True,
-            add_history_to_messages=True,
-            num_history_responses=5,
-            read_chat_history=True,
-            add_session_summary_references=True,
-            add_datetime_to_instructions=True, 
-        )
-
-def initialize_telegram_bot(custom_token=None, custom_chat_id=None):
-    """Initialize the Telegram bot and all related functionality"""
-    global bot, alert_loop, alert_thread, telegram_thread, bot_initialized, TOKEN, CHAT_ID
+        logger.info("Initializing Agno agent...")
+        agent = create_agent()
+
+def create_agent():
+    """Build a new Agno agent instance sharing the same chat history storage"""
+    from agno.agent import Agent
+    from agno.models.google import Gemini
+    from agno.storage.sqlite import SqliteStorage
+    from notion_tools import NotionTools
+
+    return Agent(
+        name="Surveillance Agent",
+        role="You are an Surveillance Assistant named REVA who provides information about the current state of the surveillance system",
+        model=Gemini(id="gemini-2.5-flash-lite", api_key=GOOGLE_API_KEY),
+        tools=[surveillance_state_toolkit(), NotionTools(NOTION_TOKEN, DATABASE_ID)],
+        instructions=["You will be given a question on the surviellance system",
+                    "You should be using the SurveillanceState Toolkit to answer the question",
+                    "Provide a neat and concise answer",
+                    "You should also be friendly and more engaging, offering a very good assistance to the user",
+                    "Addtionally if the user tells to save the analytics or create a report on it , then you should use the NotionTools to save the analytics(got from the SurveillanceState Toolkit) or create a report on it",
+                    "Use NotionTools for all CRUD operations: create_page to add new pages, get_pages to list pages, update_page to modify page properties, delete_page to archive pages, get_blocks to fetch page blocks, append_block to add blocks, update_block to modify block content, and delete_block to archive blocks.",
+                    "The DB ID and API key for Notion are already provided to you",
+                    f"User name is {user_id if user_id else 'Guest'}",
+                    ],
+        user_id=user_id if user_id else "Guest",
+        storage=SqliteStorage(table_name="surveillance_agent_history", db_file="surveillance_agent.db"),
+        monitoring=True,
+        add_history_to_messages=True,
+        num_history_responses=5,
+        read_chat_history=True,
+        add_session_summary_references=True,
+        add_datetime_to_instructions=True, 
+    )
+
+def initialize_telegram_bot(custom_token=None, custom_chat_id=None, polling=True):
+    """
+    Initialize the Telegram bot and all related functionality. The alert
+    loop, the bot and its connection pool are kept for the life of the
+    process and reused by later sessions with the same token. Worker
+    processes never create a bot: their alerts are sent by this process's
+    dispatcher, see run_isolated_session.
+    """
+    global bot, alert_dispatcher, alert_loop, alert_thread, bot_initialized, TOKEN, CHAT_ID
     
     with bot_lock:
-        # If the bot is already initialized, don't initialize it again
-        if bot_initialized:
-            print("Telegram bot already initialized, skipping initialization")
-            return
-        
         # Use custom credentials if provided, otherwise fall back to environment variables
         if custom_token and custom_chat_id:
             effective_token = custom_token
             effective_chat_id = custom_chat_id
-            print(f"Using custom Telegram credentials provided by user: token={effective_token[:5]}..., chat_id={effective_chat_id}")
+            logger.info(f"Using custom Telegram credentials provided by user: token={effective_token[:5]}..., chat_id={effective_chat_id}")
         else:
             effective_token = TOKEN
             effective_chat_id = CHAT_ID
-            print("Using default Telegram credentials from environment variables")
+            logger.info("Using default Telegram credentials from environment variables")
         
         # Validate token and chat_id are not empty
         if not effective_token or not effective_chat_id:
-            print("Warning: Telegram token or chat ID is empty, alerts will be disabled")
-            bot = None
-            bot_initialized = False
+            logger.warning("Telegram token or chat ID is empty, alerts will be disabled")
+            return
+        
+        # The same bot is reused as is, connection pool included
+        if bot_initialized and effective_token == TOKEN:
+            logger.info("Telegram bot already initialized, reusing it")
+            CHAT_ID = effective_chat_id
             return
-            
-        # Store the effective values for use in alert functions
-        TOKEN = effective_token
-        CHAT_ID = effective_chat_id
         
         try:
-            print("Initializing Telegram bot...")
-            bot = Bot(token=effective_token)
+            logger.info("Initializing Telegram bot...")
+            candidate = create_bot(effective_token, pool_size=TELEGRAM_POOL_SIZE)
             
             # Test the connection to validate token
             async def test_bot():
                 try:
-                    me = await bot.get_me()
-                    print(f"Bot initialized successfully: {me.first_name} (@{me.username})")
+                    me = await candidate.get_me()
+                    logger.info(f"Bot initialized successfully: {me.first_name} (@{me.username})")
+                    
+                    if not polling:
+                        return True
                     
                     # Test sending a message to validate chat ID
                     try:
-                        await bot.send_message(chat_id=effective_chat_id, text="Surveillance system connected. Ready to send alerts.")
-                        print(f"Successfully sent test message to chat ID: {effective_chat_id}")
+                        await candidate.send_message(chat_id=effective_chat_id, text="Surveillance system connected. Ready to send alerts.")
+                        logger.info(f"Successfully sent test message to chat ID: {effective_chat_id}")
                     except Exception as e:
-                        print(f"Error sending test message to chat: {str(e)}")
+                        logger.error(f"Error sending test message to chat: {str(e)}")
                         return False
                     return True
                 except Exception as e:
-                    print(f"Error validating bot token: {str(e)}")
+                    logger.error(f"Error validating bot token: {str(e)}")
                     return False
             
-            # Create alert event loop
-            alert_loop = asyncio.new_event_loop()
-            
-            # Run alert loop in a separate thread
-            alert_thread = threading.Thread(target=run_alert_loop, daemon=True)
-            alert_thread.start()
+            # One alert event loop, in its own thread, serves every session
+            if alert_loop is None or alert_loop.is_closed():
+                alert_loop = asyncio.new_event_loop()
+                alert_thread = threading.Thread(target=run_alert_loop, daemon=True)
+                alert_thread.start()
             
             # Test the bot connection
             test_result = asyncio.run_coroutine_threadsafe(test_bot(), alert_loop).result(timeout=10)
             if not test_result:
-                print("Bot validation failed, alerts will be disabled")
-                bot = None
-                bot_initialized = False
+                logger.error("Bot validation failed, alerts will be disabled")
                 return
             
+            # Release the pool of a bot replaced by one with another token
+            if bot is not None:
+                asyncio.run_coroutine_threadsafe(bot.shutdown(), alert_loop)
+            bot = candidate
+            alert_dispatcher = AlertDispatcher(bot, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                                               group_per_minute=TELEGRAM_GROUP_PER_MINUTE)
+            TOKEN = effective_token
+            CHAT_ID = effective_chat_id
+            
+            # Polling keeps the token it started with, so it restarts with the new bot
+            if polling and telegram_thread is not None and telegram_thread.is_alive():
+                stop_telegram_polling()
+            
+            # Telegram rejects concurrent getUpdates, so only the API worker holding the lease polls
+            if polling and not state.acquire_lease(telegram_lease(effective_token), WORKER_ID, STATE_STALE_SECONDS):
+                logger.info("Another API worker polls this bot, sending alerts only")
+                polling = False
+            
             # Start the Telegram bot in a separate thread
-            telegram_thread = threading.Thread(target=run_telegram_bot, daemon=True)
-            telegram_thread.start()
+            if polling and (telegram_thread is None or not telegram_thread.is_alive()):
+                start_telegram_polling()
             
             bot_initialized = True
-            print("Telegram bot initialized successfully")
+            logger.info("Telegram bot initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing Telegram bot: {e}")
+
+def telegram_lease(token):
+    """Name of the state backend lease held by the one API worker that polls a bot token"""
+    return f"telegram-polling:{hashlib.sha256(token.encode()).hexdigest()[:16]}"
+
+def start_telegram_polling():
+    """Answer chat messages from a new polling thread"""
+    global telegram_thread
+    telegram_thread = threading.Thread(target=run_telegram_bot, daemon=True)
+    telegram_thread.start()
+
+def renew_telegram_lease():
+    """Keep polling while this worker holds the bot's lease, and take over from a worker that is gone"""
+    with bot_lock:
+        if not bot_initialized or not TOKEN:
+            return
+        polling = telegram_thread is not None and telegram_thread.is_alive()
+        if state.acquire_lease(telegram_lease(TOKEN), WORKER_ID, STATE_STALE_SECONDS):
+            if not polling:
+                logger.info("Took over Telegram polling")
+                start_telegram_polling()
+        elif polling:
+            logger.warning("Lost the Telegram polling lease, sending alerts only")
+            stop_telegram_polling()
+
+def stop_telegram_polling(timeout=10):
+    """Stop the polling thread and wait for it to exit"""
+    if telegram_app is not None and telegram_loop is not None and telegram_loop.is_running():
+        telegram_loop.call_soon_threadsafe(telegram_app.stop_running)
+    telegram_thread.join(timeout)
+    if telegram_thread.is_alive():
+        logger.warning("Telegram polling did not stop, chat messages still go to the previous bot")
+
+def run_retention_sweeps():
+    """Apply the storage quotas on start and then periodically"""
+    while True:
+        for kind, enforce in (("snapshot", frame_store.enforce_retention), ("clip", clip_retention.enforce),
+                              ("alert spool", lambda: expire_spool(ALERT_SPOOL_DIR, RETENTION_SWEEP_INTERVAL))):
+            try:
+                enforce()
+            except Exception as e:
+                logger.error(f"Error applying {kind} retention: {e}")
+        time.sleep(RETENTION_SWEEP_INTERVAL)
+
+def run_upload_sweeps():
+    """Delete abandoned uploads now and then"""
+    while True:
+        try:
+            expired = upload_store.expire(UPLOAD_EXPIRY_HOURS * 3600)
+            if expired:
+                logger.info(f"Deleted {expired} abandoned uploads")
         except Exception as e:
-            print(f"Error initializing Telegram bot: {e}")
-            bot = None
-            bot_initialized = False
+            logger.error(f"Error deleting abandoned uploads: {e}")
+        time.sleep(UPLOAD_SWEEP_INTERVAL)
 
 def run_alert_loop():
     """Run the alert event loop for sending Telegram notifications"""
@@ -331,14 +911,76 @@ def run_alert_loop():
     try:
         alert_loop.run_forever()
     except Exception as e:
-        print(f"Error in alert loop: {str(e)}")
+        logger.error(f"Error in alert loop: {str(e)}")
     finally:
         alert_loop.close()
 
+def answer_state_query(message):
+    """Answer simple counter questions directly from the surveillance state, or return None"""
+    if not message or STATE_QUERY_EXCLUDE.search(message):
+        return None
+    if not STATE_QUERY_TRIGGER.match(message) and not (STATE_QUERY_COUNT.search(message) and STATE_QUERY_NOUN.search(message)):
+        return None
+    
+    snapshot = find_snapshot()
+    state = snapshot.detections
+    
+    topics = [key for key, pattern in STATE_QUERY_TOPICS.items() if pattern.search(message)]
+    if not topics:
+        topics = list(STATE_QUERY_LABELS)
+    lines = [f"{STATE_QUERY_LABELS[key]}: {state[key]}" for key in topics]
+    if len(topics) == len(STATE_QUERY_LABELS):
+        lines.insert(0, f"Surveillance is {'running' if snapshot.running else 'stopped'}.")
+    return "\n".join(lines)
+
+def normalize_query(message):
+    """Normalize a chat message for use as a response cache key"""
+    return " ".join(message.lower().split())
+
+def get_cached_response(message):
+    """Return a cached agent reply for an identical recent question, if any"""
+    key = normalize_query(message)
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, reply = entry
+    if time.time() > expires_at:
+        del response_cache[key]
+        return None
+    return reply
+
+def cache_response(message, reply):
+    """Cache an agent reply for a short time"""
+    key = normalize_query(message)
+    response_cache[key] = (time.time() + response_cache_ttl, reply)
+    response_cache.move_to_end(key)
+    while len(response_cache) > response_cache_size:
+        response_cache.popitem(last=False)
+
+def run_agent_query(message):
+    """Run a blocking agent call on a pool thread, using one agent instance per thread"""
+    if agent is None:
+        return "The assistant is not available right now."
+    
+    thread_agent = getattr(agent_local, 'agent', None)
+    if thread_agent is None:
+        with agent_lock:
+            thread_agent = create_agent()
+        agent_local.agent = thread_agent
+    
+    response = thread_agent.run(message)
+    if hasattr(response, 'content'):
+        return response.content
+    elif isinstance(response, str):
+        return response
+    return "Error processing response from agent."
+
 def run_telegram_bot():
     """Run the Telegram bot for interactive commands"""
-    global TOKEN
+    global TOKEN, telegram_app, telegram_loop
     
+    from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
+
     try:
         # Set up a new event loop for this thread
         loop = asyncio.new_event_loop()
@@ -346,78 +988,104 @@ def run_telegram_bot():
 
         # Build the application using ApplicationBuilder
         app = ApplicationBuilder().token(TOKEN).build()
+        telegram_app, telegram_loop = app, loop
         
         # Set up the shutdown future to cleanly stop the bot
         shutdown_future = loop.create_future()
 
+        # Per-chat queues of pending agent questions
+        chat_queues = {}
+
         async def status(update, context):
-            with process_lock:
-                state = {
-                    'violence_count': detections['violence'],
-                    'pose_anomaly_count': detections['poseAnomalies'],
-                    'anomaly_count': detections['otherAnomalies']
-                }
+            state = find_snapshot()
             message = f"Current Surveillance State:\n"
-            message += f"Violence detections: {state['violence_count']}\n"
-            message += f"Pose anomalies: {state['pose_anomaly_count']}\n"
-            message += f"Other anomalies: {state['anomaly_count']}\n"
+            message += f"Violence detections: {state.violence}\n"
+            message += f"Pose anomalies: {state.pose_anomalies}\n"
+            message += f"Other anomalies: {state.other_anomalies}\n"
+            message += f"Processing FPS: {state.fps:.1f}\n"
             await update.message.reply_text(message)
 
         async def chat(update, context):
-            global last_chat_time
+            user_message = update.message.text
+            chat_id = update.effective_chat.id
+
+            # Fast path: plain state questions never reach the LLM
+            reply = answer_state_query(user_message)
+            if reply is None:
+                reply = get_cached_response(user_message)
+            if reply is not None:
+                await update.message.reply_text(reply)
+                return
+
             current_time = time.time()
-            if current_time - last_chat_time < chat_cooldown:
+            if current_time - last_chat_time.get(chat_id, 0) < chat_cooldown:
                 await update.message.reply_text("Please wait a moment before sending another message (rate limit).")
                 return
-            
-            user_message = update.message.text
+
+            queue = chat_queues.get(chat_id)
+            if queue is None:
+                queue = asyncio.Queue(maxsize=AGENT_MAX_PENDING_PER_CHAT)
+                chat_queues[chat_id] = queue
+                loop.create_task(chat_consumer(queue))
             try:
-                with agent_lock:
-                    response = agent.run(user_message)
-                    if hasattr(response, 'content'):
-                        reply = response.content
-                    elif isinstance(response, str):
-                        reply = response
-                    else:
-                        reply = "Error processing response from agent."
-                await update.message.reply_text(reply)
-                last_chat_time = current_time
-            except Exception as e:
-                await update.message.reply_text(f"Error: {str(e)}. Please try again later.")
-                print(f"Error in chat handler: {str(e)}")
+                queue.put_nowait(update)
+                last_chat_time[chat_id] = current_time
+            except asyncio.QueueFull:
+                await update.message.reply_text("I'm still working on your previous questions, please try again shortly.")
+
+        async def chat_consumer(queue):
+            # Drain one chat's questions in order, running the agent off the event loop
+            while True:
+                update = await queue.get()
+                user_message = update.message.text
+                try:
+                    reply = get_cached_response(user_message)
+                    if reply is None:
+                        reply = await loop.run_in_executor(agent_executor, run_agent_query, user_message)
+                        cache_response(user_message, reply)
+                    await update.message.reply_text(reply)
+                except Exception as e:
+                    await update.message.reply_text(f"Error: {str(e)}. Please try again later.")
+                    logger.error(f"Error in chat handler: {str(e)}")
+                finally:
+                    queue.task_done()
 
         # Add handlers
         app.add_handler(CommandHandler("status", status))
         app.add_handler(MessageHandler(filters.Text() & ~filters.Command(), chat))
 
         # Start the bot
-        print("Starting Telegram bot polling...")
+        logger.info("Starting Telegram bot polling...")
         loop.run_until_complete(app.run_polling(stop_signals=None, close_loop=False))
     except Exception as e:
-        print(f"Error in Telegram bot: {str(e)}")
+        logger.error(f"Error in Telegram bot: {str(e)}")
     finally:
         if loop and loop.is_running():
             loop.close()
-        print("Telegram bot polling stopped")
+        logger.info("Telegram bot polling stopped")
 
-def create_analytics_chart(detection_type):
+def create_analytics_chart(detection_type, session):
     """Create a matplotlib chart of detections over time for different types"""
     try:
-        if detection_type == 'violence' and detection_times:
-            times = [datetime.fromtimestamp(t) for t in detection_times]
-            counts = np.arange(1, len(detection_times) + 1)
+        if detection_type == 'violence' and session.detection_times:
+            times = [datetime.fromtimestamp(t) for t in session.detection_times]
+            counts = np.arange(1, len(session.detection_times) + 1)
             title = 'Violence Detection Over Time'
-        elif detection_type == 'pose' and pose_detection_times:
-            times = [datetime.fromtimestamp(t) for t in pose_detection_times]
-            counts = np.arange(1, len(pose_detection_times) + 1)
+        elif detection_type == 'pose' and session.pose_detection_times:
+            times = [datetime.fromtimestamp(t) for t in session.pose_detection_times]
+            counts = np.arange(1, len(session.pose_detection_times) + 1)
             title = 'Pose Anomaly Detection Over Time'
-        elif detection_type == 'anomaly' and anomaly_detection_times:
-            times = [datetime.fromtimestamp(t) for t in anomaly_detection_times]
-            counts = np.arange(1, len(anomaly_detection_times) + 1)
+        elif detection_type == 'anomaly' and session.anomaly_detection_times:
+            times = [datetime.fromtimestamp(t) for t in session.anomaly_detection_times]
+            counts = np.arange(1, len(session.anomaly_detection_times) + 1)
             title = 'Other Anomaly Detection Over Time'
         else:
             return None
 
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
         # Create a new figure for thread safety
         fig = plt.figure(figsize=(10, 6))
         plt.plot(times, counts, marker='o', linestyle='--', color='red')
@@ -435,387 +1103,890 @@ def create_analytics_chart(detection_type):
         plt.close(fig)
         return buf
     except Exception as e:
-        print(f"Error creating analytics chart: {str(e)}")
+        logger.error(f"Error creating analytics chart: {str(e)}")
     return None
 
-async def send_violence_alert(timestamp, violence_detection_count, frame):
+def schedule_alert(session, coro):
+    """Hand an alert coroutine to the alert loop, counting it until it completes"""
+    session.alerts_scheduled.inc()
+    future = asyncio.run_coroutine_threadsafe(coro, alert_loop)
+    future.add_done_callback(lambda _: session.alerts_completed.inc())
+
+def observe_alert_latency(session, alert_type, started):
+    """Record how long sending one alert took"""
+    session.alert_latency[alert_type].observe(time.perf_counter() - started)
+
+def record_event(session, kind, frame, **details):
+    """
+    Store a detection event, its snapshot and its clip. `frame` must be a
+    copy the worker no longer touches. Returns (event, snapshot future,
+    clip future or None).
+    """
+    event = events.add(session.session_id, kind, **details)
+    event_id = event['eventId']
+    snapshot = frame_store.save(kind, frame, session.session_id)
+    snapshot.add_done_callback(
+        lambda future: events.update(event_id, snapshot=future.result()[0]['key']) if not future.exception() else None)
+    if session.clip_recorder is None:
+        return event, snapshot, None
+    clip = session.clip_recorder.trigger(event_id)
+    clip.add_done_callback(lambda future: events.update(event_id, clip=future.result()) if not future.exception() else None)
+    if session.publisher is None:
+        clip.add_done_callback(lambda _: clip_retention.enforce())
+    return event, snapshot, clip
+
+async def send_event_clip(session, clip, alert_type):
+    """Wait for an event's clip to be written and send it to the session's subscribers"""
+    if clip is None:
+        return
+    try:
+        path = await asyncio.wait_for(asyncio.wrap_future(clip), timeout=CLIP_POST_SECONDS + 60)
+        if path:
+            with open(path, 'rb') as video:
+                data = video.read()
+            await alert_dispatcher.send_video(session.subscribers, data, supports_streaming=True)
+            logger.info(f"Sent clip for {alert_type} alert")
+    except Exception as e:
+        logger.error(f"Error sending clip: {str(e)}")
+
+async def send_violence_alert(session, timestamp, violence_detection_count, snapshot, clip=None):
     """Send a Telegram alert for violence detection"""
-    global frames_sent_count, last_alert_time
     current_time = time.time()
-    if current_time - last_alert_time < alert_cooldown:
-        print("Alert cooldown active, skipping violence alert")
+    if current_time - session.last_alert_time < alert_cooldown:
+        logger.info("Alert cooldown active, skipping violence alert")
         return
     
+    send_start = time.perf_counter()
     try:
         message = f"⚠️ <b>VIOLENCE DETECTED</b> ⚠️\nTime: {timestamp}\nDetection count: {violence_detection_count}"
-        await bot.send_message(chat_id=CHAT_ID, text=message, parse_mode='HTML')
-        print("Sent text message for violence alert")
+        await alert_dispatcher.send_message(session.subscribers, message, parse_mode='HTML')
+        logger.info("Sent text message for violence alert")
         
-        frame_path = f"violence_frames/violence_{timestamp}.jpg"
-        cv2.imwrite(frame_path, frame)
-        with open(frame_path, 'rb') as photo:
-            await bot.send_photo(chat_id=CHAT_ID, photo=photo)
-        print("Sent photo for violence alert")
+        _, photo = await asyncio.wrap_future(snapshot)
+        await alert_dispatcher.send_photo(session.subscribers, photo)
+        logger.info("Sent photo for violence alert")
         
-        chart_buf = create_analytics_chart('violence')
+        chart_buf = create_analytics_chart('violence', session)
         if chart_buf:
             try:
-                await bot.send_photo(chat_id=CHAT_ID, photo=chart_buf.getvalue())
-                print("Sent chart for violence alert")
+                await alert_dispatcher.send_photo(session.subscribers, chart_buf.getvalue())
+                logger.info("Sent chart for violence alert")
             except Exception as e:
-                print(f"Error sending chart: {str(e)}")
+                logger.error(f"Error sending chart: {str(e)}")
             
-        frames_sent_count += 1
-        last_alert_time = current_time
+        session.frames_sent_count += 1
+        observe_alert_latency(session, 'violence', send_start)
+        session.last_alert_time = current_time
+        
+        await send_event_clip(session, clip, 'violence')
     except Exception as e:
-        print(f"Error sending violence alert: {str(e)}")
+        logger.error(f"Error sending violence alert: {str(e)}")
 
-async def send_pose_alert(action, timestamp, frame):
+async def send_pose_alert(session, action, timestamp, snapshot, clip=None):
     """Send a Telegram alert for pose anomaly detection"""
-    global pose_frames_sent_count, last_alert_time
     current_time = time.time()
-    if current_time - last_alert_time < alert_cooldown:
-        print("Alert cooldown active, skipping pose alert")
+    if current_time - session.last_alert_time < alert_cooldown:
+        logger.info("Alert cooldown active, skipping pose alert")
         return
     
+    send_start = time.perf_counter()
     try:
         message = f"⚠️ <b>POSE ANOMALY DETECTED</b> ⚠️\nAction: {action}\nTime: {timestamp}"
-        await bot.send_message(chat_id=CHAT_ID, text=message, parse_mode='HTML')
-        print("Sent text message for pose alert")
+        await alert_dispatcher.send_message(session.subscribers, message, parse_mode='HTML')
+        logger.info("Sent text message for pose alert")
         
-        frame_path = f"anomaly_frames/anomaly_{timestamp}.jpg"
-        cv2.imwrite(frame_path, frame)
-        with open(frame_path, 'rb') as photo:
-            await bot.send_photo(chat_id=CHAT_ID, photo=photo)
-        print("Sent photo for pose alert")
+        _, photo = await asyncio.wrap_future(snapshot)
+        await alert_dispatcher.send_photo(session.subscribers, photo)
+        logger.info("Sent photo for pose alert")
         
-        chart_buf = create_analytics_chart('pose')
+        chart_buf = create_analytics_chart('pose', session)
         if chart_buf:
             try:
-                await bot.send_photo(chat_id=CHAT_ID, photo=chart_buf.getvalue())
-                print("Sent chart for pose alert")
+                await alert_dispatcher.send_photo(session.subscribers, chart_buf.getvalue())
+                logger.info("Sent chart for pose alert")
             except Exception as e:
-                print(f"Error sending chart: {str(e)}")
+                logger.error(f"Error sending chart: {str(e)}")
+        
+        session.pose_frames_sent_count += 1
+        observe_alert_latency(session, 'pose', send_start)
+        session.last_alert_time = current_time
         
-        pose_frames_sent_count += 1
-        last_alert_time = current_time
+        await send_event_clip(session, clip, 'pose')
     except Exception as e:
-        print(f"Error sending pose anomaly alert: {str(e)}")
+        logger.error(f"Error sending pose anomaly alert: {str(e)}")
 
-async def send_anomaly_alert(timestamp, anomaly_count, frame):
+async def send_anomaly_alert(session, timestamp, anomaly_count, snapshot, clip=None):
     """Send a Telegram alert for general anomaly detection"""
-    global anomaly_frames_sent_count, last_alert_time
     current_time = time.time()
-    if current_time - last_alert_time < alert_cooldown:
-        print("Alert cooldown active, skipping anomaly alert")
+    if current_time - session.last_alert_time < alert_cooldown:
+        logger.info("Alert cooldown active, skipping anomaly alert")
         return
     
+    send_start = time.perf_counter()
     try:
         message = f"⚠️ <b>ANOMALY DETECTED</b> ⚠️\nTime: {timestamp}\nAnomaly count: {anomaly_count}"
-        await bot.send_message(chat_id=CHAT_ID, text=message, parse_mode='HTML')
-        print("Sent text message for anomaly alert")
+        await alert_dispatcher.send_message(session.subscribers, message, parse_mode='HTML')
+        logger.info("Sent text message for anomaly alert")
         
-        frame_path = f"anomaly_frames/anomaly_{timestamp}.jpg"
-        cv2.imwrite(frame_path, frame)
-        with open(frame_path, 'rb') as photo:
-            await bot.send_photo(chat_id=CHAT_ID, photo=photo)
-        print("Sent photo for anomaly alert")
+        _, photo = await asyncio.wrap_future(snapshot)
+        await alert_dispatcher.send_photo(session.subscribers, photo)
+        logger.info("Sent photo for anomaly alert")
         
-        chart_buf = create_analytics_chart('anomaly')
+        chart_buf = create_analytics_chart('anomaly', session)
         if chart_buf:
             try:
-                await bot.send_photo(chat_id=CHAT_ID, photo=chart_buf.getvalue())
-                print("Sent chart for anomaly alert")
+                await alert_dispatcher.send_photo(session.subscribers, chart_buf.getvalue())
+                logger.info("Sent chart for anomaly alert")
             except Exception as e:
-                print(f"Error sending chart: {str(e)}")
+                logger.error(f"Error sending chart: {str(e)}")
         
-        anomaly_frames_sent_count += 1
-        last_alert_time = current_time
+        session.anomaly_frames_sent_count += 1
+        observe_alert_latency(session, 'anomaly', send_start)
+        session.last_alert_time = current_time
+        
+        await send_event_clip(session, clip, 'anomaly')
     except Exception as e:
-        print(f"Error sending anomaly alert: {str(e)}")
-
-def calculate_angle(a, b, c):
-    """Calculate the angle between three points"""
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    if angle > 180:
-        angle = 360 - angle
-    return angle
-
-def determine_action(keypoints):
-    """Determine the action based on pose keypoints"""
-    hip = keypoints[11]
-    knee = keypoints[13]
-    ankle = keypoints[15]
-    shoulder = keypoints[5]
-    hip_angle = calculate_angle(shoulder, hip, knee)
-    knee_angle = calculate_angle(hip, knee, ankle)
-    is_vertical = abs(shoulder[1] - ankle[1]) > abs(shoulder[0] - ankle[0])
-    
-    for action, angles in ACTION_ANGLES.items():
-        if 'vertical' in angles and angles['vertical'] is False and is_vertical:
-            continue
-        if 'vertical' in angles and angles['vertical'] is True and not is_vertical:
-            continue
-        if angles['hip'][0] <= hip_angle <= angles['hip'][1] and angles['knee'][0] <= knee_angle <= angles['knee'][1]:
-            return action
-            
-    return 'unknown'
+        logger.error(f"Error sending anomaly alert: {str(e)}")
 
-def inference_worker(source_path, stop_event):
+def run_models(session, frame):
+    """Run the three detectors on the clean frame, one after another or concurrently"""
+    if session.region is not None:
+        return run_models_on_regions(session, frame)
+    imgsz = session.imgsz
+    vocabulary = session.vocabulary
+    if session.tiler is not None:
+        anomaly_call = lambda: session.tiler.detect(anomaly_model, frame, imgsz, conf=ANOMALY_CONF,
+                                                    motion_mask=session.motion_mask, person_boxes=session.person_boxes)
+    else:
+        anomaly_call = lambda: anomaly_model.predict(frame, imgsz=imgsz, conf=ANOMALY_CONF, verbose=False)
+    calls = (
+        lambda: violence_model(frame, conf=VIOLENCE_CONF, imgsz=imgsz, verbose=False),
+        lambda: pose_model(frame, conf=POSE_CONF, imgsz=imgsz, verbose=False),
+        lambda: with_vocabulary(vocabulary, anomaly_call),
+    )
+    return dispatch_models(session, calls)
+
+def run_models_on_regions(session, frame):
+    """Run the detectors on the ROI crops only, as one batch per model, and map results back to the frame"""
+    imgsz = session.imgsz
+    vocabulary = session.vocabulary
+    region = session.region
+    crops, offsets = region.crops(frame)
+    calls = (
+        lambda: [region.merge(frame, violence_model(crops, conf=VIOLENCE_CONF, imgsz=imgsz, verbose=False), offsets)],
+        lambda: [region.merge(frame, pose_model(crops, conf=POSE_CONF, imgsz=imgsz, verbose=False), offsets)],
+        lambda: [region.merge(frame, with_vocabulary(
+            vocabulary, lambda: anomaly_model.predict(crops, imgsz=imgsz, conf=ANOMALY_CONF, verbose=False)), offsets)],
+    )
+    return dispatch_models(session, calls)
+
+def dispatch_models(session, calls):
+    """Run the violence, pose and anomaly calls one after another or concurrently"""
+    if session.concurrent_models:
+        capture = session.profile_capture
+        if capture is not None:
+            # cProfile only sees the thread that enables it, so executor threads get their own profilers
+            futures = [model_executor.submit(capture.profile_call, timed_call, call, session, stage)
+                       for call, stage in zip(calls, MODEL_STAGES)]
+        else:
+            futures = [model_executor.submit(timed_call, call, session, stage) for call, stage in zip(calls, MODEL_STAGES)]
+        return [future.result() for future in futures]
+    return [timed_call(call, session, stage) for call, stage in zip(calls, MODEL_STAGES)]
+
+def with_vocabulary(vocabulary, call):
+    """Run an anomaly model call with the model's classes set to `vocabulary`"""
+    global anomaly_vocabulary
+    with anomaly_lock:
+        if anomaly_vocabulary != vocabulary:
+            set_vocabulary(anomaly_model, vocabulary)
+            anomaly_vocabulary = vocabulary
+        return call()
+
+def timed_call(call, session, stage):
+    """Run a model call and return (results, latency in ms, error)"""
+    if thread_budget is not None:
+        thread_budget.apply(session.session_id, stage)
+    start = time.perf_counter()
+    try:
+        return call(), (time.perf_counter() - start) * 1000, None
+    except Exception as e:
+        return None, (time.perf_counter() - start) * 1000, e
+
+def inference_worker(session):
     """Main worker function for running inference on video frames"""
-    global inference_running, detections, cap, is_violence_active, is_pose_anomaly_active, is_anomaly_active
+    import supervision as sv
+
+    session_id = session.session_id
+    source_path = session.source
+    detections = session.detections
     
-    print(f"Starting inference on source: {source_path}")
+    logger.info(f"Starting inference on source: {source_path}")
     
     # Open video capture
     if isinstance(source_path, str) and source_path.isdigit():
         source_path = int(source_path)
     
-    cap = cv2.VideoCapture(source_path)
-    if not cap.isOpened():
-        print(f"Error: Could not open video source {source_path}")
-        inference_running = False
+    request = session.request
+    
+    def open_source():
+        return open_capture(source_path, backend=request.captureBackend or CAPTURE_BACKEND, width=request.decodeWidth,
+                            fps=request.decodeFps, hwaccel=request.hwaccel, timeout=STREAM_STALE_SECONDS)
+    
+    def on_open(cap):
+        session.cap = cap
+    
+    # Reconnects happen inside the watchdog, so models, counters and alert state survive them
+    watchdog = StreamWatchdog(open_source, is_live_source(source_path), session.stop_event, on_open=on_open,
+                              stale_seconds=STREAM_STALE_SECONDS, freeze_seconds=STREAM_FREEZE_SECONDS,
+                              freeze_tolerance=STREAM_FREEZE_TOLERANCE,
+                              max_lag=STREAM_MAX_LAG, backoff=STREAM_RECONNECT_BACKOFF, max_reconnects=STREAM_MAX_RECONNECTS)
+    try:
+        opened = watchdog.open()
+    except ValueError as e:
+        logger.error(str(e))
+        finish_session(session, "failed")
+        return
+    if not opened:
+        logger.error(f"Could not open video source {source_path}")
+        finish_session(session, "failed")
         return
+    session.watchdog = watchdog
     
-    # Reset detection counters and times
-    with process_lock:
-        detections['violence'] = 0
-        detections['poseAnomalies'] = 0
-        detections['otherAnomalies'] = 0
-        detection_times.clear()
-        pose_detection_times.clear()
-        anomaly_detection_times.clear()
-    
-    inference_running = True
-    is_violence_active = False
-    is_pose_anomaly_active = False
-    is_anomaly_active = False
+    session.running = True
+    if thread_budget is not None:
+        thread_budget.register(session_id, session.concurrent_models)
+        push_worker_cpus()
+    started_at = time.time()
+    snapshot = snapshots.publish(SessionSnapshot(session_id=session_id, running=True, source=str(source_path),
+                                                 started_at=started_at, updated_at=started_at))
+    motion_gate = MotionGate(threshold=session.motion_threshold) if session.motion_gating else None
+    session.trackers = {
+        family: Tracker(TRACK_HISTORY, TRACK_SMOOTHING, lost_frames=TRACK_LOST_FRAMES, realert_seconds=TRACK_REALERT_SECONDS,
+                        activation_threshold=conf)
+        for family, conf in (('pose', POSE_CONF), ('anomaly', ANOMALY_CONF))
+    }
+    pose_tracker, object_tracker = session.trackers['pose'], session.trackers['anomaly']
+    frames_processed = 0
+    fps = 0.0
+    last_frame_time = time.perf_counter()
+    violence_latency = pose_latency = anomaly_latency = 0.0
     
     try:
-        while inference_running and not stop_event.is_set():
-            # Read a frame
-            ret, frame = cap.read()
+        while not session.stop_event.is_set():
+            # Profiling costs nothing unless a capture was requested
+            if session.profile_capture is not None and not session.profile_capture.tick():
+                session.profile_capture = None
+            
+            # Read a frame; live streams are reconnected by the watchdog
+            frame_start = time.perf_counter()
+            ret, frame, captured_wall = watchdog.read()
             if not ret:
-                print("End of video stream")
+                if watchdog.live and not session.stop_event.is_set():
+                    logger.error(f"Stream {source_path} could not be recovered")
+                    session.status = "failed"
+                else:
+                    logger.info("End of video stream")
                 break
+            captured_at = time.perf_counter()
+            session.observe('decode', (captured_at - frame_start) * 1000)
+            
+            # Skip inference while the scene is static; detection state is kept as is
+            if motion_gate is not None and not motion_gate.should_process(frame):
+                session.frames_skipped += 1
+                session.frames_dropped.inc()
+                if session.clip_recorder is not None:
+                    session.clip_recorder.push(frame)
+                time.sleep(0.01)
+                continue
+            
+            session.motion_mask = motion_gate.mask if motion_gate is not None else None
+            
+            # All models see the unannotated frame
+            (violence_results, violence_latency, violence_error), \
+                (pose_results, pose_latency, pose_error), \
+                (anomaly_results, anomaly_latency, anomaly_error) = run_models(session, frame)
+            session.observe('violence', violence_latency)
+            session.observe('pose', pose_latency)
+            session.observe('anomaly', anomaly_latency)
+            if violence_error is not None:
+                raise violence_error
+            post_start = time.perf_counter()
+            now = time.monotonic()
             
             # Violence detection
-            violence_results = violence_model(frame, conf=0.5, imgsz=320)
             violence_detected = False
             for result in violence_results:
                 for box in result.boxes:
-                    if box.cls[0] == 1:
+                    if box.cls[0] == VIOLENCE_CLASS:
                         violence_detected = True
                         x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
                         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
                         cv2.putText(frame, "Violence", (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             
-            if violence_detected:
-                if not is_violence_active:
-                    with process_lock:
-                        detections['violence'] += 1
-                    detection_times.append(time.time())
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    if detections['violence'] >= violence_detection_threshold and bot and frames_sent_count < send_threshold:
-                        asyncio.run_coroutine_threadsafe(
-                            send_violence_alert(timestamp, detections['violence'], frame),
-                            alert_loop
-                        )
-                    is_violence_active = True
-            else:
-                is_violence_active = False
+            entered, _ = session.debounce.update('violence', ['Violence'] if violence_detected else [], now)
+            if entered:
+                detections['violence'] += 1
+                session.detection_times.append(time.time())
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                _, snapshot_future, clip = record_event(session, 'violence', frame.copy(), count=detections['violence'])
+                if detections['violence'] >= violence_detection_threshold and session.subscribers and session.frames_sent_count < send_threshold:
+                    schedule_alert(session, send_violence_alert(session, timestamp, detections['violence'], snapshot_future, clip))
             
             # Pose estimation
             try:
-                results = pose_model(frame, imgsz=320)
+                if pose_error is not None:
+                    raise pose_error
+                results = pose_results
+                anomalous_tracks = set()
+                if session.tiler is not None:
+                    session.person_boxes = results[0].boxes.xyxy.cpu().numpy() if results and results[0].boxes is not None else None
                 if results and results[0].keypoints is not None:
-                    annotated_frame = results[0].plot()
-                    for i, person in enumerate(results[0].keypoints.data):
-                        keypoints = person.numpy()[:, :2]
-                        action = determine_action(keypoints)
-                        if results[0].boxes is not None and len(results[0].boxes) > i:
-                            box = results[0].boxes[i].xyxy[0].cpu().numpy().astype(int)
-                            text_position = (box[0], box[1] - 10)
-                        else:
-                            text_position = (10, 30 + i*20)
-                        cv2.putText(annotated_frame, action, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                    annotated_frame = results[0].plot(img=frame)
+                    boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
+                    keypoints = results[0].keypoints.data.cpu().numpy()
+                    # Each person is classified on its smoothed keypoints and keeps the action most seen lately
+                    for track, index in pose_tracker.update(sv.Detections.from_ultralytics(results[0]), now):
+                        points = pose_tracker.smooth(track, keypoints[index])
+                        action = track.observe(determine_action(points[:, :2]), now, lambda label: label in ANOMALY_ACTIONS)
+                        cv2.putText(annotated_frame, f"#{track.track_id} {action}", (boxes[index][0], boxes[index][1] - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
                         if action in ANOMALY_ACTIONS:
-                            if not is_pose_anomaly_active:
-                                with process_lock:
-                                    detections['poseAnomalies'] += 1
-                                pose_detection_times.append(time.time())
-                                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                if detections['poseAnomalies'] >= pose_anomaly_threshold and bot and pose_frames_sent_count < pose_send_threshold:
-                                    asyncio.run_coroutine_threadsafe(
-                                        send_pose_alert(action, timestamp, annotated_frame),
-                                        alert_loop
-                                    )
-                                is_pose_anomaly_active = True
-                        else:
-                            is_pose_anomaly_active = False
+                            anomalous_tracks.add((track.track_id, action))
                     frame = annotated_frame
+                
+                # Keyed per person and action, so every person has their own state
+                entered, _ = session.debounce.update('pose', anomalous_tracks, now)
+                for track_id, action in entered:
+                    track = pose_tracker.tracks.get(track_id)
+                    if track is None or not pose_tracker.alert(track, now):
+                        continue
+                    detections['poseAnomalies'] += 1
+                    session.pose_detection_times.append(time.time())
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    _, snapshot_future, clip = record_event(session, 'pose', frame.copy(), action=action, track=track_id,
+                                                            count=detections['poseAnomalies'])
+                    if detections['poseAnomalies'] >= pose_anomaly_threshold and session.subscribers and session.pose_frames_sent_count < pose_send_threshold:
+                        schedule_alert(session, send_pose_alert(session, action, timestamp, snapshot_future, clip))
             except Exception as e:
-                print(f"Pose estimation error: {e}")
+                log_event(logger, logging.WARNING, "inference_error", "Pose estimation error",
+                          session=session_id, stage="pose", error=str(e))
             
             # Anomaly detection (fire, smoke, weapons, etc.)
             try:
-                results = anomaly_model.predict(frame, imgsz=320, conf=0.1, verbose=False)
+                if anomaly_error is not None:
+                    raise anomaly_error
+                results = anomaly_results
                 detections_sv = sv.Detections.from_ultralytics(results[0])
                 frame = sv.BoxAnnotator().annotate(scene=frame, detections=detections_sv)
                 frame = sv.LabelAnnotator().annotate(scene=frame, detections=detections_sv)
                 
+                # Membership comes from the session's vocabulary, by class name
+                anomaly_names = session.vocabulary.anomalies
                 detected_classes = results[0].boxes.cls.cpu().numpy().astype(int).tolist()
-                if any(cls in ANOMALY_INDICES for cls in detected_classes):
-                    if not is_anomaly_active:
-                        with process_lock:
-                            detections['otherAnomalies'] += 1
-                        anomaly_detection_times.append(time.time())
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        if detections['otherAnomalies'] >= anomaly_threshold and bot and anomaly_frames_sent_count < anomaly_send_threshold:
-                            asyncio.run_coroutine_threadsafe(
-                                send_anomaly_alert(timestamp, detections['otherAnomalies'], frame),
-                                alert_loop
-                            )
-                        is_anomaly_active = True
-                else:
-                    is_anomaly_active = False
+                anomalous_tracks = set()
+                for track, index in object_tracker.update(detections_sv, now):
+                    name = track.observe(results[0].names[detected_classes[index]], now, lambda label: label in anomaly_names)
+                    if name in anomaly_names:
+                        anomalous_tracks.add((track.track_id, name))
+                # Keyed per object; another object of a class that is already active is not a new event
+                already_active = {name for _, name in session.debounce.active('anomaly')}
+                entered, _ = session.debounce.update('anomaly', anomalous_tracks, now)
+                new_classes = set()
+                for track_id, name in entered:
+                    track = object_tracker.tracks.get(track_id)
+                    if name not in already_active and track is not None and object_tracker.alert(track, now):
+                        new_classes.add(name)
+                entered = new_classes
+                if entered:
+                    detections['otherAnomalies'] += 1
+                    session.anomaly_detection_times.append(time.time())
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    _, snapshot_future, clip = record_event(
+                        session, 'anomaly', frame.copy(), count=detections['otherAnomalies'], classes=sorted(entered))
+                    if detections['otherAnomalies'] >= anomaly_threshold and session.subscribers and session.anomaly_frames_sent_count < anomaly_send_threshold:
+                        schedule_alert(session, send_anomaly_alert(session, timestamp, detections['otherAnomalies'], snapshot_future, clip))
             except Exception as e:
-                print(f"Anomaly detection error: {e}")
+                log_event(logger, logging.WARNING, "inference_error", "Anomaly detection error",
+                          session=session_id, stage="anomaly", error=str(e))
+            
+            if session.clip_recorder is not None:
+                session.clip_recorder.push(frame)
+            
+            decided_at = time.perf_counter()
+            session.observe('annotate', (decided_at - post_start) * 1000)
+            session.observe('capture_to_detection', (decided_at - captured_at) * 1000)
+            session.observe('end_to_end', (time.time() - captured_wall + watchdog.lag) * 1000)
+            session.observe('frame', (decided_at - frame_start) * 1000)
+            session.frames_counter.inc()
+            tile_cost = session.tiler.last_cost if session.tiler is not None and session.region is None else None
+            if tile_cost:
+                session.anomaly_tiles.observe(tile_cost['images'])
+            log_event(logger, logging.INFO, "frame", "Frame processed", session=session_id,
+                      frameMs=round((decided_at - frame_start) * 1000, 2), violenceMs=round(violence_latency, 2),
+                      poseMs=round(pose_latency, 2), anomalyMs=round(anomaly_latency, 2), anomalyTiles=tile_cost)
+            
+            # Publish a fresh snapshot for readers
+            now = time.perf_counter()
+            frame_interval = now - last_frame_time
+            last_frame_time = now
+            if frame_interval > 0:
+                fps = 1.0 / frame_interval if fps == 0.0 else fps + fps_smoothing * (1.0 / frame_interval - fps)
+            frames_processed += 1
+            snapshot = snapshots.publish(SessionSnapshot(
+                session_id=session_id,
+                running=True,
+                source=snapshot.source,
+                violence=detections['violence'],
+                pose_anomalies=detections['poseAnomalies'],
+                other_anomalies=detections['otherAnomalies'],
+                frames_processed=frames_processed,
+                fps=fps,
+                started_at=started_at,
+                updated_at=time.time(),
+                last_violence_at=session.detection_times[-1] if session.detection_times else None,
+                last_pose_anomaly_at=session.pose_detection_times[-1] if session.pose_detection_times else None,
+                last_anomaly_at=session.anomaly_detection_times[-1] if session.anomaly_detection_times else None,
+                violence_latency_ms=violence_latency,
+                pose_latency_ms=pose_latency,
+                anomaly_latency_ms=anomaly_latency,
+            ))
+            if session.publisher is not None:
+                session.publisher.publish_snapshot(asdict(snapshot))
+                session.publisher.publish_frame(frame)
             
             # Delay to not overload the CPU/GPU
             time.sleep(0.01)
             
     except Exception as e:
-        print(f"Error in inference worker: {e}")
+        logger.exception(f"Error in inference worker: {e}")
+        session.status = "failed"
     finally:
-        # Release resources
-        if cap is not None:
-            cap.release()
+        if session.profile_capture is not None:
+            session.profile_capture.finish()
+            session.profile_capture = None
+        if session.clip_recorder is not None:
+            session.clip_recorder.close()
         
-        inference_running = False
-        print("Inference worker stopped")
+        # Release resources
+        if watchdog.cap is not None:
+            watchdog.cap.release()
+        session.cap = None
+        finish_session(session, "stopped")
+        logger.info("Inference worker stopped")
+
+def set_session_vocabulary(session, vocabulary):
+    """Switch a session's vocabulary, in its worker process too when isolated; returns False if the worker is gone"""
+    if session.supervisor is not None and not session.supervisor.send_command('vocabulary', asdict(vocabulary)):
+        return False
+    session.vocabulary = vocabulary
+    return True
+
+def push_worker_cpus():
+    """Send the worker processes of isolated sessions their cores after the thread budget was rebalanced"""
+    for session in active_sessions():
+        if session.supervisor is not None:
+            cpus = thread_budget.session_cpus(session.session_id)
+            if cpus:
+                session.supervisor.send_command('cpus', cpus)
+
+def apply_worker_command(session, command, payload):
+    """Apply a control command sent by the API process to the session of this worker process"""
+    global thread_budget
+    if command == "vocabulary":
+        vocabulary = Vocabulary(payload['name'], tuple(payload['anomalies']), tuple(payload['objects']))
+        # Encode new class names here so the inference loop never waits on the text encoder
+        if anomaly_model is not None:
+            embedding_cache.get(anomaly_model, vocabulary.names)
+        session.vocabulary = vocabulary
+    elif command == "subscribers":
+        session.subscribers = list(payload)
+    elif command == "cpus":
+        if thread_budget is None:
+            thread_budget = ThreadBudget(0, reserved=0, pin=CPU_PINNING, cpus=payload)
+            thread_budget.register(session.session_id, session.concurrent_models)
+        else:
+            thread_budget.set_cpus(payload)
+    elif command == "profile":
+        if session.profile_capture is not None:
+            logger.warning(f"Ignoring profile request {payload['captureId']}, a capture is already running")
+            return
+        session.profile_capture = ProfileCapture(
+            session.session_id, payload['seconds'], PROFILE_DIR, torch_profiler=payload['torchProfiler'],
+            top_n=payload['topN'], capture_id=payload['captureId'],
+            on_finish=lambda capture: session.publisher.publish_profile(capture.to_dict(paths=True)))
+    else:
+        logger.warning(f"Unknown worker command {command}")
+
+def run_isolated_session(config, publisher, stop_event):
+    """
+    Worker process entry point of an isolated session: runs the same
+    pipeline as the thread mode and reports snapshots, events and frames
+    through the shared-memory rings. Returns the process exit code.
+    """
+    global thread_budget, alert_dispatcher, alert_loop, alert_thread
+    session = Session(config['sessionId'], StartInferenceRequest(**config['request']))
+    session.source = config['source']
+    session.publisher = publisher
+    session.detections.update(config.get('detections') or {})
+    if config.get('vocabulary'):
+        fields = config['vocabulary']
+        session.vocabulary = Vocabulary(fields['name'], tuple(fields['anomalies']), tuple(fields['objects']))
+    if config.get('cpus'):
+        thread_budget = ThreadBudget(0, reserved=0, pin=CPU_PINNING, cpus=config['cpus'])
+    # The API process owns the event log and the snapshot index
+    events.listener = publisher.publish_event
+    frame_store.listener = publisher.publish_frame_entry
+    with process_lock:
+        sessions[session.session_id] = session
+    
+    initialize_models()
+    if config.get('telegram'):
+        # The API process makes the sends, so rate limits and uploaded file_ids are shared by all sessions
+        alert_dispatcher = ForwardingDispatcher(publisher.publish_alert, ALERT_SPOOL_DIR)
+        alert_loop = asyncio.new_event_loop()
+        alert_thread = threading.Thread(target=run_alert_loop, daemon=True)
+        alert_thread.start()
+        session.subscribers = config.get('subscribers') or []
+    
+    def watch_stop():
+        stop_event.wait()
+        session.stop_event.set()
+    threading.Thread(target=watch_stop, daemon=True).start()
+    
+    def watch_commands():
+        while not session.stop_event.wait(WORKER_COMMAND_INTERVAL):
+            for command, payload in publisher.take_commands():
+                try:
+                    apply_worker_command(session, command, payload)
+                except Exception as e:
+                    logger.error(f"Error applying {command} command in worker: {e}")
+    threading.Thread(target=watch_commands, name="worker-commands", daemon=True).start()
+    
+    session.status = "running"
+    inference_worker(session)
+    return 1 if session.status == "failed" else 0
+
+def start_isolated_session(session, telegram):
+    """Start an isolated session's worker process and mirror its state in this process"""
+    if thread_budget is not None:
+        thread_budget.register(session.session_id, session.concurrent_models)
+        push_worker_cpus()
+    
+    def config(detections=None):
+        return {
+            'sessionId': session.session_id,
+            'request': session.request.dict(exclude={'videoData'}),
+            'source': session.source,
+            'telegram': telegram,
+            'subscribers': list(session.subscribers),
+            'detections': detections,
+            # Switches sent to an earlier worker are not replayed to a restarted one
+            'vocabulary': asdict(session.vocabulary),
+            # The worker divides this session's share of the budget between its own stages
+            'cpus': thread_budget.session_cpus(session.session_id) if thread_budget is not None else None,
+        }
+    
+    def apply(record):
+        if record['type'] == 'snapshot':
+            snapshot = snapshots.publish(SessionSnapshot(**record['snapshot']))
+            session.running = snapshot.running
+        elif record['type'] == 'event':
+            events.ingest(record['event'])
+            if record['event'].get('clip'):
+                clip_retention.enforce()
+        elif record['type'] == 'frame':
+            frame_store.ingest(record['entry'])
+        elif record['type'] == 'alert':
+            forward_alert(session, record['call'])
+        elif record['type'] == 'profile':
+            fields = record['capture']
+            capture = profile_captures.get(fields['captureId'])
+            if capture is not None:
+                capture.mirror(fields)
+            if session.profile_capture is not None and session.profile_capture.capture_id == fields['captureId']:
+                session.profile_capture = None
+    
+    session.supervisor = StreamProcess(
+        session.session_id, run_isolated_session, config(), apply,
+        on_exit=lambda status: finish_session(session, status),
+        # Restarted workers continue counting from the last known totals
+        config_for_restart=lambda: config(snapshots.get(session.session_id).detections),
+        frame_bytes=WORKER_FRAME_BYTES, max_restarts=WORKER_MAX_RESTARTS,
+    )
+    session.supervisor.start()
+
+def forward_alert(session, call):
+    """Send an alert call forwarded by an isolated session's worker, in the order the worker made them"""
+    async def deliver():
+        if session.forwarded_alerts is None:
+            session.forwarded_alerts = asyncio.Lock()
+        async with session.forwarded_alerts:
+            try:
+                await deliver_forwarded(alert_dispatcher, call)
+            except Exception as e:
+                logger.error(f"Error sending forwarded alert of session {session.session_id}: {e}")
+    
+    if alert_dispatcher is None or alert_loop is None:
+        logger.warning(f"Dropping alert of session {session.session_id}, Telegram is not initialized")
+        if call.get('media'):
+            try:
+                os.remove(call['media'])
+            except OSError:
+                pass
+        return
+    asyncio.run_coroutine_threadsafe(deliver(), alert_loop)
+
+def finish_session(session, status):
+    """Mark a session as finished and drop it from the active registry, once"""
+    with process_lock:
+        # The stop job and an isolated session's supervisor may both get here
+        if session.finished:
+            return
+        session.finished = True
+    session.running = False
+    if session.status != "failed":
+        session.status = status
+    
+    # Remove decoded legacy uploads, chunked uploads are kept for reuse
+    for path in session.temp_files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    session.temp_files = []
+    if session.supervisor is not None and session.profile_capture is not None:
+        # The worker exited without reporting the capture
+        session.profile_capture.finish()
+        session.profile_capture = None
+    snapshot = snapshots.update(session.session_id, running=False)
+    if thread_budget is not None:
+        thread_budget.unregister(session.session_id)
+        push_worker_cpus()
+    if session.publisher is None:
+        # The final snapshot stays visible to other API workers; ownership ends here
+        state.publish_snapshot(session.session_id, asdict(snapshot))
+        state.remove_session(session.session_id)
+    metrics.remove(session=session.session_id)
+    with process_lock:
+        sessions.pop(session.session_id, None)
+
+# Model sizes are computed once per loaded model
+model_memory_cache = {}
+
+def model_memory_bytes(model):
+    """Bytes held by a model's parameters and buffers"""
+    module = getattr(model, 'model', None)
+    if module is None:
+        return 0
+    cached = model_memory_cache.get(id(module))
+    if cached is None:
+        cached = sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+        model_memory_cache[id(module)] = cached
+    return cached
+
+metrics.gauge('surveillance_model_memory_bytes', "Memory held by model weights", callback=lambda: model_memory_bytes(violence_model), model='violence')
+metrics.gauge('surveillance_model_memory_bytes', "Memory held by model weights", callback=lambda: model_memory_bytes(pose_model), model='pose')
+metrics.gauge('surveillance_model_memory_bytes', "Memory held by model weights", callback=lambda: model_memory_bytes(anomaly_model), model='anomaly')
+metrics.gauge('surveillance_cuda_memory_allocated_bytes', "CUDA memory allocated by torch",
+              callback=cuda_memory_allocated)
+metrics.gauge('surveillance_queue_depth', "Pending work items", callback=lambda: agent_executor.pending_count(), queue='agent')
+metrics.gauge('surveillance_queue_depth', "Pending work items", callback=lambda: jobs.pending_count(), queue='lifecycle_jobs')
+metrics.gauge('surveillance_queue_depth', "Pending work items", callback=lambda: analysis_jobs.pending_count(), queue='analysis_jobs')
+metrics.gauge('surveillance_active_sessions', "Sessions starting, running or stopping", callback=lambda: len(active_sessions()))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/status", response_model=StatusResponse)
-async def get_status():
+async def get_status(sessionId: Optional[str] = None):
     """Get the current status of inference processing"""
+    if sessionId is not None:
+        snapshot = find_snapshot(sessionId)
+        return {
+            'running': snapshot.running,
+            'detections': snapshot.detections,
+            'session': snapshot.to_dict() if snapshot.session_id else None,
+            'sessions': [snapshot.to_dict()] if snapshot.running else [],
+        }
+    running = [snapshot for snapshot in all_snapshots().values() if snapshot.running]
+    if len(running) > 1:
+        # No single session to pick; report the totals and list every session
+        detections = {}
+        for snapshot in running:
+            for key, count in snapshot.detections.items():
+                detections[key] = detections.get(key, 0) + count
+        return {'running': True, 'detections': detections, 'session': None,
+                'sessions': [snapshot.to_dict() for snapshot in running]}
+    # Idle: no counters of a session that ended long ago
+    snapshot = running[0] if running else EMPTY_SNAPSHOT
+    return {
+        'running': bool(running),
+        'detections': snapshot.detections,
+        'session': snapshot.to_dict() if snapshot.session_id else None,
+        'sessions': [snapshot.to_dict() for snapshot in running],
+    }
+
+@app.get("/api/sessions")
+async def list_sessions():
+    """List active sessions of every API worker and the latest snapshot of every known session"""
     return {
-        'running': inference_running,
-        'detections': detections
+        'active': [{**session.to_dict(), 'owner': WORKER_ID} for session in active_sessions()] + remote_sessions(),
+        'snapshots': [snapshot.to_dict() for snapshot in all_snapshots().values()],
+        'threadBudget': thread_budget.to_dict() if thread_budget is not None else None,
     }
 
-@app.post("/api/start", response_model=ApiResponse)
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the progress of a background start/stop or analysis job"""
+    job = jobs.get(job_id) or analysis_jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # Jobs submitted to another API worker
+    job = state.get_job(job_id) if state.shared else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/start", response_model=ApiResponse, status_code=202)
 async def start_inference(request: StartInferenceRequest):
-    """Start the inference process"""
-    global processing_thread, inference_running, stop_event, cap, process_lock, user_id
+    """Queue a new inference session; the heavy setup runs as a background job"""
+    # Cheap validation stays synchronous so bad requests fail fast
+    validate_video_source(request)
     
+    # The slot is taken in the state backend, so MAX_SESSIONS holds across every API worker sharing it
+    session_id = uuid.uuid4().hex
+    reserved = await asyncio.to_thread(state.reserve_session, session_id, WORKER_ID,
+                                       {'sessionId': session_id, 'status': "starting"}, MAX_SESSIONS,
+                                       STATE_STALE_SECONDS if state.shared else None)
+    if not reserved:
+        raise HTTPException(status_code=400, detail="Inference is already running")
+    session = Session(session_id, request)
     with process_lock:
-        # If inference is already running, stop it first
-        if inference_running:
-            raise HTTPException(status_code=400, detail="Inference is already running")
-        
-        # Set the user_id from the request
-        user_id = request.username
-        
-        # Initialize telegram settings from request
-        telegram_enabled = request.telegramEnabled
-        telegram_token = request.telegramToken
-        telegram_chat_id = request.telegramChatId
-        
-        # If Supabase is configured and email is provided, try to get user settings
-        if supabase and request.email:
-            try:
-                # Query user settings from Supabase
-                response = supabase.table('user_settings').select('*').eq('user_email', request.email).execute()
-                
-                if response.data and len(response.data) > 0:
-                    user_data = response.data[0]
-                    print(f"Found user settings in database for email: {request.email}")
-                    
-                    # Update user_id from database if available and not provided in request
-                    if not user_id and user_data.get('user_name'):
-                        user_id = user_data.get('user_name')
-                        print(f"Using username from database: {user_id}")
-                    
-                    # Use Telegram settings from database
-                    if user_data.get('telegram_enabled') is not None:
-                        telegram_enabled = user_data.get('telegram_enabled')
-                    
-                    # Only use token and chat_id from database if they're not empty
-                    if user_data.get('telegram_token'):
-                        telegram_token = user_data.get('telegram_token')
-                        print("Using Telegram token from database")
-                    
-                    if user_data.get('telegram_chat_id'):
-                        telegram_chat_id = user_data.get('telegram_chat_id')
-                        print("Using Telegram chat ID from database")
-            except Exception as e:
-                print(f"Error loading user settings from Supabase: {e}")
-        
-        # Log the Telegram settings being used
-        print(f"Telegram enabled: {telegram_enabled}")
-        print(f"Telegram token available: {'Yes' if telegram_token else 'No'}")
-        print(f"Telegram chat ID available: {'Yes' if telegram_chat_id else 'No'}")
-        
-        # Reset the stop event
-        stop_event.clear()
+        sessions[session.session_id] = session
+    
+    job = jobs.submit("start", run_start_job, session, session_id=session.session_id)
+    return {"status": "accepted", "message": "Inference starting", "sessionId": session.session_id, "jobId": job.job_id}
+
+def run_start_job(job, session):
+    """Background job: load settings, models, agent and Telegram, then start the worker thread"""
+    request = session.request
+    try:
+        job.update(0.05, "Loading user settings")
+        telegram_enabled, telegram_token, telegram_chat_id = load_user_settings(request)
         
-        # Ensure resources from previous run are cleaned up
-        if processing_thread and processing_thread.is_alive():
-            stop_event.set()
-            processing_thread.join(timeout=5)
-            stop_event.clear()
+        # Initialize models and agent
+        job.update(0.2, "Loading models")
+        initialize_models()
+        job.update(0.5, "Initializing agent")
+        initialize_agent()
         
-        if cap is not None:
-            cap.release()
-            cap = None
+        # Initialize Telegram bot for alerts if enabled and credentials are available
+        job.update(0.6, "Connecting Telegram")
+        if telegram_enabled and telegram_token and telegram_chat_id:
+            initialize_telegram_bot(telegram_token, telegram_chat_id)
+            if bot_initialized:
+                session.subscribers = list(dict.fromkeys(
+                    [str(telegram_chat_id), *(request.telegramChatIds or []), *TELEGRAM_ALERT_CHAT_IDS]))
+        else:
+            logger.warning("Telegram alerts disabled or incomplete credentials")
         
-        # Clean up Telegram bot from previous sessions
-        cleanup_telegram_bot()
+        job.update(0.8, "Preparing video source")
+        session.source = get_video_source(request, session)
+        if session.stop_event.is_set():
+            raise RuntimeError("Session was stopped before it started")
         
+        # Start the inference in a separate thread, or a worker process when isolated
+        logger.info(f"Starting inference on source: {session.source}")
+        session.status = "running"
+        if session.isolated:
+            telegram = (telegram_token, telegram_chat_id) if bot_initialized else None
+            start_isolated_session(session, telegram)
+            return {"message": "Inference started in a worker process"}
+        session.thread = threading.Thread(target=inference_worker, args=(session,), daemon=True)
+        session.thread.start()
+        return {"message": "Inference started"}
+    except Exception as e:
+        finish_session(session, "failed")
+        if isinstance(e, HTTPException):
+            raise RuntimeError(e.detail)
+        raise RuntimeError(f"Error starting inference: {str(e)}")
+
+def load_user_settings(request):
+    """Resolve the user name and Telegram settings, preferring values stored in Supabase"""
+    global user_id
+    
+    # Set the user_id from the request
+    user_id = request.username
+    
+    # Initialize telegram settings from request
+    telegram_enabled = request.telegramEnabled
+    telegram_token = request.telegramToken
+    telegram_chat_id = request.telegramChatId
+    
+    # If Supabase is configured and email is provided, try to get user settings
+    supabase = get_supabase() if request.email else None
+    if supabase:
         try:
-            # Initialize models and agent
-            initialize_models()
-            initialize_agent()
-            
-            # Initialize Telegram bot for alerts if enabled and credentials are available
-            if telegram_enabled and telegram_token and telegram_chat_id:
-                initialize_telegram_bot(telegram_token, telegram_chat_id)
-            else:
-                print("Telegram alerts disabled or incomplete credentials")
-            
-            # Start the inference in a separate thread
-            source = get_video_source(request)
-            print(f"Starting inference on source: {source}")
+            # Query user settings from Supabase
+            response = supabase.table('user_settings').select('*').eq('user_email', request.email).execute()
             
-            # Reset detections
-            detections['violence'] = 0
-            detections['poseAnomalies'] = 0
-            detections['otherAnomalies'] = 0
-            
-            # Create a new thread for inference
-            processing_thread = threading.Thread(target=inference_worker, args=(source, stop_event))
-            processing_thread.daemon = True
-            processing_thread.start()
-            
-            # Update state
-            inference_running = True
-            
-            return {"status": "success", "message": "Inference started"}
+            if response.data and len(response.data) > 0:
+                user_data = response.data[0]
+                logger.info(f"Found user settings in database for email: {request.email}")
+                
+                # Update user_id from database if available and not provided in request
+                if not user_id and user_data.get('user_name'):
+                    user_id = user_data.get('user_name')
+                    logger.info(f"Using username from database: {user_id}")
+                
+                # Use Telegram settings from database
+                if user_data.get('telegram_enabled') is not None:
+                    telegram_enabled = user_data.get('telegram_enabled')
+                
+                # Only use token and chat_id from database if they're not empty
+                if user_data.get('telegram_token'):
+                    telegram_token = user_data.get('telegram_token')
+                    logger.info("Using Telegram token from database")
+                
+                if user_data.get('telegram_chat_id'):
+                    telegram_chat_id = user_data.get('telegram_chat_id')
+                    logger.info("Using Telegram chat ID from database")
         except Exception as e:
-            # Clean up in case of error
-            if cap is not None:
-                cap.release()
-                cap = None
-            
-            cleanup_telegram_bot()
-            inference_running = False
-            raise HTTPException(status_code=500, detail=f"Error starting inference: {str(e)}")
+            logger.error(f"Error loading user settings from Supabase: {e}")
+    
+    # Log the Telegram settings being used
+    logger.info(f"Telegram enabled: {telegram_enabled}")
+    logger.info(f"Telegram token available: {'Yes' if telegram_token else 'No'}")
+    logger.info(f"Telegram chat ID available: {'Yes' if telegram_chat_id else 'No'}")
+    return telegram_enabled, telegram_token, telegram_chat_id
+
+def validate_video_source(request):
+    """Check that the request names a usable video source without touching it"""
+    source_type = request.sourceType
+    
+    if source_type == 'rtsp' and not request.rtspUrl:
+        raise HTTPException(status_code=400, detail="RTSP URL is required for rtsp source type")
+    elif source_type == 'file' and not (request.videoData or request.uploadId):
+        raise HTTPException(status_code=400, detail="Video data or upload id is required for file source type")
+    elif source_type == 'file' and request.uploadId:
+        upload = upload_store.get(request.uploadId)
+        if upload is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if not upload.complete:
+            raise HTTPException(status_code=400, detail="Upload is not complete")
+    elif source_type not in ('rtsp', 'file', 'camera'):
+        raise HTTPException(status_code=400, detail="Invalid source type")
+    
+    if (request.captureBackend or CAPTURE_BACKEND) not in ('opencv', 'ffmpeg'):
+        raise HTTPException(status_code=400, detail="Invalid capture backend")
+    
+    for polygon in (request.rois or []) + (request.exclusions or []):
+        if len(polygon) < 3 or any(len(point) != 2 for point in polygon):
+            raise HTTPException(status_code=400, detail="ROI and exclusion polygons need at least three [x, y] points")
 
-def get_video_source(request):
+def get_video_source(request, session=None):
     """Determine the video source from the request"""
     source_type = request.sourceType
     
@@ -826,14 +1997,26 @@ def get_video_source(request):
         return request.rtspUrl
     
     elif source_type == 'file':
-        # Save base64 video to a temporary file
+        # Chunked uploads are already on disk
+        if request.uploadId:
+            try:
+                return upload_store.path(request.uploadId)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Upload not found")
+            except UploadError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        # Save base64 video to a unique temporary file
         video_data = request.videoData
         if not video_data:
-            raise HTTPException(status_code=400, detail="Video data is required for file source type")
+            raise HTTPException(status_code=400, detail="Video data or upload id is required for file source type")
         
         video_bytes = base64.b64decode(video_data.split(',')[1] if ',' in video_data else video_data)
-        with open(temp_video, 'wb') as f:
+        fd, temp_video = tempfile.mkstemp(suffix='.mp4', dir=temp_dir)
+        with os.fdopen(fd, 'wb') as f:
             f.write(video_bytes)
+        if session is not None:
+            session.temp_files.append(temp_video)
         return temp_video
     
     elif source_type == 'camera':
@@ -843,56 +2026,355 @@ def get_video_source(request):
     else:
         raise HTTPException(status_code=400, detail="Invalid source type")
 
-@app.post("/api/stop", response_model=ApiResponse)
-async def stop_inference():
-    """Stop the inference process"""
-    global inference_running, cap, stop_event
+@app.post("/api/uploads")
+async def create_upload(request: CreateUploadRequest):
+    """Start a resumable video upload and return its id"""
+    try:
+        upload = upload_store.create(request.filename, request.size, request.sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return upload.to_dict()
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Get upload progress; 'received' is the offset to resume from"""
+    upload = upload_store.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload.to_dict()
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = 0):
+    """Stream a raw chunk (application/octet-stream body) to disk at the given offset"""
+    try:
+        upload = await upload_store.write_chunk(upload_id, offset, request.stream(),
+                                                request.headers.get("X-Chunk-SHA256"))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return upload.to_dict()
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """Verify the uploaded file against its size and SHA-256 and make it usable"""
+    loop = asyncio.get_running_loop()
+    try:
+        upload = await loop.run_in_executor(None, upload_store.complete, upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return upload.to_dict()
+
+@app.delete("/api/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """Delete an upload and its data"""
+    if upload_store.get(upload_id) is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload_in_use(upload_id):
+        raise HTTPException(status_code=409, detail="The upload is used by a running session or analysis")
+    try:
+        upload_store.delete(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "message": "Upload deleted"}
+
+def upload_in_use(upload_id):
+    """Whether an active session or an unfinished analysis job reads an upload"""
+    if any(session.request.uploadId == upload_id for session in active_sessions()):
+        return True
+    return any(job.kind == "analyze" and not job.done and job.result.get('uploadId') == upload_id
+               for job in analysis_jobs.list())
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject admin requests without the configured ADMIN_TOKEN"""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.post("/api/admin/profile", status_code=202, dependencies=[Depends(require_admin)])
+async def start_profile(request: ProfileRequest):
+    """Start a time-boxed cProfile/torch profiler capture on a running session"""
+    if not 0 < request.seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS}")
     
     with process_lock:
-        if not inference_running:
-            raise HTTPException(status_code=400, detail="Inference is not running")
-        
-        # Signal the worker thread to stop
-        stop_event.set()
-        
-        # Wait for the thread to finish
-        if processing_thread and processing_thread.is_alive():
-            processing_thread.join(timeout=5)
+        if request.sessionId is not None:
+            session = sessions.get(request.sessionId)
+        else:
+            running = [session for session in sessions.values() if session.running]
+            session = running[0] if len(running) == 1 else None
+        if session is None or not session.running:
+            raise HTTPException(status_code=404, detail="No matching running session")
+        if session.profile_capture is not None:
+            raise HTTPException(status_code=409, detail="A capture is already running for this session")
         
-        # Force release the video capture if still open
-        if cap is not None:
-            cap.release()
-            cap = None
+        capture = ProfileCapture(session.session_id, request.seconds, PROFILE_DIR,
+                                 torch_profiler=request.torchProfiler, top_n=request.topN)
+        # An isolated session runs the capture in its worker process; this copy mirrors it
+        if session.supervisor is not None and not session.supervisor.send_command('profile', {
+                'captureId': capture.capture_id, 'seconds': request.seconds,
+                'torchProfiler': request.torchProfiler, 'topN': request.topN}):
+            raise HTTPException(status_code=409, detail="The session's worker process is not running")
+        profile_captures[capture.capture_id] = capture
+        while len(profile_captures) > profile_history_size:
+            profile_captures.popitem(last=False)
+        session.profile_capture = capture
+    
+    return capture.to_dict()
+
+@app.get("/api/admin/profile/{capture_id}", dependencies=[Depends(require_admin)])
+async def get_profile(capture_id: str):
+    """Get the status and top-N summary of a profiling capture"""
+    capture = profile_captures.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return capture.to_dict()
+
+@app.get("/api/admin/profile/{capture_id}/artifact", dependencies=[Depends(require_admin)])
+async def get_profile_artifact(capture_id: str, kind: str = "pstats"):
+    """Download a capture artifact: pstats (cProfile) or trace (Chrome trace from the torch profiler)"""
+    capture = profile_captures.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    if capture.status != "done":
+        raise HTTPException(status_code=409, detail=f"Capture is {capture.status}")
+    path = capture.artifacts.get(kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No {kind} artifact for this capture")
+    return FileResponse(path, filename=os.path.basename(path))
+
+@app.get("/api/sessions/{session_id}/frame")
+async def get_live_frame(session_id: str):
+    """Latest annotated frame of an isolated session, read from its shared-memory ring"""
+    session = sessions.get(session_id)
+    if session is None or session.supervisor is None:
+        raise HTTPException(status_code=404, detail="No isolated session with this id")
+    latest = session.supervisor.latest_frame()
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No frame yet")
+    frame, captured_at = latest
+    ok, data = cv2.imencode('.jpg', frame)
+    if not ok:
+        raise HTTPException(status_code=500, detail="Could not encode frame")
+    return Response(content=data.tobytes(), media_type="image/jpeg", headers={"X-Captured-At": str(captured_at)})
+
+@app.get("/api/vocabularies")
+async def list_vocabularies():
+    """Named anomaly class sets a session can use"""
+    return {"vocabularies": [{"name": vocabulary.name, "anomalies": list(vocabulary.anomalies), "objects": list(vocabulary.objects)}
+                             for vocabulary in VOCABULARIES.values()]}
+
+@app.post("/api/sessions/{session_id}/vocabulary")
+async def switch_vocabulary(session_id: str, request: VocabularyRequest):
+    """Switch a running session to another vocabulary without reloading the anomaly model"""
+    vocabulary = resolve_vocabulary(request)
+    session = sessions.get(session_id)
+    if session is None or not session.active:
+        owner = state.send_command(session_id, "vocabulary", request.dict()) if state.shared else None
+        if owner is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return JSONResponse(status_code=202, content={"message": f"Vocabulary switch forwarded to worker {owner}",
+                                                      "sessionId": session_id, "vocabulary": vocabulary.name})
+    
+    # Encode new class names now so the worker never waits on the text encoder
+    if anomaly_model is not None:
+        await asyncio.to_thread(embedding_cache.get, anomaly_model, vocabulary.names)
+    if not set_session_vocabulary(session, vocabulary):
+        raise HTTPException(status_code=409, detail="The session's worker process is not running")
+    return {"message": "Vocabulary switched", "sessionId": session_id, "vocabulary": vocabulary.name}
+
+@app.get("/api/sessions/{session_id}/subscribers")
+async def list_subscribers(session_id: str):
+    """Telegram chats that receive a session's alerts"""
+    session = sessions.get(session_id)
+    if session is None or not session.active:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"sessionId": session_id, "subscribers": list(session.subscribers)}
+
+@app.post("/api/sessions/{session_id}/subscribers")
+async def add_subscribers(session_id: str, request: SubscribersRequest):
+    """Route a session's alerts to more Telegram chats"""
+    return update_subscribers(session_id, add=request.chatIds)
+
+@app.delete("/api/sessions/{session_id}/subscribers/{chat_id}")
+async def remove_subscriber(session_id: str, chat_id: str):
+    """Stop sending a session's alerts to a Telegram chat"""
+    return update_subscribers(session_id, remove=[chat_id])
+
+def update_subscribers(session_id, add=(), remove=()):
+    session = sessions.get(session_id)
+    if session is None or not session.active:
+        owner = state.send_command(session_id, "subscribers", {'add': list(add), 'remove': list(remove)}) if state.shared else None
+        if owner is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return JSONResponse(status_code=202, content={"message": f"Subscriber change forwarded to worker {owner}", "sessionId": session_id})
+    if add and not bot_initialized:
+        raise HTTPException(status_code=400, detail="Telegram is not configured for this session")
+    if not apply_subscribers(session, add, remove):
+        raise HTTPException(status_code=409, detail="The session's worker process is not running")
+    return {"sessionId": session_id, "subscribers": list(session.subscribers)}
+
+def apply_subscribers(session, add=(), remove=()):
+    """Change a session's subscribers, in its worker process too when isolated; returns False if the worker is gone"""
+    removed = {str(chat_id) for chat_id in remove}
+    subscribers = [chat_id for chat_id in dict.fromkeys([*session.subscribers, *map(str, add)]) if chat_id not in removed]
+    if session.supervisor is not None and not session.supervisor.send_command('subscribers', subscribers):
+        return False
+    # The list is replaced, never mutated, so a fan-out iterating over it is never disturbed
+    session.subscribers = subscribers
+    return True
+
+@app.get("/api/events")
+async def list_events(sessionId: Optional[str] = None, kind: Optional[str] = None, limit: int = 100):
+    """List recent detection events, newest first"""
+    return {"events": events.list(session_id=sessionId, kind=kind, limit=limit)}
+
+@app.get("/api/events/{event_id}/clip")
+async def get_event_clip(event_id: str):
+    """Download the pre/post-event clip of an event"""
+    event = events.get(event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    path = event.get('clip')
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No clip for this event")
+    return FileResponse(path, media_type="video/mp4", filename=os.path.basename(path))
+
+@app.get("/api/snapshots")
+async def list_snapshots(kind: Optional[str] = None, sessionId: Optional[str] = None, limit: int = 100):
+    """Thumbnail index of stored alert snapshots, newest first"""
+    return {
+        "snapshots": [{key: value for key, value in entry.items() if key not in ('path', 'thumbnail')}
+                      for entry in frame_store.list(kind=kind, session_id=sessionId, limit=limit)],
+        "bytes": frame_store.size,
+    }
+
+@app.get("/api/snapshots/{key}")
+async def get_snapshot(key: str, thumbnail: bool = False):
+    """Download a stored snapshot or its thumbnail"""
+    entry = frame_store.get(key)
+    path = entry and (entry['thumbnail'] if thumbnail else entry['path'])
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return FileResponse(path, media_type="image/jpeg")
+
+@app.post("/api/analyze", response_model=ApiResponse, status_code=202)
+async def start_analysis(request: AnalyzeRequest):
+    """Queue an offline analysis of an uploaded recording"""
+    if request.format not in ("json", "parquet"):
+        raise HTTPException(status_code=400, detail="Format must be json or parquet")
+    if request.batchSize < 1 or request.frameStride < 1 or request.workers < 1:
+        raise HTTPException(status_code=400, detail="batchSize, frameStride and workers must be positive")
+    try:
+        path = upload_store.path(request.uploadId)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    vocabulary = resolve_vocabulary(request)
+    job = analysis_jobs.submit("analyze", run_analysis_job, path, request, vocabulary)
+    # Lets DELETE /api/uploads refuse to remove the file while it is read
+    job.update(uploadId=request.uploadId)
+    return {"status": "accepted", "message": "Analysis queued", "jobId": job.job_id}
+
+def run_analysis_job(job, path, request, vocabulary):
+    """Background job: analyze a video file without sleeps or alerts and write its detection timeline"""
+    # Same thresholds as the live pipeline, so timelines and alerts agree
+    confidences = {'violence': VIOLENCE_CONF, 'pose': POSE_CONF, 'anomaly': ANOMALY_CONF}
+    def report(processed, total, rate, eta):
+        job.update(min(0.99, processed / total) if total else None,
+                   f"Processed {processed}/{total} frames",
+                   processedFrames=processed, totalFrames=total, framesPerSecond=round(rate, 2),
+                   etaSeconds=round(eta, 1) if eta is not None else None)
+    
+    if request.workers > 1:
+        # Each worker process loads its own models and decodes its own segment
+        job.update(0.0, "Starting segment workers")
+        result = analyze_video_parallel(path, request.workers, get_device(), confidences, vocabulary,
+                                        batch_size=request.batchSize, frame_stride=request.frameStride,
+                                        imgsz=request.imgsz, progress=report)
+    else:
+        # Private model instances so the analysis never contends with live sessions
+        job.update(0.0, "Loading models")
+        device = get_device()
+        violence, pose, anomaly = load_violence_model(device), load_pose_model(device), load_anomaly_model(device, vocabulary)
+        result = analyze_video(path, violence, pose, anomaly, confidences, vocabulary, batch_size=request.batchSize,
+                               frame_stride=request.frameStride, imgsz=request.imgsz, progress=report)
+    timeline_path = os.path.join(ANALYSIS_DIR, f"{job.job_id}.{request.format}")
+    write_timeline(result, timeline_path, request.format)
+    return {
+        "message": "Analysis complete",
+        "timeline": timeline_path,
+        "events": len(result['events']),
+        "processedFrames": result['processedFrames'],
+        "framesPerSecond": result['framesPerSecond'],
+        "etaSeconds": 0,
+    }
+
+@app.get("/api/analyze/{job_id}/timeline")
+async def get_analysis_timeline(job_id: str):
+    """Download the timeline written by a finished analysis job"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Analysis is {job.status}")
+    timeline_path = job.result['timeline']
+    return FileResponse(timeline_path, filename=os.path.basename(timeline_path))
+
+@app.post("/api/stop", response_model=ApiResponse, status_code=202)
+async def stop_inference(request: Optional[StopInferenceRequest] = None):
+    """Signal sessions to stop; joining the worker threads happens in a background job"""
+    session_id = request.sessionId if request else None
+    
+    with process_lock:
+        if session_id is not None:
+            session = sessions.get(session_id)
+            targets = [session] if session is not None and session.active else []
+        else:
+            targets = [session for session in sessions.values() if session.active]
         
-        # Reset state
-        inference_running = False
+        # Signal the worker threads to stop
+        for session in targets:
+            session.status = "stopping"
+            session.stop_event.set()
+    
+    # Sessions owned by other API workers are stopped by their owner
+    local = {session.session_id for session in targets}
+    forwarded = [info['sessionId'] for info in remote_sessions()
+                 if info['sessionId'] not in local and (session_id is None or info['sessionId'] == session_id)]
+    forwarded = [remote_id for remote_id in forwarded if state.send_command(remote_id, "stop") is not None]
+    if not targets and not forwarded:
+        raise HTTPException(status_code=400, detail="Inference is not running")
+    if not targets:
+        return {"status": "accepted", "message": f"Stop forwarded to the owning worker of {len(forwarded)} session(s)", "sessionId": session_id}
+    
+    job = jobs.submit("stop", run_stop_job, targets, session_id=session_id)
+    return {"status": "accepted", "message": "Inference stopping", "sessionId": session_id, "jobId": job.job_id}
+
+def run_stop_job(job, targets):
+    """Background job: wait for worker threads to exit and release their resources"""
+    stopped = []
+    for index, session in enumerate(targets):
+        job.update(index / len(targets), f"Stopping session {session.session_id}")
         
-        # Reset detections
-        detections['violence'] = 0
-        detections['poseAnomalies'] = 0
-        detections['otherAnomalies'] = 0
+        # Wait for the thread or worker process to finish
+        if session.thread and session.thread.is_alive():
+            session.thread.join(timeout=5)
+        if session.supervisor is not None:
+            session.supervisor.stop(timeout=10)
         
-        # Clean up Telegram bot resources
-        cleanup_telegram_bot()
+        # Force release the video capture if still open
+        if session.cap is not None:
+            session.cap.release()
+            session.cap = None
         
-        return {"status": "success", "message": "Inference stopped"}
-
-def cleanup_telegram_bot():
-    """Clean up Telegram bot resources when stopping inference"""
-    global bot, alert_loop, alert_thread, telegram_thread, bot_initialized
+        finish_session(session, "stopped")
+        stopped.append(session.session_id)
     
-    with bot_lock:
-        if bot_initialized:
-            print("Cleaning up Telegram bot resources...")
-            
-            # Stop the alert loop if it's running
-            if alert_loop and alert_loop.is_running():
-                alert_loop.call_soon_threadsafe(alert_loop.stop)
-            
-            # Set the flag to indicate bot is no longer initialized
-            bot_initialized = False
-            
-            print("Telegram bot resources cleaned up")
+    return {"message": "Inference stopped", "stopped": stopped}
 
 # Create a sample detections.json file with initial values
 def create_initial_detections_file():
@@ -907,6 +2389,21 @@ def create_initial_detections_file():
 @app.on_event("startup")
 async def startup_event():
     create_initial_detections_file()
+    # Only the API process applies the snapshot quotas and rewrites the event log; worker processes forward to it
+    threading.Thread(target=events.compact, name="event-compaction", daemon=True).start()
+    threading.Thread(target=run_retention_sweeps, name="retention-sweeps", daemon=True).start()
+    threading.Thread(target=run_upload_sweeps, name="upload-sweeps", daemon=True).start()
+    if WARM_UP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if state.shared:
+        logger.info(f"Publishing state as worker {WORKER_ID} to {STATE_DB}")
+        threading.Thread(target=run_state_sync, name="state-sync", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Close the alert bot's connection pool
+    if bot is not None and alert_loop is not None and alert_loop.is_running():
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(bot.shutdown(), alert_loop))
 
 # Run the app with uvicorn
 if __name__ == '__main__':
@@ -0,0 +1,287 @@
+"""
+End-to-end benchmark of the surveillance pipeline.
+
+Replays the bundled sample videos through api.inference_worker under several
+configurations and records FPS, per-stage latency percentiles, peak RSS and
+detection counts. Every run happens in its own subprocess so peak RSS is
+attributable to a single configuration.
+
+    python benchmark.py --stub                       # no model weights needed
+    python benchmark.py --save-baseline bench_baseline.json
+    python benchmark.py --baseline bench_baseline.json   # exit 1 on regression
+
+With --sessions N every run replays the video on N concurrent sessions and
+reports aggregate FPS. --thread-budget 0 8 repeats each run unmanaged (torch
+and OpenCV defaults) and with an 8-core CPU_THREAD_BUDGET, to compare the two:
+
+    python benchmark.py --configs concurrent --sessions 4 --thread-budget 0 8
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_VIDEOS = ["Violence/violence.mp4", "Violence/Boxing.mp4"]
+
+# Session options (StartInferenceRequest fields) per configuration
+CONFIGS = {
+    'sequential': {},
+    'concurrent': {'concurrentModels': True},
+    'imgsz-256': {'imgsz': 256},
+    'imgsz-480': {'imgsz': 480},
+    'ffmpeg': {'captureBackend': 'ffmpeg'},
+    'ffmpeg-640w': {'captureBackend': 'ffmpeg', 'decodeWidth': 640},
+    'motion-gating': {'motionGating': True},
+}
+
+STAGES = ('decode', 'violence', 'pose', 'anomaly', 'frame')
+
+
+class StubModel:
+    """
+    Stand-in for an ultralytics model: sleeps for a fixed latency and returns
+    real Results objects, with a synthetic detection on `detect_run` consecutive
+    calls out of every `detect_every`. A run shorter than the debounce window
+    never turns into an event, so the run has to cover DEBOUNCE_ENTER_FRAMES
+    frames of every session sharing the model.
+    """
+
+    def __init__(self, kind, names, latency_ms=5.0, detect_every=50, detect_run=3):
+        self.kind = kind
+        self.names = names
+        self.latency_ms = latency_ms
+        self.detect_every = max(detect_every, 2 * detect_run)
+        self.detect_run = detect_run
+        self.calls = 0
+
+    def __call__(self, source, **kwargs):
+        return self.predict(source, **kwargs)
+
+    def predict(self, source, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        time.sleep(self.latency_ms / 1000)
+        return [self._result(frame) for frame in frames]
+
+    def _result(self, frame):
+        import torch
+        from ultralytics.engine.results import Results
+
+        self.calls += 1
+        height, width = frame.shape[:2]
+        boxes = torch.zeros((0, 6))
+        if self.kind != 'pose' and self.detect_every and self.calls % self.detect_every < self.detect_run:
+            cls = 1 if self.kind == 'violence' else 0
+            boxes = torch.tensor([[width * 0.25, height * 0.25, width * 0.75, height * 0.75, 0.9, cls]])
+        if self.kind == 'pose':
+            return Results(frame, path="", names=self.names, boxes=boxes, keypoints=torch.zeros((0, 17, 3)))
+        return Results(frame, path="", names=self.names, boxes=boxes)
+
+
+def install_stub_models(api, latency_ms, sessions=1):
+    from detection_utils import NAMES_ANOMALY_OBJECT
+    # Sessions share the stub, so interleaved calls split a run between them
+    run = api.DEBOUNCE_ENTER_FRAMES * sessions
+    api.violence_model = StubModel('violence', {0: "NonViolence", 1: "Violence"}, latency_ms, detect_run=run)
+    api.pose_model = StubModel('pose', {0: "person"}, latency_ms)
+    api.anomaly_model = StubModel('anomaly', dict(enumerate(NAMES_ANOMALY_OBJECT)), latency_ms, detect_run=run)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    data = np.asarray(values)
+    return {
+        'p50': round(float(np.percentile(data, 50)), 3),
+        'p95': round(float(np.percentile(data, 95)), 3),
+        'p99': round(float(np.percentile(data, 99)), 3),
+        'mean': round(float(data.mean()), 3),
+    }
+
+
+def run_one(spec):
+    """Run a single configuration on a single video inside this process"""
+    import api
+
+    if spec['stub']:
+        install_stub_models(api, spec['stubLatencyMs'], spec['sessions'])
+    else:
+        api.initialize_models()
+
+    request = api.StartInferenceRequest(sourceType='file', **spec['options'])
+    samples = {stage: [] for stage in STAGES}
+    frames = {}
+    sessions = []
+    for index in range(spec['sessions']):
+        session = api.Session(f"bench-{spec['config']}-{index}", request)
+        session.source = spec['video']
+        frames[session.session_id] = 0
+
+        def observe(stage, milliseconds, session=session):
+            samples.setdefault(stage, []).append(milliseconds)
+            if stage == 'frame':
+                frames[session.session_id] += 1
+                if spec['maxFrames'] and frames[session.session_id] >= spec['maxFrames']:
+                    session.stop_event.set()
+
+        session.stage_observer = observe
+        sessions.append(session)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=api.inference_worker, args=(session,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total_frames = sum(frames.values())
+    detections = {}
+    for session in sessions:
+        for key, value in api.snapshots.get(session.session_id).detections.items():
+            detections[key] = detections.get(key, 0) + value
+    return {
+        'config': spec['config'],
+        'video': spec['video'],
+        'options': spec['options'],
+        'sessions': spec['sessions'],
+        'threadBudget': spec['threadBudget'],
+        'frames': total_frames,
+        'framesSkipped': sum(session.frames_skipped for session in sessions),
+        'elapsedSeconds': round(elapsed, 3),
+        # Aggregate over all sessions
+        'fps': round(total_frames / elapsed, 3) if elapsed > 0 else 0.0,
+        'stagesMs': {stage: percentiles(values) for stage, values in samples.items()},
+        # ru_maxrss is reported in KiB on Linux
+        'peakRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'detections': detections,
+    }
+
+
+def run_all(args):
+    results = []
+    for config in args.configs:
+        for video in args.videos:
+            for budget in args.thread_budget:
+                spec = {
+                    'config': config,
+                    'options': CONFIGS[config],
+                    'video': video,
+                    'maxFrames': args.max_frames,
+                    'sessions': args.sessions,
+                    'threadBudget': budget,
+                    'stub': args.stub,
+                    'stubLatencyMs': args.stub_latency_ms,
+                }
+                # The budget is read by api at import time
+                env = dict(os.environ, CPU_THREAD_BUDGET=str(budget), MAX_SESSIONS=str(max(args.sessions, 1)))
+                print(f"Running {config} on {video} (sessions {args.sessions}, thread budget {budget or 'unmanaged'})...",
+                      file=sys.stderr)
+                proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", json.dumps(spec)],
+                                      capture_output=True, text=True, env=env)
+                if proc.returncode != 0:
+                    print(proc.stderr, file=sys.stderr)
+                    results.append({'config': config, 'video': video, 'threadBudget': budget,
+                                    'error': proc.stderr.strip().splitlines()[-1:]})
+                    continue
+                results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        'meta': {
+            'createdAt': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpuCount': os.cpu_count(),
+            'stub': args.stub,
+            'maxFrames': args.max_frames,
+            'sessions': args.sessions,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return regressions of FPS and p95 frame latency beyond tolerance"""
+    def key(result):
+        return result['config'], result['video'], result.get('threadBudget', 0)
+
+    previous = {key(r): r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for result in report['results']:
+        base = previous.get(key(result))
+        if base is None or 'error' in result:
+            continue
+        if result['fps'] < base['fps'] * (1 - tolerance):
+            regressions.append(f"{result['config']} {result['video']}: fps {base['fps']} -> {result['fps']}")
+        current_p95 = (result['stagesMs'].get('frame') or {}).get('p95')
+        base_p95 = (base['stagesMs'].get('frame') or {}).get('p95')
+        if current_p95 and base_p95 and current_p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{result['config']} {result['video']}: frame p95 {base_p95} ms -> {current_p95} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the surveillance inference pipeline")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--videos", nargs="+", default=DEFAULT_VIDEOS)
+    parser.add_argument("--max-frames", type=int, default=300, help="Frames per run (0 = whole video)")
+    parser.add_argument("--stub", action="store_true", help="Use stub models instead of the real weights")
+    parser.add_argument("--stub-latency-ms", type=float, default=5.0)
+    parser.add_argument("--sessions", type=int, default=1, help="Concurrent sessions per run")
+    parser.add_argument("--thread-budget", type=int, nargs="+", default=[0],
+                        help="CPU_THREAD_BUDGET values to run each configuration with (0 = unmanaged)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Compare against this baseline file")
+    parser.add_argument("--save-baseline", help="Write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one))))
+        return
+
+    report = run_all(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    for result in report['results']:
+        budget = f"budget {result.get('threadBudget') or '-':<3}"
+        if 'error' in result:
+            print(f"{result['config']:<14} {result['video']:<24} {budget} ERROR {result['error']}")
+            continue
+        frame = result['stagesMs']['frame'] or {}
+        print(f"{result['config']:<14} {result['video']:<24} {budget} {result['fps']:>8.2f} fps  "
+              f"p50 {frame.get('p50')} ms  p95 {frame.get('p95')} ms  rss {result['peakRssMb']} MB")
+
+    # Aggregate FPS of each thread budget relative to the unmanaged runs
+    unmanaged = {(r['config'], r['video']): r['fps'] for r in report['results']
+                 if 'error' not in r and not r['threadBudget']}
+    for result in report['results']:
+        base = unmanaged.get((result['config'], result['video']))
+        if 'error' in result or not result['threadBudget'] or not base:
+            continue
+        print(f"{result['config']:<14} {result['video']:<24} budget {result['threadBudget']}: "
+              f"{result['fps'] / base:.2f}x unmanaged aggregate fps")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from collections import deque
+
+
+class TrackState:
+    """Debounce state of one key: recent per-frame hits, whether it is active and when it was last seen"""
+
+    __slots__ = ('hits', 'active', 'last_seen')
+
+    def __init__(self, window_frames):
+        self.hits = deque(maxlen=window_frames)
+        self.active = False
+        self.last_seen = None
+
+
+class Debouncer:
+    """
+    Temporal hysteresis for detection state, keyed per (family, label), e.g.
+    ('violence', 'Violence'), or per tracked person or object, e.g.
+    ('pose', (7, 'falling')) or ('anomaly', (3, 'fire')). A key
+    becomes active once it was detected in `enter_frames` of the last
+    `window_frames` updates of its family, and goes inactive only after it
+    has not been seen for `hold_seconds`. Only the enter transition should
+    count as a new event, so single-frame flicker neither enters nor ends one.
+
+    `overrides` maps a family to its own enter_frames/window_frames/hold_seconds.
+    """
+
+    def __init__(self, enter_frames=3, window_frames=5, hold_seconds=2.0, overrides=None):
+        self.defaults = {'enter_frames': enter_frames, 'window_frames': window_frames, 'hold_seconds': hold_seconds}
+        self.overrides = overrides or {}
+        self.states = {}  # (family, label) -> TrackState
+
+    def rule(self, family):
+        return {**self.defaults, **self.overrides.get(family, {})}
+
+    def update(self, family, observed, now):
+        """
+        Record one frame of a family: `observed` holds the labels detected in
+        it. Returns (entered, exited) lists of labels whose state changed.
+        """
+        rule = self.rule(family)
+        observed = set(observed)
+        entered, exited = [], []
+        labels = observed | {label for key_family, label in self.states if key_family == family}
+        for label in labels:
+            key = (family, label)
+            state = self.states.get(key)
+            if state is None:
+                state = self.states[key] = TrackState(rule['window_frames'])
+            hit = label in observed
+            state.hits.append(hit)
+            if hit:
+                state.last_seen = now
+            if not state.active:
+                if hit and sum(state.hits) >= rule['enter_frames']:
+                    state.active = True
+                    entered.append(label)
+                elif not any(state.hits):
+                    # Nothing left in the window, forget the key
+                    del self.states[key]
+            elif now - state.last_seen >= rule['hold_seconds']:
+                state.active = False
+                state.hits.clear()
+                exited.append(label)
+                del self.states[key]
+        return entered, exited
+
+    def is_active(self, family, label):
+        state = self.states.get((family, label))
+        return state is not None and state.active
+
+    def active(self, family=None):
+        """Labels (or (family, label) keys when no family is given) currently active"""
+        if family is None:
+            return [key for key, state in self.states.items() if state.active]
+        return [label for (key_family, label), state in self.states.items() if key_family == family and state.active]
+
+    def reset(self):
+        self.states.clear()
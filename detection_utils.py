@@ -0,0 +1,130 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+from text_embeddings import TextEmbeddingCache
+
+# Model weights
+VIOLENCE_MODEL_PATH = "Violence/best.pt"
+POSE_MODEL_PATH = "Pose/yolov8n-pose.pt"
+ANOMALY_MODEL_PATH = "yoloe-11m-seg.pt"
+
+# YOLOE text embeddings are cached per class name and model hash
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+embedding_cache = TextEmbeddingCache(EMBEDDING_CACHE_DIR, ANOMALY_MODEL_PATH)
+
+# Class id of "violence" in the violence model
+VIOLENCE_CLASS = 1
+
+# Classes to detect
+NAMES_ANOMALY = ["Fire", "Black Smoke","White Smoke", "Knife", "Gun", "Blood"]
+NAMES_OBJECT = ["Person", "Mask", "Vest", "Hat"]
+NAMES_ANOMALY_OBJECT = NAMES_ANOMALY + NAMES_OBJECT
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    """Open-vocabulary class set of the anomaly model: anomaly classes first, then plain objects"""
+    name: str
+    anomalies: Tuple[str, ...]
+    objects: Tuple[str, ...] = ()
+
+    @property
+    def names(self):
+        return list(self.anomalies + self.objects)
+
+    def is_anomaly(self, cls):
+        return 0 <= cls < len(self.anomalies)
+
+
+DEFAULT_VOCABULARY = Vocabulary("default", tuple(NAMES_ANOMALY), tuple(NAMES_OBJECT))
+
+# Per-site class sets; more can be added with a VOCABULARY_FILE of {"name": {"anomalies": [...], "objects": [...]}}
+VOCABULARIES = {
+    'default': DEFAULT_VOCABULARY,
+    'warehouse': Vocabulary("warehouse", ("Fire", "Black Smoke", "White Smoke", "Knife", "Gun", "Spilled Liquid"),
+                            ("Person", "Forklift", "Vest", "Hat")),
+    'kitchen': Vocabulary("kitchen", ("Fire", "Black Smoke", "White Smoke", "Blood", "Spilled Liquid"),
+                          ("Person", "Mask", "Hairnet", "Gloves")),
+}
+
+
+def load_vocabularies(path):
+    """Read extra vocabularies from a JSON file"""
+    with open(path) as f:
+        data = json.load(f)
+    return {name: Vocabulary(name, tuple(spec['anomalies']), tuple(spec.get('objects', ())))
+            for name, spec in data.items()}
+
+
+if os.getenv("VOCABULARY_FILE"):
+    VOCABULARIES.update(load_vocabularies(os.getenv("VOCABULARY_FILE")))
+
+# Constants for pose estimation
+ACTION_ANGLES = {
+    'standing': {'hip': (170, 180), 'knee': (170, 180)},
+    'sitting': {'hip': (85, 120), 'knee': (85, 120)},
+    'walking': {'hip': (130, 170), 'knee': (130, 170)},
+    'bending': {'hip': (45, 85), 'knee': (170, 180)},
+    'falling': {'hip': (30, 80), 'knee': (30, 80)},
+    'lying': {'hip': (160, 180), 'knee': (160, 180), 'vertical': False},
+    'crouching': {'hip': (45, 90), 'knee': (30, 70)}
+}
+ANOMALY_ACTIONS = ['falling', 'lying', 'crouching']
+
+
+def load_violence_model(device):
+    """Load the violence detection model onto a device"""
+    from ultralytics import YOLO
+    return YOLO(VIOLENCE_MODEL_PATH).to(device)
+
+def load_pose_model(device):
+    """Load the pose estimation model onto a device"""
+    from ultralytics import YOLO
+    return YOLO(POSE_MODEL_PATH).to(device)
+
+def load_anomaly_model(device, vocabulary=DEFAULT_VOCABULARY):
+    """Load the YOLOE anomaly model onto a device with a vocabulary"""
+    from ultralytics import YOLOE
+    model = YOLOE(ANOMALY_MODEL_PATH).to(device)
+    set_vocabulary(model, vocabulary)
+    return model
+
+def set_vocabulary(model, vocabulary):
+    """Switch the classes of a loaded YOLOE model, encoding only names missing from the embedding cache"""
+    names = vocabulary.names
+    model.set_classes(names, embedding_cache.get(model, names).to(model.device))
+
+def calculate_angle(a, b, c):
+    """Calculate the angle between three points"""
+    a = np.array(a)
+    b = np.array(b)
+    c = np.array(c)
+    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
+    angle = np.abs(radians * 180.0 / np.pi)
+    if angle > 180:
+        angle = 360 - angle
+    return angle
+
+def determine_action(keypoints):
+    """Determine the action based on pose keypoints"""
+    hip = keypoints[11]
+    knee = keypoints[13]
+    ankle = keypoints[15]
+    shoulder = keypoints[5]
+    hip_angle = calculate_angle(shoulder, hip, knee)
+    knee_angle = calculate_angle(hip, knee, ankle)
+    is_vertical = abs(shoulder[1] - ankle[1]) > abs(shoulder[0] - ankle[0])
+
+    for action, angles in ACTION_ANGLES.items():
+        if 'vertical' in angles and angles['vertical'] is False and is_vertical:
+            continue
+        if 'vertical' in angles and angles['vertical'] is True and not is_vertical:
+            continue
+        if angles['hip'][0] <= hip_angle <= angles['hip'][1] and angles['knee'][0] <= knee_angle <= angles['knee'][1]:
+            return action
+
+    return 'unknown'
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ClipBuffer:
+    """
+    Ring buffer of the last `seconds` of a stream, held as JPEG bytes rather
+    than raw arrays. Frames are downscaled to `max_width` and decimated to
+    `fps` before encoding, and the buffer is also capped at `max_bytes`, so
+    its memory use is bounded no matter how fast or large the source is.
+    """
+
+    def __init__(self, seconds=5.0, fps=10.0, max_width=640, quality=70, max_bytes=32 * 1024 ** 2):
+        self.seconds = seconds
+        self.fps = fps
+        self.max_width = max_width
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (timestamp, jpeg bytes)
+        self.size = 0
+        self._last_encoded = None
+
+    def encode(self, frame):
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, round(height * self.max_width / width)),
+                               interpolation=cv2.INTER_AREA)
+        ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return data.tobytes() if ok else None
+
+    def push(self, frame, timestamp):
+        """Encode and keep the frame if it is due at the clip frame rate; returns the JPEG bytes or None"""
+        if self._last_encoded is not None and timestamp - self._last_encoded < 1.0 / self.fps:
+            return None
+        data = self.encode(frame)
+        if data is None:
+            return None
+        self._last_encoded = timestamp
+        self.frames.append((timestamp, data))
+        self.size += len(data)
+        while self.frames and (timestamp - self.frames[0][0] > self.seconds or self.size > self.max_bytes):
+            self.size -= len(self.frames.popleft()[1])
+        return data
+
+    def snapshot(self):
+        return list(self.frames)
+
+
+class _PendingClip:
+    def __init__(self, event_id, frames, until):
+        self.event_id = event_id
+        self.frames = frames
+        self.until = until
+        self.future = Future()
+
+
+class ClipRecorder:
+    """
+    Per-stream event clip recorder. The worker pushes every frame; trigger()
+    snapshots the pre-event buffer and keeps collecting for `post_seconds`,
+    after which the MP4 is written on `executor` and the returned future
+    resolves to its path (None if nothing could be written).
+    """
+
+    def __init__(self, output_dir, executor, pre_seconds=5.0, post_seconds=5.0, fps=10.0,
+                 max_width=640, quality=70, max_bytes=32 * 1024 ** 2, fourcc="mp4v"):
+        self.output_dir = output_dir
+        self.executor = executor
+        self.post_seconds = post_seconds
+        self.fourcc = fourcc
+        self.buffer = ClipBuffer(pre_seconds, fps, max_width, quality, max_bytes)
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def push(self, frame, timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        data = self.buffer.push(frame, timestamp)
+        if not self._pending:
+            return
+        with self._lock:
+            still_pending = []
+            for clip in self._pending:
+                if data is not None:
+                    clip.frames.append((timestamp, data))
+                if timestamp >= clip.until:
+                    self._submit(clip)
+                else:
+                    still_pending.append(clip)
+            self._pending = still_pending
+
+    def trigger(self, event_id, timestamp=None):
+        """Start a clip around an event; returns a Future of the clip path"""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        clip = _PendingClip(event_id, self.buffer.snapshot(), timestamp + self.post_seconds)
+        with self._lock:
+            self._pending.append(clip)
+        return clip.future
+
+    def close(self):
+        """Write clips still waiting on post-event frames with what they have"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for clip in pending:
+            self._submit(clip)
+
+    def _submit(self, clip):
+        try:
+            self.executor.submit(self._write, clip)
+        except RuntimeError as e:
+            clip.future.set_exception(e)
+
+    def _fps(self, frames):
+        """Frame rate the frames were actually kept at, so clips play back in real time"""
+        if len(frames) < 2 or frames[-1][0] <= frames[0][0]:
+            return self.buffer.fps
+        return min(self.buffer.fps, (len(frames) - 1) / (frames[-1][0] - frames[0][0]))
+
+    def _write(self, clip):
+        path = os.path.join(self.output_dir, f"clip_{clip.event_id}.mp4")
+        writer = None
+        try:
+            # Slow sources deliver fewer frames than the nominal clip rate
+            fps = self._fps(clip.frames)
+            for _, data in clip.frames:
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), fps, (width, height))
+                    if not writer.isOpened():
+                        raise RuntimeError(f"Could not open a {self.fourcc} writer for {path}")
+                elif frame.shape[:2] != (height, width):
+                    frame = cv2.resize(frame, (width, height))
+                writer.write(frame)
+        except Exception as e:
+            logger.error(f"Error writing clip for event {clip.event_id}: {e}")
+            clip.future.set_result(None)
+            return
+        finally:
+            clip.frames = None
+            if writer is not None:
+                writer.release()
+        clip.future.set_result(path if writer is not None else None)
+
+
+class ClipRetention:
+    """
+    Size and age quota of a clip directory, like FrameStore's for snapshots:
+    enforce() deletes the oldest clips until the directory holds at most
+    `max_bytes` and nothing is older than `max_age` seconds. The directory is
+    rescanned on every call, which is cheap next to writing a clip.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def enforce(self):
+        """Delete the oldest clips beyond the size quota or the maximum age"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            clips = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".mp4") and entry.is_file():
+                    stat = entry.stat()
+                    clips.append((stat.st_mtime, stat.st_size, entry.path))
+            clips.sort()
+            total = sum(size for _, size, _ in clips)
+            for modified, size, path in clips:
+                too_old = self.max_age is not None and now - modified > self.max_age
+                if not too_old and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} clips to stay within retention quotas")
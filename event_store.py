@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+class EventStore:
+    """
+    Detection events (violence, pose anomalies, other anomalies) and the
+    media attached to them. Events are kept in memory up to `history_size`
+    and appended to an `events.jsonl` log under `root`; updates (a clip that
+    finished writing, ...) are appended as partial records and replayed on load.
+    Updates of events no longer in memory are dropped, and the owner of the
+    log rewrites it with only the kept events once it holds twice
+    `history_size` records, or on start through compact(). Loading never
+    writes, since processes that only forward records load the store too.
+    With a `listener`, records are forwarded instead of written, so that a
+    single process that `ingest`s them owns the log.
+    """
+
+    def __init__(self, root: str, history_size: int = 1000):
+        self.root = root
+        self.history_size = history_size
+        self.log_path = os.path.join(root, "events.jsonl")
+        self._events: "OrderedDict[str, dict]" = OrderedDict()
+        self._log_records = 0
+        self._lock = threading.Lock()
+        self.listener = None  # Optional callable(record) that takes over every add and update
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._log_records += 1
+                self._apply(record)
+        self._trim()
+
+    def _apply(self, record):
+        """Apply an add or update; returns False for an update of an unknown (e.g. trimmed) event"""
+        event = self._events.get(record['eventId'])
+        if event is None:
+            if 'sessionId' not in record:
+                return False
+            event = self._events[record['eventId']] = {}
+        event.update(record)
+        return True
+
+    def _append(self, record):
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        self._log_records += 1
+        if self._log_records > 2 * self.history_size:
+            self._compact()
+
+    def compact(self):
+        """Rewrite the log with one full record per kept event; only the process that owns the log may call this"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        temp_path = self.log_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            for event in self._events.values():
+                f.write(json.dumps(event) + "\n")
+        os.replace(temp_path, self.log_path)
+        self._log_records = len(self._events)
+
+    def _trim(self):
+        while len(self._events) > self.history_size:
+            self._events.popitem(last=False)
+
+    def add(self, session_id: str, kind: str, **details) -> dict:
+        event = {
+            'eventId': uuid.uuid4().hex,
+            'sessionId': session_id,
+            'kind': kind,
+            'createdAt': time.time(),
+            **details,
+        }
+        with self._lock:
+            self._events[event['eventId']] = event
+            self._trim()
+            if self.listener is None:
+                self._append(event)
+        if self.listener is not None:
+            self.listener(dict(event))
+        return dict(event)
+
+    def update(self, event_id: str, **fields) -> Optional[dict]:
+        with self._lock:
+            event = self._events.get(event_id)
+            if event is None:
+                return None
+            event.update(fields)
+            if self.listener is None:
+                self._append({'eventId': event_id, **fields})
+            event = dict(event)
+        if self.listener is not None:
+            self.listener({'eventId': event_id, **fields})
+        return event
+
+    def ingest(self, record: dict):
+        """Apply and persist an add or update forwarded by another process"""
+        with self._lock:
+            if not self._apply(record):
+                return
+            self._trim()
+            self._append(record)
+
+    def get(self, event_id: str) -> Optional[dict]:
+        event = self._events.get(event_id)
+        return dict(event) if event is not None else None
+
+    def list(self, session_id: Optional[str] = None, kind: Optional[str] = None, limit: int = 100):
+        with self._lock:
+            events = list(self._events.values())
+        if session_id is not None:
+            events = [event for event in events if event.get('sessionId') == session_id]
+        if kind is not None:
+            events = [event for event in events if event.get('kind') == kind]
+        return [dict(event) for event in reversed(events[-limit:])] if limit else []
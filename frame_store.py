@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStore:
+    """
+    Alert snapshots on disk. Keys are `{kind}_{timestamp}_{random}` so two
+    snapshots taken in the same second never collide. Encoding and writing
+    happen on a background thread; each snapshot also gets a small thumbnail
+    and an entry in an in-memory index, rebuilt from the directory on start.
+    After every write the oldest snapshots are deleted until the store is
+    under `max_bytes` and nothing is older than `max_age` seconds; the owner
+    also calls `enforce_retention` once on start. With a `listener`, new
+    entries are handed to it instead, so that a single process that
+    `ingest`s them owns the index and the quota.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1024 ** 3, max_age: Optional[float] = 7 * 24 * 3600,
+                 quality: int = 90, thumb_width: int = 160, workers: int = 1):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.quality = quality
+        self.thumb_width = thumb_width
+        self.thumb_dir = os.path.join(root, "thumbs")
+        self._index: "OrderedDict[str, dict]" = OrderedDict()  # oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frames")
+        self.listener = None  # Optional callable(entry) that takes over indexing of new snapshots
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.endswith(".jpg") or not os.path.isfile(path):
+                continue
+            key = name[:-4]
+            stat = os.stat(path)
+            size = stat.st_size
+            thumb = os.path.join(self.thumb_dir, name)
+            if os.path.exists(thumb):
+                size += os.path.getsize(thumb)
+            else:
+                thumb = None
+            entries.append(self._entry(key, key.split("_", 1)[0], None, path, thumb, size, stat.st_mtime))
+        for entry in sorted(entries, key=lambda entry: entry['createdAt']):
+            self._index[entry['key']] = entry
+            self._size += entry['bytes']
+
+    @staticmethod
+    def _entry(key, kind, session_id, path, thumb, size, created_at):
+        return {'key': key, 'kind': kind, 'sessionId': session_id, 'path': path, 'thumbnail': thumb,
+                'bytes': size, 'createdAt': created_at}
+
+    def new_key(self, kind: str) -> str:
+        return f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    def save(self, kind: str, frame, session_id: Optional[str] = None):
+        """
+        Queue a frame for encoding and writing. Returns a Future of
+        (entry, jpeg bytes) so callers can send the encoded image without
+        reading it back. The caller must not modify `frame` afterwards.
+        """
+        return self._executor.submit(self._write, self.new_key(kind), kind, frame, session_id)
+
+    def _write(self, key, kind, frame, session_id):
+        ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError(f"Could not encode snapshot {key}")
+        data = data.tobytes()
+        path = os.path.join(self.root, f"{key}.jpg")
+        with open(path, 'wb') as f:
+            f.write(data)
+        size = len(data)
+
+        thumb = os.path.join(self.thumb_dir, f"{key}.jpg")
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.thumb_width, max(1, round(height * self.thumb_width / width))),
+                           interpolation=cv2.INTER_AREA)
+        if cv2.imwrite(thumb, small):
+            size += os.path.getsize(thumb)
+        else:
+            thumb = None
+
+        entry = self._entry(key, kind, session_id, path, thumb, size, time.time())
+        if self.listener is not None:
+            self.listener(dict(entry))
+        else:
+            self.ingest(entry)
+        return dict(entry), data
+
+    def ingest(self, entry: dict):
+        """Index a snapshot written by this or another process and apply the quotas"""
+        with self._lock:
+            if entry['key'] in self._index:
+                return
+            self._index[entry['key']] = dict(entry)
+            self._size += entry['bytes']
+        self.enforce_retention()
+
+    def enforce_retention(self):
+        """Delete the oldest snapshots beyond the size quota or the maximum age"""
+        now = time.time()
+        expired = []
+        with self._lock:
+            while self._index:
+                oldest = next(iter(self._index.values()))
+                too_old = self.max_age is not None and now - oldest['createdAt'] > self.max_age
+                if not too_old and self._size <= self.max_bytes:
+                    break
+                self._index.popitem(last=False)
+                self._size -= oldest['bytes']
+                expired.append(oldest)
+        for entry in expired:
+            for path in (entry['path'], entry['thumbnail']):
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        if expired:
+            logger.info(f"Removed {len(expired)} snapshots to stay within retention quotas")
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._index.get(key)
+        return dict(entry) if entry is not None else None
+
+    def list(self, kind: Optional[str] = None, session_id: Optional[str] = None, limit: int = 100):
+        """Index entries, newest first"""
+        with self._lock:
+            entries = list(self._index.values())
+        if kind is not None:
+            entries = [entry for entry in entries if entry['kind'] == kind]
+        if session_id is not None:
+            entries = [entry for entry in entries if entry['sessionId'] == session_id]
+        return [dict(entry) for entry in reversed(entries[-limit:])] if limit else []
+
+    @property
+    def size(self) -> int:
+        return self._size
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts the work items submitted and not finished yet, e.g. for a queue-depth gauge"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def pending_count(self) -> int:
+        return self._pending
+
+
+class Job:
+    """
+    A unit of background work (session start/stop, analysis, ...).
+    The running function reports progress through update().
+    """
+
+    def __init__(self, kind: str, session_id: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.status = "pending"
+        self.progress = 0.0
+        self.message = ""
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, progress: Optional[float] = None, message: Optional[str] = None, **result):
+        """Record progress (0..1), a status message and any partial result fields."""
+        with self._lock:
+            if progress is not None:
+                self.progress = max(0.0, min(1.0, progress))
+            if message is not None:
+                self.message = message
+            self.result.update(result)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'jobId': self.job_id,
+                'kind': self.kind,
+                'sessionId': self.session_id,
+                'status': self.status,
+                'progress': round(self.progress, 4),
+                'message': self.message,
+                'result': dict(self.result),
+                'error': self.error,
+                'createdAt': self.created_at,
+                'startedAt': self.started_at,
+                'finishedAt': self.finished_at,
+            }
+
+
+class JobManager:
+    """
+    Runs jobs on a small thread pool and keeps a bounded history of them
+    so clients can poll progress instead of holding requests open.
+    """
+
+    def __init__(self, max_workers: int = 2, history_size: int = 200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.history_size = history_size
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, session_id: Optional[str] = None, **kwargs) -> Job:
+        """Queue fn(job, *args, **kwargs); its return value (a dict) becomes the job result."""
+        job = Job(kind, session_id=session_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+            if isinstance(result, dict):
+                job.update(**result)
+            job.update(progress=1.0)
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            logger.error(f"Job {job.kind} {job.job_id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        # Drop the oldest finished jobs once the history is full
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.history_size:
+                break
+            if self._jobs[job_id].done:
+                del self._jobs[job_id]
+
+    def pending_count(self) -> int:
+        """Number of jobs queued but not started yet."""
+        return sum(1 for job in list(self._jobs.values()) if job.status == "pending")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self, session_id: Optional[str] = None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if session_id is not None:
+            jobs = [job for job in jobs if job.session_id == session_id]
+        return jobs
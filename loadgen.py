@@ -0,0 +1,263 @@
+"""
+Multi-camera load generator for the surveillance API.
+
+`serve` streams N simulated cameras over HTTP as MJPEG
+(http://HOST:PORT/camera/<i>), looping the sample videos or synthetic frames
+at a given fps and resolution, as a local stand-in for RTSP cameras:
+
+    python loadgen.py serve --cameras 8 --fps 15 --width 1280 --height 720
+
+`run` ramps up the number of cameras on a running API, one step at a time.
+Each step starts that many sessions through /api/start, lets them warm up,
+and measures per-camera FPS and p95 end-to-end latency from /metrics over a
+window. It reports the largest camera count that met the SLOs. Cameras are
+the HTTP stand-in above (--source http) or in-process synthetic:// sources
+(--source synthetic, the default, needs no server):
+
+    python loadgen.py run --api http://localhost:8000 --max-cameras 16 \\
+        --min-fps 10 --p95-ms 500
+
+The API must allow enough sessions (MAX_SESSIONS).
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from video_sources import SyntheticCapture
+
+DEFAULT_VIDEOS = ["Violence/violence.mp4", "Violence/Boxing.mp4"]
+
+
+def synthetic_url(index, videos, fps, width, height):
+    """synthetic:// source of camera `index`; cameras alternate between the videos, or draw frames when none are given"""
+    url = f"synthetic://cam{index}?fps={fps}&width={width}&height={height}"
+    if videos:
+        url += f"&video={videos[index % len(videos)]}"
+    return url
+
+
+class CameraServer:
+    """Serves each simulated camera as an endless multipart MJPEG response"""
+
+    def __init__(self, cameras, videos, fps, width, height, quality=80, host="127.0.0.1", port=8554):
+        self.urls = [synthetic_url(index, videos, fps, width, height) for index in range(cameras)]
+        self.quality = quality
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = re.fullmatch(r"/camera/(\d+)", self.path)
+                if match is None or int(match.group(1)) >= len(server.urls):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                # Every client gets its own paced source
+                capture = SyntheticCapture(server.urls[int(match.group(1))])
+                try:
+                    while True:
+                        ok, frame = capture.read()
+                        if not ok:
+                            break
+                        ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, server.quality])
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                         + f"Content-Length: {len(data)}\r\n\r\n".encode() + data.tobytes() + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    capture.release()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def url(self, index):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/camera/{index}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def api_call(base, path, body=None, method=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method or ("POST" if data else "GET"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        payload = response.read().decode()
+    return json.loads(payload) if payload.startswith(("{", "[")) else payload
+
+
+METRIC_LINE = re.compile(r'^(\w+)\{([^}]*)\}\s+(\S+)$')
+
+
+def scrape(base):
+    """Per-session frame counters and end-to-end latency buckets from /metrics"""
+    frames, buckets = {}, {}
+    for line in api_call(base, "/metrics").splitlines():
+        match = METRIC_LINE.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        session = labels.get('session')
+        if session is None:
+            continue
+        if name == "surveillance_frames_total":
+            frames[session] = float(value)
+        elif name == "surveillance_end_to_end_latency_seconds_bucket":
+            buckets.setdefault(session, {})[labels['le']] = float(value)
+    return frames, buckets
+
+
+def percentile_from_buckets(buckets, q):
+    """Upper bucket bound below which a fraction `q` of the observations fall"""
+    bounds = sorted(((float('inf') if le == "+Inf" else float(le)), count) for le, count in buckets.items())
+    total = bounds[-1][1] if bounds else 0
+    if not total:
+        return None
+    for bound, count in bounds:
+        if count >= q * total:
+            return bound
+    return bounds[-1][0]
+
+
+def measure(base, session_ids, window):
+    """Per-camera FPS and p95 end-to-end latency over `window` seconds"""
+    frames_before, buckets_before = scrape(base)
+    time.sleep(window)
+    frames_after, buckets_after = scrape(base)
+    cameras = []
+    merged = {}
+    for session_id in session_ids:
+        frames = frames_after.get(session_id, 0) - frames_before.get(session_id, 0)
+        before = buckets_before.get(session_id, {})
+        delta = {le: count - before.get(le, 0) for le, count in buckets_after.get(session_id, {}).items()}
+        for le, count in delta.items():
+            merged[le] = merged.get(le, 0) + count
+        p95 = percentile_from_buckets(delta, 0.95)
+        cameras.append({'sessionId': session_id, 'fps': round(frames / window, 2),
+                        'p95Ms': None if p95 is None else p95 * 1000})
+    p95 = percentile_from_buckets(merged, 0.95)
+    return cameras, None if p95 is None else p95 * 1000
+
+
+def run_step(args, count, server):
+    session_ids = []
+    try:
+        for index in range(count):
+            source = server.url(index) if server is not None else \
+                synthetic_url(index, args.videos, args.fps, args.width, args.height)
+            response = api_call(args.api, "/api/start", {'sourceType': 'rtsp', 'rtspUrl': source, **args.options})
+            session_ids.append(response['sessionId'])
+        time.sleep(args.warmup)
+        cameras, p95 = measure(args.api, session_ids, args.window)
+    finally:
+        for session_id in session_ids:
+            try:
+                api_call(args.api, "/api/stop", {'sessionId': session_id})
+            except urllib.error.URLError:
+                pass
+        # Give the workers time to release their sources before the next step
+        time.sleep(args.cooldown)
+    min_fps = min((camera['fps'] for camera in cameras), default=0.0)
+    passed = min_fps >= args.min_fps and p95 is not None and p95 <= args.p95_ms
+    return {'cameras': count, 'minFps': min_fps, 'p95Ms': p95, 'passed': passed, 'perCamera': cameras}
+
+
+def run(args):
+    server = None
+    if args.source == "http":
+        server = CameraServer(args.max_cameras, args.videos, args.fps, args.width, args.height, port=args.port)
+        server.start()
+    steps = []
+    try:
+        for count in range(args.step, args.max_cameras + 1, args.step):
+            print(f"Running {count} camera(s)...", file=sys.stderr)
+            try:
+                step = run_step(args, count, server)
+            except urllib.error.HTTPError as e:
+                print(f"Could not start {count} sessions: {e.read().decode()} (is MAX_SESSIONS high enough?)", file=sys.stderr)
+                break
+            steps.append(step)
+            print(f"{count:>4} cameras  min {step['minFps']:>6.2f} fps  p95 {step['p95Ms']} ms  "
+                  f"{'ok' if step['passed'] else 'SLO missed'}", file=sys.stderr)
+            if not step['passed']:
+                break
+    finally:
+        if server is not None:
+            server.stop()
+    sustained = max((step['cameras'] for step in steps if step['passed']), default=0)
+    return {
+        'createdAt': time.time(),
+        'slo': {'minFps': args.min_fps, 'p95Ms': args.p95_ms},
+        'stream': {'source': args.source, 'fps': args.fps, 'width': args.width, 'height': args.height},
+        'maxSustainedCameras': sustained,
+        'steps': steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated cameras and a load driver for the surveillance API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def stream_options(command):
+        command.add_argument("--videos", nargs="*", default=DEFAULT_VIDEOS, help="Videos to loop (none = synthetic frames)")
+        command.add_argument("--fps", type=float, default=15)
+        command.add_argument("--width", type=int, default=1280)
+        command.add_argument("--height", type=int, default=720)
+        command.add_argument("--port", type=int, default=8554)
+
+    serve = commands.add_parser("serve", help="Serve simulated cameras as MJPEG over HTTP")
+    serve.add_argument("--cameras", type=int, default=4)
+    serve.add_argument("--host", default="127.0.0.1")
+    stream_options(serve)
+
+    drive = commands.add_parser("run", help="Find the largest camera count that meets the SLOs")
+    drive.add_argument("--api", default="http://localhost:8000")
+    drive.add_argument("--source", choices=("synthetic", "http"), default="synthetic")
+    drive.add_argument("--max-cameras", type=int, default=16)
+    drive.add_argument("--step", type=int, default=1)
+    drive.add_argument("--warmup", type=float, default=20, help="Seconds before measuring each step")
+    drive.add_argument("--window", type=float, default=30, help="Seconds measured per step")
+    drive.add_argument("--cooldown", type=float, default=5)
+    drive.add_argument("--min-fps", type=float, default=10, help="SLO: slowest camera's processed fps")
+    drive.add_argument("--p95-ms", type=float, default=500, help="SLO: p95 end-to-end latency across cameras")
+    drive.add_argument("--options", type=json.loads, default={}, help="Extra /api/start fields as JSON")
+    drive.add_argument("--output", default="loadgen_results.json")
+    stream_options(drive)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = CameraServer(args.cameras, args.videos, args.fps, args.width, args.height, host=args.host, port=args.port)
+        for index in range(args.cameras):
+            print(server.url(index))
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Max sustained cameras: {report['maxSustainedCameras']} (wrote {args.output})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import bisect
+import math
+import threading
+
+# Latency buckets in seconds, from 1 ms to 5 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    """
+    Monotonic counter. Updates are plain attribute writes with no lock: each
+    series is written by a single thread (a session worker, the alert loop),
+    and a scrape only ever reads.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    """Value that can go up and down, or be computed by a callback at scrape time."""
+
+    def __init__(self, callback=None):
+        self.value = 0.0
+        self.callback = callback
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                value = math.nan
+        yield name, labels, value
+
+
+class Histogram:
+    """
+    Histogram with fixed, pre-computed buckets. observe() is a bisect and
+    three increments, single writer per series like Counter.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        counts = list(self.counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+        yield f"{name}_bucket", labels + (("le", "+Inf"),), cumulative + counts[-1]
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """
+    Holds metric families and renders them in the Prometheus text format.
+    Only creating and removing series takes a lock; hot-path code keeps a
+    reference to its series and updates it directly.
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, factory, name, documentation, labels):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and key in family['series']:
+            return family['series'][key]
+        with self._lock:
+            family = self._families.setdefault(name, {'type': kind, 'help': documentation, 'series': {}})
+            if family['type'] != kind:
+                raise ValueError(f"Metric {name} already registered as {family['type']}")
+            series = family['series'].get(key)
+            if series is None:
+                series = factory()
+                # Copy-on-write so a concurrent render never sees the dict change size
+                family['series'] = {**family['series'], key: series}
+            return series
+
+    def counter(self, name, documentation, **labels) -> Counter:
+        return self._get('counter', Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, callback=None, **labels) -> Gauge:
+        gauge = self._get('gauge', Gauge, name, documentation, labels)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get('histogram', lambda: Histogram(buckets), name, documentation, labels)
+
+    def remove(self, **labels):
+        """Drop every series whose labels include all of the given ones."""
+        match = set(labels.items())
+        with self._lock:
+            for family in self._families.values():
+                family['series'] = {key: series for key, series in family['series'].items()
+                                    if not match.issubset(key)}
+
+    def render(self) -> str:
+        lines = []
+        for name, family in list(self._families.items()):
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key, series in family['series'].items():
+                for sample_name, labels, value in series.samples(name, key):
+                    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    label_text = f"{{{label_text}}}" if label_text else ""
+                    lines.append(f"{sample_name}{label_text} {_format_value(float(value))}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap frame-difference motion detector used to skip inference on static scenes.
+    Frames are compared on a small grayscale thumbnail; inference is still forced
+    every `max_skip` frames so slow changes are never missed entirely.
+    """
+
+    def __init__(self, threshold=0.01, pixel_delta=25, max_skip=30, thumb_width=160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_skip = max_skip
+        self.thumb_width = thumb_width
+        self._previous = None
+        self._skipped = 0
+        self.score = 0.0
+        self.mask = None  # Changed-pixel mask of the last frame, reused by tiled inference
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        thumb_height = max(1, round(height * self.thumb_width / width))
+        small = cv2.resize(frame, (self.thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def motion_mask(self, frame):
+        """Update the reference frame and return the changed-pixel mask of the thumbnail"""
+        gray = self.thumbnail(frame)
+        if self._previous is None or self._previous.shape != gray.shape:
+            self._previous = gray
+            return np.ones_like(gray, dtype=bool)
+        mask = cv2.absdiff(gray, self._previous) > self.pixel_delta
+        self._previous = gray
+        return mask
+
+    def should_process(self, frame):
+        """Return True if the frame changed enough (or has been skipped too long) to run inference"""
+        mask = self.mask = self.motion_mask(frame)
+        self.score = float(mask.mean())
+        if self.score >= self.threshold or self._skipped >= self.max_skip:
+            self._skipped = 0
+            return True
+        self._skipped += 1
+        return False
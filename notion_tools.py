@@ -1,3 +1,4 @@
+import logging
 import os
 import requests
 from dotenv import load_dotenv
@@ -5,6 +6,8 @@ from agno.tools import Toolkit
 from agno.agent import Agent
 from agno.models.google import Gemini
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
@@ -121,7 +124,7 @@ class NotionAPI:
                 if name == page_name:
                     return page["id"]
             else:
-                print(f"Warning: Page with ID {page['id']} has no title.")
+                logger.warning(f"Page with ID {page['id']} has no title.")
         raise ValueError(f"Page with name '{page_name}' not found.")
 
     # Block-level methods (unchanged)
@@ -0,0 +1,380 @@
+import bisect
+import json
+import logging
+import multiprocessing
+import queue
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import cv2
+
+from detection_utils import (
+    ANOMALY_ACTIONS, DEFAULT_VOCABULARY, VIOLENCE_CLASS,
+    determine_action, load_anomaly_model, load_pose_model, load_violence_model, set_vocabulary,
+)
+
+logger = logging.getLogger(__name__)
+
+# Detections of the same kind closer than this are merged into one event
+EVENT_GAP_SECONDS = 1.0
+
+EVENT_KINDS = {
+    'violence': lambda record: [(d['confidence'], "Violence") for d in record['violence']],
+    'poseAnomaly': lambda record: [(p['confidence'], p['action']) for p in record['poses'] if p['anomaly']],
+    'anomaly': lambda record: [(o['confidence'], o['class']) for o in record['objects'] if o['anomaly']],
+}
+
+
+def read_batches(cap, batch_size, frame_stride=1, start_frame=0, end_frame=None):
+    """Yield (frame indices, frames) batches, skipping frames with grab() when striding"""
+    index = start_frame
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    indices, frames = [], []
+    while end_frame is None or index < end_frame:
+        if (index - start_frame) % frame_stride:
+            if not cap.grab():
+                break
+        else:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            indices.append(index)
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield indices, frames
+                indices, frames = [], []
+        index += 1
+
+    if frames:
+        yield indices, frames
+
+
+def _box(xyxy):
+    return [round(float(v), 1) for v in xyxy]
+
+
+def detect_batch(frames, violence_model, pose_model, anomaly_model, confidences, vocabulary=DEFAULT_VOCABULARY, imgsz=320):
+    """
+    Run all three models over a batch of frames and return one record per frame.
+    confidences maps 'violence', 'pose' and 'anomaly' to the live pipeline's thresholds;
+    anomaly membership is by class name in `vocabulary`, the anomaly model's class set.
+    """
+    violence_results = violence_model(frames, conf=confidences['violence'], imgsz=imgsz, verbose=False)
+    pose_results = pose_model(frames, conf=confidences['pose'], imgsz=imgsz, verbose=False)
+    anomaly_results = anomaly_model.predict(frames, imgsz=imgsz, conf=confidences['anomaly'], verbose=False)
+
+    records = []
+    for violence, pose, anomaly in zip(violence_results, pose_results, anomaly_results):
+        record = {'violence': [], 'poses': [], 'objects': []}
+
+        for box in violence.boxes:
+            if int(box.cls[0]) == VIOLENCE_CLASS:
+                record['violence'].append({
+                    'confidence': round(float(box.conf[0]), 3),
+                    'box': _box(box.xyxy[0].tolist()),
+                })
+
+        if pose.keypoints is not None:
+            for i, person in enumerate(pose.keypoints.data):
+                action = determine_action(person.cpu().numpy()[:, :2])
+                has_box = pose.boxes is not None and len(pose.boxes) > i
+                record['poses'].append({
+                    'action': action,
+                    'anomaly': action in ANOMALY_ACTIONS,
+                    'confidence': round(float(pose.boxes[i].conf[0]), 3) if has_box else None,
+                    'box': _box(pose.boxes[i].xyxy[0].tolist()) if has_box else None,
+                })
+
+        for box in anomaly.boxes:
+            name = anomaly.names[int(box.cls[0])]
+            record['objects'].append({
+                'class': name,
+                'anomaly': name in vocabulary.anomalies,
+                'confidence': round(float(box.conf[0]), 3),
+                'box': _box(box.xyxy[0].tolist()),
+            })
+
+        records.append(record)
+    return records
+
+
+def has_detections(record):
+    return bool(record['violence'] or record['poses'] or record['objects'])
+
+
+def build_events(records, gap_seconds=EVENT_GAP_SECONDS):
+    """Merge per-frame detections (ordered by frame) into events per detection kind"""
+    events = []
+    for kind, extract in EVENT_KINDS.items():
+        current = None
+        for record in records:
+            hits = extract(record)
+            if not hits:
+                continue
+            if current is not None and record['time'] - current['end'] <= gap_seconds:
+                current['end'] = record['time']
+                current['endFrame'] = record['frame']
+            else:
+                current = {
+                    'type': kind,
+                    'start': record['time'],
+                    'end': record['time'],
+                    'startFrame': record['frame'],
+                    'endFrame': record['frame'],
+                    'frames': 0,
+                    'peakConfidence': 0.0,
+                    'labels': set(),
+                }
+                events.append(current)
+            current['frames'] += 1
+            for confidence, label in hits:
+                current['peakConfidence'] = max(current['peakConfidence'], confidence or 0.0)
+                current['labels'].add(label)
+
+    for event in events:
+        event['labels'] = sorted(event['labels'])
+    events.sort(key=lambda event: (event['start'], event['type']))
+    return events
+
+
+def probe_video(path):
+    """Return fps, frame count and resolution of a video file"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video source {path}")
+    try:
+        return {
+            'fps': cap.get(cv2.CAP_PROP_FPS) or 25.0,
+            'frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        cap.release()
+
+
+def analyze_video(path, violence_model, pose_model, anomaly_model, confidences, vocabulary=DEFAULT_VOCABULARY,
+                  batch_size=8, frame_stride=1, imgsz=320, start_frame=0, end_frame=None, progress=None,
+                  should_stop=None):
+    """
+    Run the detection models over a video file as fast as possible.
+    The anomaly model must already be set to `vocabulary`.
+    Returns the video info, the frames that had detections and the merged events.
+    progress(processed, total, frames_per_second, eta_seconds) is called after every batch.
+    """
+    info = probe_video(path)
+    fps = info['fps']
+    last_frame = info['frames'] if end_frame is None else min(end_frame, info['frames'] or end_frame)
+    total = max(0, (last_frame - start_frame + frame_stride - 1) // frame_stride) if last_frame else 0
+
+    cap = cv2.VideoCapture(path)
+    records = []
+    processed = 0
+    started = time.perf_counter()
+    try:
+        for indices, frames in read_batches(cap, batch_size, frame_stride, start_frame, end_frame):
+            if should_stop is not None and should_stop():
+                break
+            for index, record in zip(indices, detect_batch(frames, violence_model, pose_model, anomaly_model,
+                                                               confidences, vocabulary, imgsz)):
+                if has_detections(record):
+                    record['frame'] = index
+                    record['time'] = round(index / fps, 3)
+                    records.append(record)
+            processed += len(frames)
+
+            if progress is not None:
+                elapsed = time.perf_counter() - started
+                rate = processed / elapsed if elapsed > 0 else 0.0
+                eta = (total - processed) / rate if rate > 0 and total else None
+                progress(processed, total, rate, eta)
+    finally:
+        cap.release()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'video': dict(info, path=path),
+        'settings': {'batchSize': batch_size, 'frameStride': frame_stride, 'imgsz': imgsz,
+                     'confidences': dict(confidences), 'vocabulary': vocabulary.name},
+        'processedFrames': processed,
+        'elapsedSeconds': round(elapsed, 3),
+        'framesPerSecond': round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        'frames': records,
+        'events': build_events(records),
+    }
+
+
+def keyframe_times(path):
+    """Return keyframe timestamps (seconds) using ffprobe, or an empty list if unavailable"""
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+        "-show_entries", "frame=pts_time", "-of", "csv=p=0", path,
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True, timeout=300).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Keyframe probe failed, splitting on plain frame boundaries: {e}")
+        return []
+    times = []
+    for line in output.splitlines():
+        value = line.strip().rstrip(',')
+        if value and value != "N/A":
+            times.append(float(value))
+    return sorted(times)
+
+
+def plan_segments(path, segments, frame_stride=1, min_segment_frames=250):
+    """
+    Split a video into at most `segments` frame ranges [start, end).
+    Boundaries are snapped to keyframes so each worker can seek exactly,
+    and to the stride grid so striding matches a single-pass run.
+    """
+    info = probe_video(path)
+    total, fps = info['frames'], info['fps']
+    if total <= 0:
+        raise ValueError("Video frame count is unknown, cannot split into segments")
+    segments = max(1, min(segments, total // min_segment_frames or 1))
+
+    keyframes = [int(round(t * fps)) for t in keyframe_times(path)]
+    boundaries = [0]
+    for i in range(1, segments):
+        target = total * i // segments
+        if keyframes:
+            pos = bisect.bisect_left(keyframes, target)
+            candidates = keyframes[max(0, pos - 1):pos + 1]
+            target = min(candidates, key=lambda frame: abs(frame - target))
+        target = -(-target // frame_stride) * frame_stride
+        if boundaries[-1] < target < total:
+            boundaries.append(target)
+    boundaries.append(total)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# Models loaded once per worker process, and the vocabulary the anomaly model is set to
+_segment_models = None
+_segment_vocabulary = None
+
+
+def _analyze_segment(path, start, end, confidences, vocabulary, batch_size, frame_stride, imgsz, device,
+                     segment_index, progress_queue):
+    """Worker process entry point: decode and analyze one segment with process-local models"""
+    global _segment_models, _segment_vocabulary
+    if _segment_models is None:
+        _segment_models = (load_violence_model(device), load_pose_model(device), load_anomaly_model(device, vocabulary))
+    elif _segment_vocabulary != vocabulary:
+        set_vocabulary(_segment_models[2], vocabulary)
+    _segment_vocabulary = vocabulary
+
+    def report(processed, total, rate, eta):
+        progress_queue.put((segment_index, processed))
+
+    result = analyze_video(path, *_segment_models, confidences, vocabulary, batch_size=batch_size, frame_stride=frame_stride,
+                           imgsz=imgsz, start_frame=start, end_frame=end, progress=report)
+    return segment_index, result['frames'], result['processedFrames']
+
+
+def merge_segments(segment_frames):
+    """Merge per-segment frame records into one ordered timeline, dropping duplicate frames"""
+    merged = {}
+    for frames in segment_frames:
+        for record in frames:
+            merged.setdefault(record['frame'], record)
+    return [merged[frame] for frame in sorted(merged)]
+
+
+def analyze_video_parallel(path, workers, device, confidences, vocabulary=DEFAULT_VOCABULARY, batch_size=8,
+                           frame_stride=1, imgsz=320, progress=None):
+    """
+    Analyze a video by splitting it into keyframe-aligned segments processed in
+    separate worker processes. Events are built after merging, so an event that
+    spans a segment boundary is counted once.
+    """
+    info = probe_video(path)
+    segments = plan_segments(path, workers, frame_stride)
+    total = sum((end - start + frame_stride - 1) // frame_stride for start, end in segments)
+    logger.info(f"Analyzing {path} in {len(segments)} segments on {workers} workers")
+
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    progress_queue = manager.Queue()
+    segment_progress = [0] * len(segments)
+    segment_results = [None] * len(segments)
+    started = time.perf_counter()
+
+    def drain_progress():
+        while True:
+            try:
+                index, processed = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            segment_progress[index] = max(segment_progress[index], processed)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            pending = {
+                executor.submit(_analyze_segment, path, start, end, confidences, vocabulary, batch_size,
+                                frame_stride, imgsz, device, index, progress_queue)
+                for index, (start, end) in enumerate(segments)
+            }
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, frames, processed = future.result()
+                    segment_results[index] = frames
+                    segment_progress[index] = processed
+                drain_progress()
+                if progress is not None:
+                    processed = sum(segment_progress)
+                    elapsed = time.perf_counter() - started
+                    rate = processed / elapsed if elapsed > 0 else 0.0
+                    eta = (total - processed) / rate if rate > 0 else None
+                    progress(processed, total, rate, eta)
+    finally:
+        manager.shutdown()
+
+    records = merge_segments(segment_results)
+    processed = sum(segment_progress)
+    elapsed = time.perf_counter() - started
+    return {
+        'video': dict(info, path=path),
+        'settings': {'batchSize': batch_size, 'frameStride': frame_stride, 'imgsz': imgsz,
+                     'confidences': dict(confidences), 'vocabulary': vocabulary.name, 'workers': workers, 'segments': [list(segment) for segment in segments]},
+        'processedFrames': processed,
+        'elapsedSeconds': round(elapsed, 3),
+        'framesPerSecond': round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        'frames': records,
+        'events': build_events(records),
+    }
+
+
+def timeline_rows(result):
+    """Flatten a timeline into one row per detection"""
+    rows = []
+    for record in result['frames']:
+        base = {'frame': record['frame'], 'time': record['time']}
+        for d in record['violence']:
+            rows.append(dict(base, kind='violence', label="Violence", anomaly=True, confidence=d['confidence'], box=d['box']))
+        for p in record['poses']:
+            rows.append(dict(base, kind='pose', label=p['action'], anomaly=p['anomaly'], confidence=p['confidence'], box=p['box']))
+        for o in record['objects']:
+            rows.append(dict(base, kind='object', label=o['class'], anomaly=o['anomaly'], confidence=o['confidence'], box=o['box']))
+    return rows
+
+
+def write_timeline(result, path, fmt="json"):
+    """Write an analysis result as JSON, or as a Parquet table of detections"""
+    if fmt == "json":
+        with open(path, 'w') as f:
+            json.dump(result, f)
+    elif fmt == "parquet":
+        import pandas as pd
+        try:
+            pd.DataFrame(timeline_rows(result)).to_parquet(path, index=False)
+        except ImportError as e:
+            raise ValueError(f"Parquet output requires pyarrow or fastparquet: {e}")
+    else:
+        raise ValueError(f"Unsupported timeline format: {fmt}")
+    return path
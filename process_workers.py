@@ -0,0 +1,319 @@
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER_FIELDS = 3  # write sequence, slot count, slot size
+SLOT_FIELDS = 6  # sequence, payload length, height, width, channels, timestamp (ns)
+
+
+class ShmRing:
+    """
+    Single-producer ring of fixed-size slots in shared memory. The producer
+    marks a slot as being written, copies the payload in and then publishes
+    its sequence number; a reader copies a slot out and checks the sequence
+    again, so it never returns a torn payload and never blocks the producer.
+    Payloads are raw bytes or a uint8 image, no pickling involved.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.slots = int(self.header[1])
+        self.slot_size = int(self.header[2])
+        self.meta = np.ndarray((self.slots, SLOT_FIELDS), dtype=np.int64, buffer=shm.buf,
+                               offset=HEADER_FIELDS * 8)
+        data_offset = (HEADER_FIELDS + self.slots * SLOT_FIELDS) * 8
+        self.data = np.ndarray((self.slots, self.slot_size), dtype=np.uint8, buffer=shm.buf, offset=data_offset)
+
+    @classmethod
+    def create(cls, slots, slot_size):
+        size = (HEADER_FIELDS + slots * SLOT_FIELDS) * 8 + slots * slot_size
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (-1, slots, slot_size)
+        del header
+        ring = cls(shm, owner=True)
+        ring.meta[:, 0] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        # The creating process owns the segment; keep this process's tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        return int(self.header[0])
+
+    def write(self, payload, shape=(0, 0, 0)):
+        """Publish bytes or a uint8 array; returns the sequence number, or None if it does not fit a slot"""
+        array = np.frombuffer(payload, dtype=np.uint8) if isinstance(payload, (bytes, bytearray)) else payload.reshape(-1)
+        if array.size > self.slot_size:
+            return None
+        seq = self.write_seq + 1
+        slot = seq % self.slots
+        meta = self.meta[slot]
+        meta[0] = -1
+        self.data[slot, :array.size] = array
+        meta[1:] = (array.size, *shape, time.time_ns())
+        meta[0] = seq
+        self.header[0] = seq
+        return seq
+
+    def read(self, seq):
+        """Copy out the payload of `seq` as (uint8 array, meta), or None if it was overwritten or not written yet"""
+        slot = seq % self.slots
+        if self.meta[slot, 0] != seq:
+            return None
+        meta = self.meta[slot].copy()
+        payload = self.data[slot, :meta[1]].copy()
+        if self.meta[slot, 0] != seq:
+            return None
+        return payload, meta
+
+    def read_frame(self, seq):
+        item = self.read(seq)
+        if item is None:
+            return None
+        payload, meta = item
+        return payload.reshape(int(meta[2]), int(meta[3]), int(meta[4])), meta[5] / 1e9
+
+    def close(self):
+        self.header = self.meta = self.data = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class RingPublisher:
+    """
+    Worker-process side: annotated frames go to the frame ring, snapshots,
+    events, stored snapshot entries and alert sends to the result ring, and
+    control commands from the API process are read from the command ring.
+    """
+
+    def __init__(self, frame_ring_name, result_ring_name, command_ring_name):
+        self.frames = ShmRing.attach(frame_ring_name)
+        self.results = ShmRing.attach(result_ring_name)
+        self.commands = ShmRing.attach(command_ring_name)
+        self._lock = threading.Lock()  # Events are published from store callbacks on other threads
+        self._oversized = False
+        # Commands sent before this process started are already part of its config
+        self._command_seq = self.commands.write_seq
+
+    def publish_frame(self, frame):
+        if self.frames.write(frame, frame.shape) is None and not self._oversized:
+            self._oversized = True
+            logger.warning(f"Frames of {frame.shape} do not fit the shared frame ring, live frames disabled")
+
+    def _publish(self, record):
+        """Write a record to the result ring; returns False if it was too large"""
+        data = json.dumps(record, default=str).encode('utf-8')
+        with self._lock:
+            if self.results.write(data) is None:
+                logger.warning(f"Dropping oversized {record.get('type')} record ({len(data)} bytes)")
+                return False
+        return True
+
+    def publish_snapshot(self, fields):
+        self._publish({'type': 'snapshot', 'snapshot': fields})
+
+    def publish_event(self, event):
+        self._publish({'type': 'event', 'event': event})
+
+    def publish_frame_entry(self, entry):
+        self._publish({'type': 'frame', 'entry': entry})
+
+    def publish_alert(self, call):
+        return self._publish({'type': 'alert', 'call': call})
+
+    def publish_profile(self, capture):
+        if not self._publish({'type': 'profile', 'capture': capture}):
+            # The artifacts are on disk either way; report the capture without its summary
+            self._publish({'type': 'profile', 'capture': {**capture, 'summary': {'truncated': True}}})
+
+    def take_commands(self):
+        """Commands sent by the API process since the last call, as (command, payload)"""
+        latest = self.commands.write_seq
+        if latest - self._command_seq > self.commands.slots:
+            logger.warning(f"Missed {latest - self._command_seq - self.commands.slots} control commands")
+            self._command_seq = latest - self.commands.slots
+        commands = []
+        while self._command_seq < latest:
+            self._command_seq += 1
+            item = self.commands.read(self._command_seq)
+            if item is None:
+                continue
+            record = json.loads(item[0].tobytes())
+            commands.append((record['command'], record['payload']))
+        return commands
+
+    def close(self):
+        self.frames.close()
+        self.results.close()
+        self.commands.close()
+
+
+def _process_main(target, config, frame_ring_name, result_ring_name, command_ring_name, stop_event):
+    publisher = RingPublisher(frame_ring_name, result_ring_name, command_ring_name)
+    try:
+        exit_code = target(config, publisher, stop_event)
+    finally:
+        publisher.close()
+    raise SystemExit(exit_code or 0)
+
+
+class StreamProcess:
+    """
+    Runs one stream's capture and inference in a child process and supervises
+    it. `target(config, publisher, stop_event)` is the child entry point; a
+    thread in the API process drains the result ring into `on_record` and
+    restarts the child with exponential backoff when it dies abnormally, up
+    to `max_restarts` times. `on_exit(status)` is called once the stream ends
+    for good ("stopped" or "failed"). `config_for_restart()` may refresh the
+    config (e.g. counters so far) before a restart. `send_command` passes
+    control commands to the running child through a third ring; a restarted
+    child only sees commands sent after it started, so the refreshed config
+    must carry their effect.
+    """
+
+    def __init__(self, session_id, target, config, on_record, on_exit, config_for_restart=None,
+                 frame_slots=4, frame_bytes=1920 * 1080 * 3, result_slots=512, result_bytes=16 * 1024,
+                 command_slots=64, command_bytes=4 * 1024, max_restarts=5, backoff=1.0, poll_interval=0.02):
+        self.session_id = session_id
+        self.target = target
+        self.config = config
+        self.on_record = on_record
+        self.on_exit = on_exit
+        self.config_for_restart = config_for_restart
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.frames = ShmRing.create(frame_slots, frame_bytes)
+        self.results = ShmRing.create(result_slots, result_bytes)
+        self.commands = ShmRing.create(command_slots, command_bytes)
+        self._command_lock = threading.Lock()
+        self.restarts = 0
+        self.lost_records = 0
+        self.process = None
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._stopping = threading.Event()
+        self._read_seq = -1
+        self._thread = None
+
+    def start(self):
+        self._spawn()
+        self._thread = threading.Thread(target=self._supervise, name=f"supervisor-{self.session_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def _spawn(self):
+        self.process = self._context.Process(
+            target=_process_main, name=f"stream-{self.session_id[:8]}",
+            args=(self.target, self.config, self.frames.name, self.results.name, self.commands.name, self._stop_event),
+            daemon=True)
+        self.process.start()
+        logger.info(f"Started worker process {self.process.pid} for session {self.session_id}")
+
+    def _drain(self):
+        latest = self.results.write_seq
+        if latest - self._read_seq > self.results.slots:
+            self.lost_records += latest - self._read_seq - self.results.slots
+            self._read_seq = latest - self.results.slots
+        while self._read_seq < latest:
+            self._read_seq += 1
+            item = self.results.read(self._read_seq)
+            if item is None:
+                self.lost_records += 1
+                continue
+            try:
+                self.on_record(json.loads(item[0].tobytes()))
+            except Exception as e:
+                logger.error(f"Error applying record from session {self.session_id}: {e}")
+
+    def _supervise(self):
+        status = "stopped"
+        while True:
+            while self.process.is_alive():
+                self._drain()
+                time.sleep(self.poll_interval)
+            self.process.join()
+            self._drain()
+            exit_code = self.process.exitcode
+            if self._stopping.is_set() or exit_code == 0:
+                break
+            if self.restarts >= self.max_restarts:
+                logger.error(f"Worker for session {self.session_id} exited with {exit_code}, giving up after {self.restarts} restarts")
+                status = "failed"
+                break
+            delay = self.backoff * 2 ** self.restarts
+            self.restarts += 1
+            logger.warning(f"Worker for session {self.session_id} exited with {exit_code}, restarting in {delay:.1f}s")
+            if self._stopping.wait(delay):
+                break
+            if self.config_for_restart is not None:
+                self.config = self.config_for_restart()
+            self._spawn()
+        try:
+            self.on_exit(status)
+        finally:
+            self.frames.close()
+            self.results.close()
+            with self._command_lock:
+                self.commands.close()
+
+    def send_command(self, command, payload=None):
+        """Queue a control command for the worker; returns False if the session has ended or it is too large"""
+        data = json.dumps({'command': command, 'payload': payload or {}}).encode('utf-8')
+        with self._command_lock:
+            if self.commands.header is None:
+                return False
+            if self.commands.write(data) is None:
+                logger.warning(f"Dropping oversized {command} command ({len(data)} bytes) for session {self.session_id}")
+                return False
+        return True
+
+    def latest_frame(self):
+        """Most recent annotated frame and its capture time, or None"""
+        if self.frames.shm is None or self.frames.header is None:
+            return None
+        seq = self.frames.write_seq
+        return self.frames.read_frame(seq) if seq >= 0 else None
+
+    def stop(self, timeout=10):
+        """Ask the worker to stop, killing it if it does not exit within `timeout`"""
+        self._stopping.set()
+        self._stop_event.set()
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                logger.warning(f"Worker for session {self.session_id} did not stop, terminating it")
+                self.process.terminate()
+                self.process.join(5)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def to_dict(self):
+        return {
+            'pid': self.process.pid if self.process is not None else None,
+            'alive': self.process is not None and self.process.is_alive(),
+            'restarts': self.restarts,
+            'lostRecords': self.lost_records,
+        }
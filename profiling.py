@@ -0,0 +1,187 @@
+import cProfile
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCapture:
+    """
+    Time-boxed cProfile (and optionally torch profiler) capture of one session.
+    The capture is started and stopped from the session's worker thread via
+    tick(), because cProfile only sees the thread that enables it. Work the
+    session hands to other threads (the model executor) is profiled through
+    profile_call() and merged into the same pstats. Sessions without a
+    capture pay a single attribute check per frame.
+
+    A session in a worker process runs the capture there under the same
+    `capture_id`; the API process keeps a copy that follows it through
+    `mirror()`. `on_finish(capture)` is called once the capture is over.
+    """
+
+    def __init__(self, session_id, duration, output_dir, torch_profiler=True, top_n=25, capture_id=None, on_finish=None):
+        self.capture_id = capture_id or uuid.uuid4().hex
+        self.session_id = session_id
+        self.duration = duration
+        self.output_dir = output_dir
+        self.torch_profiler = torch_profiler
+        self.top_n = top_n
+        self.status = "pending"
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames = 0
+        self.artifacts = {}
+        self.summary = {}
+        self.on_finish = on_finish
+        self._profiler = None
+        self._torch_profiler = None
+        self._thread_profilers = {}  # thread id -> idle cProfile.Profile; None once finished
+        self._thread_lock = threading.Lock()
+        self._deadline = None
+        self._done = threading.Event()
+
+    def tick(self):
+        """Called once per frame by the worker; returns False once the capture is finished"""
+        if self.status == "pending":
+            self._start()
+            return True
+        self.frames += 1
+        if time.perf_counter() >= self._deadline:
+            self.finish()
+            return False
+        return True
+
+    def _start(self):
+        self.started_at = time.time()
+        self._deadline = time.perf_counter() + self.duration
+        self.status = "running"
+        if self.torch_profiler:
+            try:
+                import torch
+                activities = [torch.profiler.ProfilerActivity.CPU]
+                if torch.cuda.is_available():
+                    activities.append(torch.profiler.ProfilerActivity.CUDA)
+                self._torch_profiler = torch.profiler.profile(activities=activities)
+                self._torch_profiler.__enter__()
+            except Exception as e:
+                logger.warning(f"Torch profiler unavailable, capturing Python side only: {e}")
+                self._torch_profiler = None
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def profile_call(self, fn, *args):
+        """Run fn(*args) on the calling thread under that thread's profiler while the capture is running"""
+        ident = threading.get_ident()
+        with self._thread_lock:
+            if self.status != "running" or self._thread_profilers is None:
+                profiler = None
+            else:
+                # Taken out while in use, so that finish() only merges idle profilers
+                profiler = self._thread_profilers.pop(ident, None) or cProfile.Profile()
+        if profiler is None:
+            return fn(*args)
+        profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+            with self._thread_lock:
+                if self._thread_profilers is not None:
+                    self._thread_profilers[ident] = profiler
+
+    def finish(self):
+        """Stop profiling and write the artifacts and summary"""
+        if self.status != "running":
+            if self.status == "pending":
+                self.status = "failed"
+                self.error = "Session ended before the capture completed"
+                self.finished_at = time.time()
+                self._done.set()
+                if self.on_finish is not None:
+                    self.on_finish(self)
+            return
+        try:
+            self._profiler.disable()
+            with self._thread_lock:
+                thread_profilers, self._thread_profilers = self._thread_profilers, None
+            if self._torch_profiler is not None:
+                self._torch_profiler.__exit__(None, None, None)
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, f"profile_{self.session_id}_{self.capture_id}")
+            self.artifacts['pstats'] = f"{base}.pstats"
+            stats = pstats.Stats(self._profiler)
+            for profiler in thread_profilers.values():
+                stats.add(profiler)
+            stats.dump_stats(self.artifacts['pstats'])
+            self.summary['python'] = self._python_summary(stats)
+
+            if self._torch_profiler is not None:
+                self.artifacts['trace'] = f"{base}.trace.json"
+                self._torch_profiler.export_chrome_trace(self.artifacts['trace'])
+                self.summary['torch'] = self._torch_profiler.key_averages().table(
+                    sort_by="self_cpu_time_total", row_limit=self.top_n)
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.error(f"Error finishing profile capture: {e}")
+        finally:
+            self._profiler = None
+            self._torch_profiler = None
+            self.finished_at = time.time()
+            self._done.set()
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def mirror(self, fields):
+        """Take over the state of this capture as run in a worker process (`to_dict(paths=True)` there)"""
+        self.status = fields['status']
+        self.error = fields['error']
+        self.frames = fields['frames']
+        self.started_at = fields['startedAt']
+        self.finished_at = fields['finishedAt']
+        self.artifacts = fields.get('artifactPaths') or {}
+        self.summary = fields['summary']
+        if self.status in ("done", "failed"):
+            self._done.set()
+
+    def _python_summary(self, stats):
+        stats.sort_stats("cumulative")
+        rows = []
+        for (filename, line, function), (cc, nc, tt, ct, _) in stats.stats.items():
+            rows.append({
+                'function': f"{os.path.basename(filename)}:{line}({function})",
+                'calls': nc,
+                'totalSeconds': round(tt, 6),
+                'cumulativeSeconds': round(ct, 6),
+            })
+        rows.sort(key=lambda row: row['cumulativeSeconds'], reverse=True)
+        return rows[:self.top_n]
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self, paths=False):
+        fields = {
+            'captureId': self.capture_id,
+            'sessionId': self.session_id,
+            'status': self.status,
+            'error': self.error,
+            'duration': self.duration,
+            'frames': self.frames,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+            'artifacts': sorted(self.artifacts),
+            'summary': self.summary,
+        }
+        if paths:
+            fields['artifactPaths'] = dict(self.artifacts)
+        return fields
@@ -0,0 +1,122 @@
+import cv2
+import numpy as np
+
+
+def to_pixels(polygon, width, height):
+    """Polygon as an int32 (N, 2) array in pixels; coordinates all within 0..1 are taken as normalized"""
+    points = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3:
+        raise ValueError("A polygon needs at least three points")
+    if points.max() <= 1.0:
+        points = points * (width, height)
+    return np.round(points).astype(np.int32)
+
+
+def merge_rects(rects):
+    """Merge overlapping (x1, y1, x2, y2) rectangles until none overlap, so crops never duplicate detections"""
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+class RegionMask:
+    """
+    Regions of interest and exclusion zones of one camera. Models run only on
+    the bounding crops of the ROI polygons (padded by `padding` pixels), and
+    detections whose box center falls outside the ROIs or inside an exclusion
+    are dropped with a single lookup into a precomputed mask. Without ROIs the
+    whole frame is one crop and only the exclusions apply.
+    """
+
+    def __init__(self, rois=None, exclusions=None, padding=16):
+        self.rois = rois or []
+        self.exclusions = exclusions or []
+        self.padding = padding
+        self._shape = None
+        self.mask = None
+        self.rects = []
+
+    def prepare(self, shape):
+        """Rasterize the polygons for a frame size; cached until the size changes"""
+        height, width = shape[:2]
+        if self._shape == (height, width):
+            return
+        rois = [to_pixels(polygon, width, height) for polygon in self.rois]
+        exclusions = [to_pixels(polygon, width, height) for polygon in self.exclusions]
+        mask = np.zeros((height, width), dtype=np.uint8)
+        if rois:
+            cv2.fillPoly(mask, rois, 1)
+        else:
+            mask[:] = 1
+        if exclusions:
+            cv2.fillPoly(mask, exclusions, 0)
+
+        rects = []
+        for polygon in rois:
+            x, y, w, h = cv2.boundingRect(polygon)
+            rects.append((max(0, x - self.padding), max(0, y - self.padding),
+                          min(width, x + w + self.padding), min(height, y + h + self.padding)))
+        self.rects = merge_rects(rects) if rects else [(0, 0, width, height)]
+        self.mask = mask
+        self._shape = (height, width)
+
+    def crops(self, frame):
+        """Views of the frame for each crop, and their (x, y) offsets"""
+        self.prepare(frame.shape)
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.rects], [(x1, y1) for x1, y1, _, _ in self.rects]
+
+    def contains(self, points):
+        """Boolean array: which (N, 2) pixel points lie inside the ROIs and outside the exclusions"""
+        points = np.asarray(points)
+        if len(points) == 0:
+            return np.zeros(0, dtype=bool)
+        height, width = self.mask.shape
+        xs = np.clip(points[:, 0].astype(np.int64), 0, width - 1)
+        ys = np.clip(points[:, 1].astype(np.int64), 0, height - 1)
+        return self.mask[ys, xs].astype(bool)
+
+    def merge(self, frame, results, offsets):
+        """Map per-crop ultralytics Results back to frame coordinates as one Results, masked by the regions"""
+        import torch
+        from ultralytics.engine.results import Results
+
+        first = results[0]
+        with_keypoints = first.keypoints is not None
+        boxes, keypoints = [], []
+        for result, (x, y) in zip(results, offsets):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            data = result.boxes.data.clone()
+            data[:, [0, 2]] += x
+            data[:, [1, 3]] += y
+            boxes.append(data)
+            if with_keypoints:
+                points = result.keypoints.data.clone()
+                # Undetected keypoints are (0, 0); keep them there
+                present = (points[..., 0] != 0) | (points[..., 1] != 0)
+                points[..., 0] += present * x
+                points[..., 1] += present * y
+                keypoints.append(points)
+
+        if boxes:
+            boxes = torch.cat(boxes)
+            centers = ((boxes[:, 0:2] + boxes[:, 2:4]) / 2).cpu().numpy()
+            keep = torch.from_numpy(self.contains(centers)).to(boxes.device)
+            boxes = boxes[keep]
+            keypoints = torch.cat(keypoints)[keep] if with_keypoints else None
+        else:
+            boxes = first.boxes.data[:0] if first.boxes is not None else torch.zeros((0, 6))
+            keypoints = first.keypoints.data[:0] if with_keypoints else None
+        return Results(frame, path=first.path, names=first.names, boxes=boxes, keypoints=keypoints)
@@ -0,0 +1,154 @@
+"""
+Startup benchmark of the surveillance API.
+
+Measures how long `import api` takes, broken down per top-level package with
+`python -X importtime`, and how long uvicorn takes from launch until
+/api/status answers. Every measurement runs in a fresh subprocess:
+
+    python startup_benchmark.py
+    python startup_benchmark.py --save-baseline startup_baseline.json
+    python startup_benchmark.py --baseline startup_baseline.json   # exit 1 on regression
+
+The server is started with WARM_UP=false so that the background imports do
+not compete with the measurement.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_LINE = "import time:"
+
+
+def api_env(**overrides):
+    env = dict(os.environ, WARM_UP="false", **overrides)
+    return env
+
+
+def import_times():
+    """Wall time of `import api` and the import time of every top-level package, in ms"""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api"],
+                          capture_output=True, text=True, env=api_env())
+    elapsed = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith(IMPORT_LINE) or "cumulative" in line:
+            continue
+        self_us, _, name = line[len(IMPORT_LINE):].split("|")
+        # Everything is nested under api; each module's own time is charged to its package
+        package = name.strip().split(".")[0]
+        modules[package] = modules.get(package, 0) + int(self_us) / 1000
+    return elapsed, modules
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_listen(timeout):
+    """Seconds from launching uvicorn until /api/status answers"""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=api_env())
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(proc.stderr.read().decode().strip().splitlines()[-1])
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/status", timeout=1):
+                    return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        raise RuntimeError(f"API did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run(args):
+    imports, listen, modules = [], [], {}
+    for index in range(args.runs):
+        print(f"Run {index + 1}/{args.runs}...", file=sys.stderr)
+        elapsed, per_module = import_times()
+        imports.append(elapsed)
+        for name, ms in per_module.items():
+            modules.setdefault(name, []).append(ms)
+        listen.append(time_to_listen(args.timeout) * 1000)
+    slowest = sorted(((name, float(statistics.median(values))) for name, values in modules.items()),
+                     key=lambda item: item[1], reverse=True)[:args.top]
+    return {
+        'meta': {
+            'createdAt': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'runs': args.runs,
+        },
+        'importMs': round(float(statistics.median(imports)), 1),
+        'listenMs': round(float(statistics.median(listen)), 1),
+        'modulesMs': {name: round(ms, 1) for name, ms in slowest},
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return regressions of import and time-to-listen beyond tolerance"""
+    regressions = []
+    for key in ('importMs', 'listenMs'):
+        if report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {baseline[key]} -> {report[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the surveillance API's import and startup time")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Slowest top-level packages to report")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the API to answer")
+    parser.add_argument("--output", default="startup_results.json")
+    parser.add_argument("--baseline", help="Compare against this baseline file")
+    parser.add_argument("--save-baseline", help="Write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    print(f"import api      {report['importMs']:>9.1f} ms")
+    print(f"listening after {report['listenMs']:>9.1f} ms")
+    for name, ms in report['modulesMs'].items():
+        print(f"  {name:<24} {ms:>9.1f} ms")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"{baseline['listenMs'] / report['listenMs']:.1f}x faster to listen than the baseline")
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
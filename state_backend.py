@@ -0,0 +1,266 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+
+class StateBackend:
+    """
+    Session state shared between API workers: which worker owns each session,
+    the latest snapshot of every session, job progress, and control commands
+    addressed to the worker that owns a session. Owners publish periodically
+    from a background thread; readers never touch the inference hot path.
+    """
+
+    # Whether other processes can see what this backend stores
+    shared = False
+
+    def publish_session(self, session_id: str, owner: str, info: dict):
+        raise NotImplementedError
+
+    def reserve_session(self, session_id: str, owner: str, info: dict, limit: int,
+                        max_age: Optional[float] = None) -> bool:
+        """
+        Publish a new session only if fewer than `limit` sessions (refreshed
+        within max_age seconds) are published, atomically across workers.
+        Returns whether the slot was taken.
+        """
+        raise NotImplementedError
+
+    def remove_session(self, session_id: str):
+        raise NotImplementedError
+
+    def sessions(self, max_age: Optional[float] = None) -> list:
+        """Published sessions with 'owner' and 'updatedAt', optionally only those refreshed within max_age seconds"""
+        raise NotImplementedError
+
+    def publish_snapshot(self, session_id: str, fields: dict):
+        raise NotImplementedError
+
+    def snapshots(self) -> dict:
+        """session_id -> snapshot fields"""
+        raise NotImplementedError
+
+    def publish_job(self, job: dict):
+        raise NotImplementedError
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew a named lease for ttl seconds; False while another owner holds it"""
+        raise NotImplementedError
+
+    def send_command(self, session_id: str, command: str, payload: Optional[dict] = None) -> Optional[str]:
+        """Queue a command for the session's owner; returns the owner, or None if nobody owns the session"""
+        raise NotImplementedError
+
+    def take_commands(self, owner: str) -> list:
+        """Remove and return the (session_id, command, payload) queued for an owner"""
+        raise NotImplementedError
+
+
+class InProcessStateBackend(StateBackend):
+    """State kept in this process only: the default, single-worker deployment"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._snapshots = {}
+        self._jobs = {}
+        self._commands = defaultdict(list)
+        self._leases = {}  # name -> (owner, expires at)
+        self._lock = threading.Lock()
+
+    def publish_session(self, session_id, owner, info):
+        with self._lock:
+            self._sessions[session_id] = {**info, 'owner': owner, 'updatedAt': time.time()}
+
+    def reserve_session(self, session_id, owner, info, limit, max_age=None):
+        now = time.time()
+        with self._lock:
+            live = [other for other in self._sessions.values() if max_age is None or now - other['updatedAt'] <= max_age]
+            if len(live) >= limit:
+                return False
+            self._sessions[session_id] = {**info, 'owner': owner, 'updatedAt': now}
+            return True
+
+    def remove_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sessions(self, max_age=None):
+        now = time.time()
+        with self._lock:
+            return [dict(info) for info in self._sessions.values()
+                    if max_age is None or now - info['updatedAt'] <= max_age]
+
+    def publish_snapshot(self, session_id, fields):
+        with self._lock:
+            self._snapshots[session_id] = dict(fields)
+
+    def snapshots(self):
+        with self._lock:
+            return {session_id: dict(fields) for session_id, fields in self._snapshots.items()}
+
+    def publish_job(self, job):
+        with self._lock:
+            self._jobs[job['jobId']] = dict(job)
+
+    def get_job(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        with self._lock:
+            holder, expires_at = self._leases.get(name, (None, 0.0))
+            if holder not in (None, owner) and expires_at > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def send_command(self, session_id, command, payload=None):
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is None:
+                return None
+            self._commands[info['owner']].append((session_id, command, payload or {}))
+            return info['owner']
+
+    def take_commands(self, owner):
+        with self._lock:
+            return self._commands.pop(owner, [])
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    State in a local SQLite database (WAL mode) that every API worker on the
+    host opens, so any worker can serve status and control for any session.
+    Each thread uses its own connection.
+    """
+
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY, owner TEXT NOT NULL, info TEXT NOT NULL, updated_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS snapshots (
+            session_id TEXT PRIMARY KEY, fields TEXT NOT NULL, updated_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, job TEXT NOT NULL, updated_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT NOT NULL, session_id TEXT NOT NULL,
+            command TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS commands_owner ON commands (owner);
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+    """
+
+    def __init__(self, path, history_size=500):
+        self.path = path
+        self.history_size = history_size
+        self._local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def publish_session(self, session_id, owner, info):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (session_id, owner, info, updated_at) VALUES (?, ?, ?, ?)",
+            (session_id, owner, json.dumps(info, default=str), time.time()))
+
+    def reserve_session(self, session_id, owner, info, limit, max_age=None):
+        connection = self._connect()
+        now = time.time()
+        # The write lock is taken before counting, so two workers cannot both take the last slot
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            live = connection.execute("SELECT count(*) FROM sessions WHERE updated_at >= ?",
+                                      (now - max_age if max_age is not None else float('-inf'),)).fetchone()[0]
+            if live >= limit:
+                connection.execute("ROLLBACK")
+                return False
+            connection.execute("INSERT OR REPLACE INTO sessions (session_id, owner, info, updated_at) VALUES (?, ?, ?, ?)",
+                               (session_id, owner, json.dumps(info, default=str), now))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return True
+
+    def remove_session(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def sessions(self, max_age=None):
+        rows = self._connect().execute("SELECT owner, info, updated_at FROM sessions").fetchall()
+        now = time.time()
+        return [{**json.loads(info), 'owner': owner, 'updatedAt': updated_at}
+                for owner, info, updated_at in rows if max_age is None or now - updated_at <= max_age]
+
+    def publish_snapshot(self, session_id, fields):
+        connection = self._connect()
+        connection.execute("INSERT OR REPLACE INTO snapshots (session_id, fields, updated_at) VALUES (?, ?, ?)",
+                           (session_id, json.dumps(fields), time.time()))
+        # Keep the newest snapshots only, like jobs
+        connection.execute("DELETE FROM snapshots WHERE session_id NOT IN "
+                           "(SELECT session_id FROM snapshots ORDER BY updated_at DESC LIMIT ?)", (self.history_size,))
+
+    def snapshots(self):
+        rows = self._connect().execute("SELECT session_id, fields FROM snapshots ORDER BY updated_at").fetchall()
+        return {session_id: json.loads(fields) for session_id, fields in rows}
+
+    def publish_job(self, job):
+        connection = self._connect()
+        connection.execute("INSERT OR REPLACE INTO jobs (job_id, job, updated_at) VALUES (?, ?, ?)",
+                           (job['jobId'], json.dumps(job, default=str), time.time()))
+        # Keep the newest jobs only
+        connection.execute("DELETE FROM jobs WHERE job_id NOT IN (SELECT job_id FROM jobs ORDER BY updated_at DESC LIMIT ?)",
+                           (self.history_size,))
+
+    def get_job(self, job_id):
+        row = self._connect().execute("SELECT job FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        # Takes the lease if it is free, expired or already ours, in a single statement
+        cursor = self._connect().execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+            (name, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def send_command(self, session_id, command, payload=None):
+        connection = self._connect()
+        row = connection.execute("SELECT owner FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        connection.execute("INSERT INTO commands (owner, session_id, command, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                           (row[0], session_id, command, json.dumps(payload or {}), time.time()))
+        return row[0]
+
+    def take_commands(self, owner):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("SELECT id, session_id, command, payload FROM commands WHERE owner = ? ORDER BY id",
+                                      (owner,)).fetchall()
+            if rows:
+                connection.execute(f"DELETE FROM commands WHERE id IN ({','.join('?' * len(rows))})",
+                                   [row[0] for row in rows])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return [(session_id, command, json.loads(payload)) for _, session_id, command, payload in rows]
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class SessionSnapshot:
+    """
+    Immutable view of one surveillance session.
+    A new instance is published for every change, so readers never need a lock.
+    """
+
+    session_id: str
+    running: bool = False
+    source: str = ""
+    violence: int = 0
+    pose_anomalies: int = 0
+    other_anomalies: int = 0
+    frames_processed: int = 0
+    fps: float = 0.0
+    started_at: float = 0.0
+    updated_at: float = 0.0
+    last_violence_at: Optional[float] = None
+    last_pose_anomaly_at: Optional[float] = None
+    last_anomaly_at: Optional[float] = None
+    violence_latency_ms: float = 0.0
+    pose_latency_ms: float = 0.0
+    anomaly_latency_ms: float = 0.0
+
+    @property
+    def detections(self) -> dict:
+        """Detection counters in the shape used by the REST API."""
+        return {
+            'violence': self.violence,
+            'poseAnomalies': self.pose_anomalies,
+            'otherAnomalies': self.other_anomalies,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'sessionId': self.session_id,
+            'running': self.running,
+            'source': self.source,
+            'detections': self.detections,
+            'framesProcessed': self.frames_processed,
+            'fps': round(self.fps, 2),
+            'startedAt': self.started_at,
+            'updatedAt': self.updated_at,
+            'lastDetection': {
+                'violence': self.last_violence_at,
+                'poseAnomalies': self.last_pose_anomaly_at,
+                'otherAnomalies': self.last_anomaly_at,
+            },
+            'latencyMs': {
+                'violence': round(self.violence_latency_ms, 2),
+                'pose': round(self.pose_latency_ms, 2),
+                'anomaly': round(self.anomaly_latency_ms, 2),
+            },
+        }
+
+
+EMPTY_SNAPSHOT = SessionSnapshot(session_id="")
+
+
+class SnapshotStore:
+    """
+    Holds the latest snapshot per session behind a single reference.
+    Writers copy-on-write and swap the reference; readers just load it.
+    Snapshots of finished (not running) sessions are kept for the last
+    `history_size` of them only.
+    """
+
+    def __init__(self, history_size: int = 100):
+        self.history_size = history_size
+        self._snapshots = MappingProxyType({})
+        self._latest = EMPTY_SNAPSHOT
+        self._finished: "OrderedDict[str, None]" = OrderedDict()  # oldest first
+        self._write_lock = threading.Lock()
+
+    def _swap(self, snapshots: dict, snapshot: SessionSnapshot):
+        """Install a new mapping that contains `snapshot`, dropping the oldest finished sessions beyond the history"""
+        if snapshot.running:
+            self._finished.pop(snapshot.session_id, None)
+        else:
+            self._finished[snapshot.session_id] = None
+            self._finished.move_to_end(snapshot.session_id)
+            while len(self._finished) > self.history_size:
+                session_id, _ = self._finished.popitem(last=False)
+                snapshots.pop(session_id, None)
+        self._snapshots = MappingProxyType(snapshots)
+        self._latest = snapshot if snapshot.session_id in snapshots else EMPTY_SNAPSHOT
+
+    def publish(self, snapshot: SessionSnapshot) -> SessionSnapshot:
+        """Publish a complete snapshot for its session."""
+        with self._write_lock:
+            snapshots = dict(self._snapshots)
+            snapshots[snapshot.session_id] = snapshot
+            self._swap(snapshots, snapshot)
+        return snapshot
+
+    def update(self, session_id: str, **changes) -> SessionSnapshot:
+        """Publish a copy of the session's snapshot with some fields changed."""
+        with self._write_lock:
+            current = self._snapshots.get(session_id) or SessionSnapshot(session_id=session_id)
+            snapshot = replace(current, updated_at=time.time(), **changes)
+            snapshots = dict(self._snapshots)
+            snapshots[session_id] = snapshot
+            self._swap(snapshots, snapshot)
+        return snapshot
+
+    def remove(self, session_id: str):
+        """Forget a session's snapshot."""
+        with self._write_lock:
+            snapshots = dict(self._snapshots)
+            removed = snapshots.pop(session_id, None)
+            self._finished.pop(session_id, None)
+            self._snapshots = MappingProxyType(snapshots)
+            if removed is not None and self._latest.session_id == session_id:
+                self._latest = EMPTY_SNAPSHOT
+
+    def get(self, session_id: Optional[str] = None) -> SessionSnapshot:
+        """Return a session's snapshot, or the most recently published one."""
+        if session_id is None:
+            return self._latest
+        return self._snapshots.get(session_id, EMPTY_SNAPSHOT)
+
+    def all(self):
+        """Return a read-only mapping of session id to snapshot."""
+        return self._snapshots
@@ -0,0 +1,210 @@
+import logging
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def is_live_source(source):
+    """Cameras and network streams, as opposed to files that simply end"""
+    return isinstance(source, int) or str(source).lower().startswith(("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://", "synthetic://"))
+
+
+def frame_thumbnail(frame, size=64):
+    """Small grayscale copy of a frame for cheap frame-to-frame comparison"""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def frame_difference(a, b):
+    """Mean absolute difference of two thumbnails, in gray levels"""
+    return float(cv2.absdiff(a, b).mean())
+
+
+class StreamWatchdog:
+    """
+    Wraps a session's capture and keeps a live stream healthy without ending
+    the session. Every frame is timestamped when read, and its lag behind
+    real time is estimated from the stream clock (or the frame count and
+    fps). When the lag exceeds `max_lag` the buffered frames are grabbed and
+    dropped. Reads that block for more than `stale_seconds` are counted as
+    stalls. A stream that fails to read, or whose frames stay within
+    `freeze_tolerance` gray levels (mean absolute difference of thumbnails)
+    of each other for `freeze_seconds`, is reopened with exponential
+    backoff; the caller's state (models, counters, alert bookkeeping) is
+    untouched. If the picture is still the same after such a reconnect the
+    camera is taken to watch a static scene, and only read failures and
+    stalls reconnect it until the picture changes. freeze_seconds=0 turns
+    freeze detection off. Files are only timestamped: their end is the end
+    of the session.
+    """
+
+    def __init__(self, open_capture, live, stop_event, on_open=None, stale_seconds=10.0, freeze_seconds=60.0,
+                 freeze_tolerance=1.0, max_lag=2.0, backoff=1.0, max_backoff=30.0, max_reconnects=None):
+        self.open_capture = open_capture
+        self.live = live
+        self.stop_event = stop_event
+        self.on_open = on_open
+        self.stale_seconds = stale_seconds
+        self.freeze_seconds = freeze_seconds
+        self.freeze_tolerance = freeze_tolerance
+        self.max_lag = max_lag
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_reconnects = max_reconnects
+        self.cap = None
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.frozen = 0
+        self.stale = 0
+        self.flushed_frames = 0
+        self.lag = 0.0
+        self.last_frame_at = None
+        self.last_error = None
+        self.static_scene = False
+        self._still = None  # Thumbnail the picture has stayed close to, and since when
+        self._still_since = None
+        self._frozen = None  # Thumbnail of the picture that triggered a freeze reconnect
+        self._clock = None  # (wall time, stream seconds) when lag tracking (re)started
+        self._frames_read = 0
+
+    def open(self):
+        """Open the capture; returns False if it could not be opened"""
+        cap = self.open_capture()
+        if cap is None or not cap.isOpened():
+            if cap is not None:
+                cap.release()
+            return False
+        self.cap = cap
+        self._still = None
+        self._still_since = None
+        self._clock = None
+        self._frames_read = 0
+        self.last_frame_at = time.time()
+        if self.on_open is not None:
+            self.on_open(cap)
+        return True
+
+    def _stream_seconds(self):
+        position = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if position and position > 0:
+            return position / 1000
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        return self._frames_read / fps if fps and fps > 0 else None
+
+    def _update_lag(self, now):
+        stream_seconds = self._stream_seconds()
+        if stream_seconds is None:
+            return
+        if self._clock is None:
+            self._clock = (now, stream_seconds)
+            return
+        # Positive when frames are consumed slower than the source produces them
+        self.lag = max(0.0, (now - self._clock[0]) - (stream_seconds - self._clock[1]))
+
+    def _flush(self):
+        """Drop the frames buffered while we were falling behind"""
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        count = min(int(self.lag * fps), int(fps * 10))
+        dropped = 0
+        for _ in range(count):
+            if not self.cap.grab():
+                break
+            dropped += 1
+        self.flushed_frames += dropped
+        logger.warning(f"Stream lagging {self.lag:.1f}s behind, dropped {dropped} buffered frames")
+        self._clock = None
+        self._frames_read += dropped
+        self.lag = 0.0
+
+    def _reconnect(self, reason):
+        """Reopen the stream with exponential backoff; returns False if stopped or out of attempts"""
+        self.last_error = reason
+        logger.warning(f"Stream unhealthy ({reason}), reconnecting")
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        while not self.stop_event.is_set():
+            if self.max_reconnects is not None and self.failed_attempts >= self.max_reconnects:
+                logger.error(f"Giving up on stream after {self.failed_attempts} failed reconnects")
+                return False
+            delay = min(self.max_backoff, self.backoff * 2 ** self.failed_attempts)
+            if self.stop_event.wait(delay):
+                return False
+            if self.open():
+                self.reconnects += 1
+                self.failed_attempts = 0
+                logger.info(f"Stream reconnected after {reason}")
+                return True
+            self.failed_attempts += 1
+        return False
+
+    def _frozen_for(self, frame, now):
+        """Seconds the picture has not changed beyond the tolerance, 0 while it is a known static scene"""
+        thumb = frame_thumbnail(frame)
+        if self._still is None or frame_difference(thumb, self._still) > self.freeze_tolerance:
+            if self._still is not None and self.static_scene:
+                logger.info("Picture changed, freeze detection resumed")
+                self.static_scene = False
+            self._still = thumb
+            self._still_since = now
+        if self._frozen is not None:
+            # First frame after a freeze reconnect: the same picture again means nothing was stuck
+            if frame_difference(thumb, self._frozen) <= self.freeze_tolerance:
+                logger.info("Picture unchanged after reconnect, treating the stream as a static scene")
+                self.static_scene = True
+            self._frozen = None
+        return 0.0 if self.static_scene else now - self._still_since
+
+    def read(self):
+        """Next healthy frame as (True, frame, wall-clock capture time), or (False, None, None) once the stream is over"""
+        while not self.stop_event.is_set():
+            read_started = time.time()
+            ok, frame = self.cap.read()
+            now = time.time()
+            if not ok or frame is None:
+                if not self.live or not self._reconnect("read failed"):
+                    return False, None, None
+                continue
+            self._frames_read += 1
+
+            if self.live:
+                if now - read_started > self.stale_seconds:
+                    self.stale += 1
+                    logger.warning(f"Stream stalled for {now - read_started:.1f}s")
+                    # The stream clock stopped with it, lag is measured afresh
+                    self._clock = None
+                if self.freeze_seconds and self._frozen_for(frame, now) > self.freeze_seconds:
+                    self.frozen += 1
+                    self._frozen = self._still
+                    if not self._reconnect(f"frame frozen for {now - self._still_since:.1f}s"):
+                        return False, None, None
+                    continue
+                self._update_lag(now)
+                if self.lag > self.max_lag:
+                    self._flush()
+
+            self.last_frame_at = now
+            return True, frame, now
+        return False, None, None
+
+    @property
+    def stalled(self):
+        """Whether a live stream has delivered nothing for `stale_seconds`, e.g. while a read is blocked"""
+        return self.live and self.last_frame_at is not None and time.time() - self.last_frame_at > self.stale_seconds
+
+    def to_dict(self):
+        return {
+            'live': self.live,
+            'stalled': self.stalled,
+            'lagSeconds': round(self.lag, 3),
+            'lastFrameAt': self.last_frame_at,
+            'reconnects': self.reconnects,
+            'stale': self.stale,
+            'frozen': self.frozen,
+            'staticScene': self.static_scene,
+            'flushedFrames': self.flushed_frames,
+            'lastError': self.last_error,
+        }
@@ -0,0 +1,167 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Libraries that log per frame or per HTTP request at INFO
+NOISY_LOGGERS = ("ultralytics", "httpx", "httpcore", "telegram", "apscheduler", "matplotlib", "PIL")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields passed via log_event() become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Per-event-type sampling and rate limiting, applied in the calling thread
+    before a record is queued. `sample_rates` keeps a random fraction of an
+    event type, `rate_limits` caps it to N records per second (token bucket).
+    The next record that gets through carries the number of records dropped
+    since, so volume stays visible. Records without an event type pass through.
+    """
+
+    def __init__(self, sample_rates=None, rate_limits=None):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        self.rate_limits = dict(rate_limits or {})
+        self._buckets = {}  # event -> (tokens, last refill)
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None:
+            return True
+        keep = True
+        rate = self.sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            keep = False
+        limit = self.rate_limits.get(event)
+        with self._lock:
+            if keep and limit is not None:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(event, (limit, now))
+                tokens = min(limit, tokens + (now - last) * limit)
+                keep = tokens >= 1.0
+                self._buckets[event] = (tokens - 1.0 if keep else tokens, now)
+            if not keep:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False
+            record.suppressed = self._suppressed.pop(event, 0)
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback separate from the message for the JSON formatter"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_rates(spec):
+    """Parse "frame=0.01,pose_error=1" into {'frame': 0.01, 'pose_error': 1.0}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, value = item.partition("=")
+        rates[name.strip()] = float(value)
+    return rates
+
+
+def configure_logging(level=None, json_output=None, sample_rates=None, rate_limits=None):
+    """
+    Route all logging through a queue so callers never block on stdout; a
+    single listener thread formats and writes the records. Defaults come from
+    LOG_LEVEL, LOG_JSON, LOG_SAMPLE and LOG_RATE_LIMIT. Safe to call twice.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    if json_output is None:
+        json_output = os.getenv("LOG_JSON", "1") != "0"
+    if sample_rates is None:
+        sample_rates = parse_rates(os.getenv("LOG_SAMPLE", "frame=0.01"))
+    if rate_limits is None:
+        rate_limits = parse_rates(os.getenv("LOG_RATE_LIMIT", "frame=1,inference_error=1"))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if json_output else
+                        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    records = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample_rates, rate_limits))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    route_ultralytics_logging()
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def route_ultralytics_logging():
+    """
+    ultralytics installs its own stdout handler at import (INFO, not
+    propagating); route its logger through ours instead. Call again after
+    ultralytics is imported, since the import happens on first use.
+    """
+    ultralytics_logger = logging.getLogger("ultralytics")
+    ultralytics_logger.handlers = []
+    ultralytics_logger.propagate = True
+    ultralytics_logger.setLevel(logging.WARNING)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(logger, level, event, message, **fields):
+    """Log a structured record of an event type; sampling and rate limits apply per event."""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={'event': event, 'fields': fields})
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def create_bot(token, pool_size=8, timeout=20.0):
+    """A Bot whose HTTP connection pool is sized for concurrent sends to many chats"""
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+    return Bot(token=token, request=HTTPXRequest(connection_pool_size=pool_size, read_timeout=timeout,
+                                                 write_timeout=timeout))
+
+
+class RateLimiter:
+    """Async token bucket: `rate` sends per `per` seconds, with bursts of up to `burst`"""
+
+    def __init__(self, rate, per=1.0, burst=1):
+        self.interval = per / rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.interval)
+
+
+class AlertDispatcher:
+    """
+    Sends alerts to many chats through one bot and its connection pool.
+    Every send waits for a global limiter and the chat's own limiter
+    (Telegram allows about 30 messages per second overall, one per second
+    to a chat and 20 per minute to a group) and is retried after a flood
+    wait. Media is uploaded once, to the first recipient, and sent to the
+    others by the `file_id` Telegram returns.
+    """
+
+    def __init__(self, bot, global_rate=25.0, chat_rate=1.0, group_per_minute=20, max_retries=3):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._global = RateLimiter(global_rate, burst=max(1, int(global_rate)))
+        self._chats = {}  # chat id -> RateLimiter
+
+    def _limiter(self, chat_id):
+        limiter = self._chats.get(chat_id)
+        if limiter is None:
+            # Group and channel ids are negative
+            if str(chat_id).startswith('-'):
+                limiter = RateLimiter(self.group_per_minute, per=60.0, burst=5)
+            else:
+                limiter = RateLimiter(self.chat_rate, burst=1)
+            self._chats[chat_id] = limiter
+        return limiter
+
+    async def _call(self, method, chat_id, **kwargs):
+        from telegram.error import RetryAfter
+        for attempt in range(self.max_retries + 1):
+            await self._limiter(chat_id).acquire()
+            await self._global.acquire()
+            try:
+                return await method(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+                logger.warning(f"Telegram flood limit for chat {chat_id}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    async def _fan_out(self, method, chat_ids, **kwargs):
+        """Send to every chat concurrently; returns the number of chats reached"""
+        if not chat_ids:
+            return 0
+        results = await asyncio.gather(*(self._call(method, chat_id, **kwargs) for chat_id in chat_ids),
+                                       return_exceptions=True)
+        for chat_id, result in zip(chat_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error sending {method.__name__} to chat {chat_id}: {result}")
+        return sum(1 for result in results if not isinstance(result, Exception))
+
+    async def send_message(self, chat_ids, text, **kwargs):
+        return await self._fan_out(self.bot.send_message, list(dict.fromkeys(chat_ids)), text=text, **kwargs)
+
+    async def _send_media(self, method, field, chat_ids, media, file_id_of, **kwargs):
+        """Upload `media` (bytes) to the first chat that accepts it, then send its file_id to the rest"""
+        remaining = list(dict.fromkeys(chat_ids))
+        delivered = 0
+        while remaining:
+            chat_id = remaining.pop(0)
+            try:
+                message = await self._call(method, chat_id, **{field: media}, **kwargs)
+            except Exception as e:
+                logger.error(f"Error uploading {field} to chat {chat_id}: {e}")
+                continue
+            delivered += 1
+            file_id = file_id_of(message)
+            if file_id is not None:
+                return delivered + await self._fan_out(method, remaining, **{field: file_id}, **kwargs)
+        return delivered
+
+    async def send_photo(self, chat_ids, photo, **kwargs):
+        return await self._send_media(self.bot.send_photo, 'photo', chat_ids, photo,
+                                      lambda message: message.photo[-1].file_id if message.photo else None, **kwargs)
+
+    async def send_video(self, chat_ids, video, **kwargs):
+        return await self._send_media(self.bot.send_video, 'video', chat_ids, video,
+                                      lambda message: message.video.file_id if message.video else None, **kwargs)
+
+
+class ForwardingDispatcher:
+    """
+    Stand-in for AlertDispatcher in a worker process: every send is passed to
+    `forward(call)` (a JSON-safe dict) for the API process's dispatcher to make,
+    so one set of rate limits and file_ids covers all sessions. Media is
+    spooled to a file in `spool_dir`; deliver_forwarded() deletes it.
+    """
+
+    MEDIA_METHODS = ('send_photo', 'send_video')
+
+    def __init__(self, forward, spool_dir):
+        self.forward = forward
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _forward(self, method, chat_ids, **fields):
+        chat_ids = list(dict.fromkeys(chat_ids))
+        if not chat_ids:
+            return 0
+        return len(chat_ids) if self.forward({'method': method, 'chatIds': chat_ids, **fields}) else 0
+
+    def _forward_media(self, method, chat_ids, media, **kwargs):
+        fd, path = tempfile.mkstemp(dir=self.spool_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(media)
+        forwarded = self._forward(method, chat_ids, media=path, **kwargs)
+        if not forwarded:
+            os.remove(path)
+        return forwarded
+
+    async def send_message(self, chat_ids, text, **kwargs):
+        return self._forward('send_message', chat_ids, text=text, **kwargs)
+
+    async def send_photo(self, chat_ids, photo, **kwargs):
+        return self._forward_media('send_photo', chat_ids, photo, **kwargs)
+
+    async def send_video(self, chat_ids, video, **kwargs):
+        return self._forward_media('send_video', chat_ids, video, **kwargs)
+
+
+async def deliver_forwarded(dispatcher, call):
+    """Make a send forwarded by a ForwardingDispatcher through `dispatcher`, deleting its spooled media"""
+    fields = dict(call)
+    method, chat_ids, media = fields.pop('method'), fields.pop('chatIds'), fields.pop('media', None)
+    if media is None:
+        return await dispatcher.send_message(chat_ids, **fields)
+    try:
+        if method not in ForwardingDispatcher.MEDIA_METHODS:
+            raise ValueError(f"Unknown forwarded method {method}")
+        with open(media, 'rb') as f:
+            data = f.read()
+        return await getattr(dispatcher, method)(chat_ids, data, **fields)
+    finally:
+        try:
+            os.remove(media)
+        except OSError:
+            pass
+
+
+def expire_spool(spool_dir, max_age):
+    """Delete spooled media older than `max_age` seconds, left behind by lost forwards; returns the count"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        names = os.listdir(spool_dir)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        path = os.path.join(spool_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,71 @@
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TextEmbeddingCache:
+    """
+    On-disk cache of YOLOE text prompt embeddings, one file per class name
+    under a directory named after the model weights' hash, so a different
+    checkpoint never reuses stale embeddings. Only names missing from the
+    cache go through the text encoder, in a single batch.
+    """
+
+    def __init__(self, root, weights_path):
+        self.root = root
+        self.weights_path = weights_path
+        self._model_hash = None
+        self._memory = {}  # class name -> (D,) tensor
+        self._lock = threading.Lock()
+
+    @property
+    def model_hash(self):
+        if self._model_hash is None:
+            self._model_hash = file_sha256(self.weights_path)[:16]
+        return self._model_hash
+
+    def _path(self, name):
+        key = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, self.model_hash, f"{key}.pt")
+
+    def get(self, model, names):
+        """Embeddings for `names` as a (1, N, D) tensor, computing and storing the missing ones"""
+        import torch
+
+        with self._lock:
+            missing = []
+            for name in names:
+                if name in self._memory:
+                    continue
+                path = self._path(name)
+                if os.path.exists(path):
+                    try:
+                        self._memory[name] = torch.load(path, map_location="cpu")
+                        continue
+                    except Exception as e:
+                        logger.warning(f"Ignoring unreadable embedding cache entry {path}: {e}")
+                missing.append(name)
+
+            if missing:
+                logger.info(f"Encoding {len(missing)} class names with the text encoder: {missing}")
+                embeddings = model.get_text_pe(missing)
+                os.makedirs(os.path.join(self.root, self.model_hash), exist_ok=True)
+                for name, embedding in zip(missing, embeddings[0]):
+                    embedding = embedding.detach().cpu().clone()
+                    self._memory[name] = embedding
+                    path = self._path(name)
+                    torch.save(embedding, f"{path}.tmp")
+                    os.replace(f"{path}.tmp", path)
+
+            return torch.stack([self._memory[name] for name in names]).unsqueeze(0)
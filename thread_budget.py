@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL_STAGES = ('violence', 'pose', 'anomaly')
+
+
+@dataclass(frozen=True)
+class Allocation:
+    """Intra-op threads and (when pinning) the cores of one session's model stage"""
+
+    threads: int
+    cpus: Tuple[int, ...]
+
+
+def available_cpus():
+    """CPU ids this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadBudget:
+    """
+    Divides a fixed number of cores between the active sessions and their
+    model stages, so that several sessions do not each start torch's default
+    one-thread-per-core pools and oversubscribe the node. `reserved` cores are
+    left to capture, annotation and the API, and also size OpenCV's (global)
+    pool. The rest is split evenly across sessions; a session that runs its
+    models concurrently splits its share again across the stages, a
+    sequential one gives every stage the whole share. Allocations are
+    recomputed whenever a session starts or stops, or the cores change, and
+    picked up by the calling thread on its next model call through `apply`.
+    """
+
+    def __init__(self, cores, reserved=1, pin=False, cpus=None):
+        cpus = list(cpus) if cpus else available_cpus()
+        self.cpus = cpus[:cores] if cores else cpus
+        self.reserved = min(reserved, len(self.cpus) - 1)
+        self.pin = pin and hasattr(os, 'sched_setaffinity')
+        self._sessions = {}  # session_id -> runs its stages concurrently
+        self._allocations = {}  # (session_id, stage) -> Allocation
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def register(self, session_id, concurrent):
+        with self._lock:
+            self._sessions[session_id] = concurrent
+            self._rebalance()
+
+    def unregister(self, session_id):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._rebalance()
+
+    def set_cpus(self, cpus):
+        """Replace the cores being divided, e.g. a worker process's new share, and rebalance"""
+        with self._lock:
+            self.cpus = list(cpus)
+            self.reserved = min(self.reserved, len(self.cpus) - 1)
+            self._rebalance()
+
+    def _rebalance(self):
+        model_cpus = self.cpus[self.reserved:]
+        self._allocations = {}
+        if self._sessions:
+            share = len(model_cpus) / len(self._sessions)
+            for index, (session_id, concurrent) in enumerate(self._sessions.items()):
+                session_cpus = self._slice(model_cpus, index * share, share)
+                if concurrent:
+                    stage_share = len(session_cpus) / len(MODEL_STAGES)
+                    for stage_index, stage in enumerate(MODEL_STAGES):
+                        cpus = self._slice(session_cpus, stage_index * stage_share, stage_share)
+                        self._allocations[(session_id, stage)] = Allocation(len(cpus), cpus)
+                else:
+                    for stage in MODEL_STAGES:
+                        self._allocations[(session_id, stage)] = Allocation(len(session_cpus), session_cpus)
+        self._generation += 1
+        self._apply_opencv()
+        threads = {f"{session_id[:8]}/{stage}": allocation.threads
+                   for (session_id, stage), allocation in self._allocations.items()}
+        logger.info(f"Thread budget rebalanced for {len(self._sessions)} session(s): {threads}")
+
+    @staticmethod
+    def _slice(cpus, start, length):
+        """At least one core; consumers share cores once there are more of them than cores"""
+        first = int(start) % len(cpus)
+        count = max(1, int(start + length) - int(start))
+        return tuple(cpus[(first + offset) % len(cpus)] for offset in range(count))
+
+    def _apply_opencv(self):
+        import cv2
+        cv2.setNumThreads(max(1, self.reserved))
+
+    def apply(self, session_id, stage):
+        """Set torch's thread count (and affinity) of the calling thread for a model stage; cheap when unchanged"""
+        allocation = self._allocations.get((session_id, stage))
+        if allocation is None:
+            return
+        key = (self._generation, allocation)
+        if getattr(self._local, 'key', None) == key:
+            return
+        import torch
+        if torch.get_num_threads() != allocation.threads:
+            torch.set_num_threads(allocation.threads)
+        if self.pin:
+            # With pid 0 Linux pins only the calling thread; pools it creates later inherit the mask
+            os.sched_setaffinity(0, allocation.cpus)
+        self._local.key = key
+
+    def session_cpus(self, session_id):
+        """All cores given to a session's stages, e.g. to hand to its worker process"""
+        return sorted({cpu for (owner, _), allocation in self._allocations.items() if owner == session_id
+                       for cpu in allocation.cpus})
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'cores': len(self.cpus),
+                'reserved': self.reserved,
+                'pinned': self.pin,
+                'allocations': {
+                    f"{session_id}/{stage}": {'threads': allocation.threads, 'cpus': list(allocation.cpus)}
+                    for (session_id, stage), allocation in self._allocations.items()
+                },
+            }
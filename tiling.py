@@ -0,0 +1,124 @@
+import time
+
+import cv2
+import numpy as np
+
+from motion import MotionGate
+
+
+def tile_rects(width, height, tile_size, overlap):
+    """Overlapping (x1, y1, x2, y2) tiles covering the frame; edge tiles are shifted inwards to keep their size"""
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    return np.array([(x, y, min(width, x + tile_size), min(height, y + tile_size))
+                     for y in starts(height) for x in starts(width)], dtype=np.int64)
+
+
+class TiledDetector:
+    """
+    Tiled inference for small objects on high-resolution frames. The frame is
+    cut into overlapping `tile_size` tiles, and only tiles with motion or
+    overlapping a person box are sent to the model, as one batch predicted
+    at `tile_size` so tiles keep their full resolution, plus an optional
+    downscaled full-frame pass at the session's imgsz for large objects. Tile
+    detections are mapped back to frame coordinates and merged with
+    class-aware NMS. `last_cost` describes the work done for the last frame.
+    """
+
+    def __init__(self, tile_size=640, overlap=0.2, motion_threshold=0.01, full_frame=True, iou=0.5):
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.motion_threshold = motion_threshold
+        self.full_frame = full_frame
+        self.iou = iou
+        self.motion = MotionGate(threshold=motion_threshold)
+        self._shape = None
+        self.rects = None
+        self.last_cost = {}
+
+    def _prepare(self, shape):
+        height, width = shape[:2]
+        if self._shape != (height, width):
+            self.rects = tile_rects(width, height, self.tile_size, self.overlap)
+            self._shape = (height, width)
+
+    def select(self, frame, motion_mask=None, person_boxes=None):
+        """Indices of the tiles that have motion or overlap a person"""
+        self._prepare(frame.shape)
+        rects = self.rects
+        selected = np.zeros(len(rects), dtype=bool)
+
+        if motion_mask is None:
+            motion_mask = self.motion.motion_mask(frame)
+        # Changed-pixel fraction per tile from an integral image of the motion thumbnail
+        scale = motion_mask.shape[1] / frame.shape[1]
+        integral = cv2.integral(motion_mask.astype(np.uint8))
+        x1 = np.clip((rects[:, 0] * scale).astype(np.int64), 0, motion_mask.shape[1])
+        y1 = np.clip((rects[:, 1] * scale).astype(np.int64), 0, motion_mask.shape[0])
+        x2 = np.clip(np.ceil(rects[:, 2] * scale).astype(np.int64), 0, motion_mask.shape[1])
+        y2 = np.clip(np.ceil(rects[:, 3] * scale).astype(np.int64), 0, motion_mask.shape[0])
+        changed = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        area = np.maximum((x2 - x1) * (y2 - y1), 1)
+        selected |= changed / area >= self.motion_threshold
+
+        if person_boxes is not None and len(person_boxes):
+            boxes = np.asarray(person_boxes)[:, :4]
+            overlap = ((rects[:, None, 0] < boxes[None, :, 2]) & (boxes[None, :, 0] < rects[:, None, 2]) &
+                       (rects[:, None, 1] < boxes[None, :, 3]) & (boxes[None, :, 1] < rects[:, None, 3]))
+            selected |= overlap.any(axis=1)
+        return np.flatnonzero(selected)
+
+    def detect(self, model, frame, imgsz, conf=0.1, motion_mask=None, person_boxes=None):
+        """Run `model` on the selected tiles (plus the full frame) in one batch; returns a list with one Results"""
+        import torch
+        import torchvision
+        from ultralytics.engine.results import Results
+
+        start = time.perf_counter()
+        indices = self.select(frame, motion_mask, person_boxes)
+        tiles = []
+        offsets = [(0, 0)] if self.full_frame else []
+        for x1, y1, x2, y2 in self.rects[indices]:
+            tiles.append(frame[y1:y2, x1:x2])
+            offsets.append((int(x1), int(y1)))
+
+        results = []
+        if self.full_frame:
+            results += model.predict(frame, imgsz=imgsz, conf=conf, verbose=False)
+        if tiles:
+            # At a smaller imgsz the tiles would be downscaled again, losing the small objects tiling is for
+            results += model.predict(tiles, imgsz=self.tile_size, conf=conf, verbose=False)
+        if not results:
+            names = getattr(model, 'names', {})
+            merged = Results(frame, path="", names=names, boxes=torch.zeros((0, 6)))
+        else:
+            boxes = []
+            for result, (x, y) in zip(results, offsets):
+                if result.boxes is None or len(result.boxes) == 0:
+                    continue
+                data = result.boxes.data.clone()
+                data[:, [0, 2]] += x
+                data[:, [1, 3]] += y
+                boxes.append(data)
+            if boxes:
+                boxes = torch.cat(boxes)
+                keep = torchvision.ops.batched_nms(boxes[:, :4], boxes[:, 4], boxes[:, 5].long(), self.iou)
+                boxes = boxes[keep]
+            else:
+                boxes = results[0].boxes.data[:0]
+            merged = Results(frame, path=results[0].path, names=results[0].names, boxes=boxes)
+
+        self.last_cost = {
+            'tiles': len(indices),
+            'tilesTotal': len(self.rects),
+            # Tiles run at tile_size, the full frame at imgsz
+            'images': len(results),
+            'ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+        return [merged]
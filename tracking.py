@@ -0,0 +1,127 @@
+from collections import Counter, deque
+
+import numpy as np
+
+
+class Track:
+    """Compact state of one tracked person or object: label history, keypoints, anomaly dwell and last alert"""
+
+    __slots__ = ('track_id', 'label', 'labels', 'keypoints', 'first_seen', 'last_seen', 'last_frame',
+                 'anomaly_since', 'last_alert')
+
+    def __init__(self, track_id, history, now):
+        self.track_id = track_id
+        self.label = None
+        self.labels = deque(maxlen=history)  # per-frame action or class name
+        self.keypoints = None  # smoothed (x, y, confidence) per keypoint
+        self.first_seen = now
+        self.last_seen = now
+        self.last_frame = 0
+        self.anomaly_since = None
+        self.last_alert = None
+
+    def observe(self, label, now, anomalous):
+        """
+        Add one frame's label and return the track's label: the most frequent
+        one in its history, the latest on ties. `anomalous` tells whether a
+        label is an anomaly, to measure how long the track has been one.
+        """
+        self.labels.append(label)
+        counts = Counter(self.labels)
+        best = max(counts.values())
+        self.label = next(candidate for candidate in reversed(self.labels) if counts[candidate] == best)
+        self.last_seen = now
+        if not anomalous(self.label):
+            self.anomaly_since = None
+        elif self.anomaly_since is None:
+            self.anomaly_since = now
+        return self.label
+
+    def dwell(self, now):
+        """Seconds the track has been an anomaly"""
+        return now - self.anomaly_since if self.anomaly_since is not None else 0.0
+
+
+class Tracker:
+    """
+    ByteTrack (from supervision) over one model's detections, with a Track
+    per identity, so that a person or object keeps its state across frames
+    and short detection gaps. A track's label is voted over its last
+    `history` frames, its keypoints are smoothed exponentially (`smoothing`
+    is the weight of the past) and it may raise a new event at most every
+    `realert_seconds`. Tracks that ByteTrack has not matched for
+    `lost_frames` updates are forgotten. `activation_threshold` should be
+    the model's confidence threshold, or ByteTrack never starts tracks for
+    detections below its default of 0.25.
+    """
+
+    def __init__(self, history=5, smoothing=0.5, min_confidence=0.3, lost_frames=30, realert_seconds=60.0,
+                 activation_threshold=0.25):
+        import supervision as sv
+
+        # One update per processed frame, so the buffer counts processed frames
+        self._byte_track = sv.ByteTrack(track_activation_threshold=activation_threshold,
+                                       lost_track_buffer=lost_frames, frame_rate=30)
+        self.history = history
+        self.smoothing = smoothing
+        self.min_confidence = min_confidence
+        self.lost_frames = lost_frames
+        self.realert_seconds = realert_seconds
+        self.tracks = {}  # tracker id -> Track
+        self.frame = 0
+
+    def update(self, detections, now):
+        """Track one frame's supervision Detections (adding an 'index' field); returns (Track, detection index) per tracked detection"""
+        detections.data['index'] = np.arange(len(detections))
+        tracked = self._byte_track.update_with_detections(detections)
+        self.frame += 1
+        matched = []
+        # Without any track, supervision returns empty detections without our 'index' data
+        pairs = zip(tracked.tracker_id.tolist(), tracked.data['index'].tolist()) if len(tracked) else ()
+        for track_id, index in pairs:
+            track = self.tracks.get(track_id)
+            if track is None:
+                track = self.tracks[track_id] = Track(track_id, self.history, now)
+            track.last_frame = self.frame
+            matched.append((track, index))
+        for track_id in [track_id for track_id, track in self.tracks.items() if self.frame - track.last_frame > self.lost_frames]:
+            del self.tracks[track_id]
+        return matched
+
+    def smooth(self, track, keypoints):
+        """
+        Blend a detection's keypoints into the track's and return the result.
+        Keypoints below `min_confidence` keep their last position, and their
+        confidence decays until they are dropped.
+        """
+        if keypoints.shape[1] == 2:
+            keypoints = np.hstack([keypoints, np.ones((len(keypoints), 1), dtype=keypoints.dtype)])
+        if track.keypoints is None:
+            track.keypoints = keypoints.astype(np.float32)
+            return track.keypoints
+        visible = keypoints[:, 2] >= self.min_confidence
+        known = track.keypoints[:, 2] >= self.min_confidence
+        blended = self.smoothing * track.keypoints[:, :2] + (1 - self.smoothing) * keypoints[:, :2]
+        track.keypoints[:, :2] = np.where((visible & known)[:, None], blended,
+                                          np.where(visible[:, None], keypoints[:, :2], track.keypoints[:, :2]))
+        track.keypoints[:, 2] = np.maximum(keypoints[:, 2], track.keypoints[:, 2] * self.smoothing)
+        return track.keypoints
+
+    def alert(self, track, now):
+        """Whether a track may raise a new event; records it when it may"""
+        if track.last_alert is not None and now - track.last_alert < self.realert_seconds:
+            return False
+        track.last_alert = now
+        return True
+
+    def to_dict(self, now):
+        return [
+            {
+                'trackId': track.track_id,
+                'label': track.label,
+                'ageSeconds': round(now - track.first_seen, 1),
+                'dwellSeconds': round(track.dwell(now), 1),
+                'lastAlertSeconds': round(now - track.last_alert, 1) if track.last_alert is not None else None,
+            }
+            for track in list(self.tracks.values())
+        ]
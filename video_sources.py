@@ -0,0 +1,283 @@
+import json
+import logging
+import subprocess
+import time
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cached result of `ffmpeg -hwaccels`
+_available_hwaccels = None
+
+
+def available_hwaccels():
+    """Return the hardware acceleration methods this ffmpeg build supports"""
+    global _available_hwaccels
+    if _available_hwaccels is None:
+        try:
+            output = subprocess.run(["ffmpeg", "-hide_banner", "-hwaccels"], capture_output=True,
+                                    text=True, timeout=10).stdout
+            _available_hwaccels = {line.strip() for line in output.splitlines()[1:] if line.strip()}
+        except (OSError, subprocess.SubprocessError):
+            _available_hwaccels = set()
+    return _available_hwaccels
+
+
+def probe_stream(source, timeout=15):
+    """Return width, height, fps and frame count of the first video stream using ffprobe"""
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,avg_frame_rate,r_frame_rate,nb_frames",
+        "-of", "json",
+    ]
+    if str(source).startswith("rtsp://"):
+        command += ["-rtsp_transport", "tcp"]
+    output = subprocess.run(command + [str(source)], capture_output=True, text=True,
+                            timeout=timeout, check=True).stdout
+    streams = json.loads(output).get("streams") or []
+    if not streams:
+        raise ValueError(f"No video stream found in {source}")
+    stream = streams[0]
+
+    fps = 0.0
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        num, _, den = stream.get(key, "0/0").partition("/")
+        if den and float(den) and float(num):
+            fps = float(num) / float(den)
+            break
+    frames = stream.get("nb_frames")
+    return {
+        'width': int(stream['width']),
+        'height': int(stream['height']),
+        'fps': fps,
+        'frames': int(frames) if frames and frames.isdigit() else -1,
+    }
+
+
+class FFmpegCapture:
+    """
+    cv2.VideoCapture-compatible reader that decodes in an ffmpeg subprocess.
+    Scaling and fps decimation happen in the decoder, and raw BGR frames are
+    read with readinto() into a small ring of preallocated arrays. Frames
+    returned by read() are views into that ring: they stay valid for the next
+    `buffers - 1` reads, so copy any frame that must outlive that.
+    """
+
+    def __init__(self, source, width=None, height=None, fps=None, hwaccel=None, buffers=4, rtsp_transport="tcp",
+                 timeout=None):
+        self.source = str(source)
+        self.process = None
+        self._info = {'width': 0, 'height': 0, 'fps': 0.0, 'frames': -1}
+
+        try:
+            self._info = probe_stream(self.source)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            logger.error(f"Error probing video source {self.source}: {e}")
+            return
+
+        self.width, self.height = self._output_size(width, height)
+        self.fps = fps or self._info['fps']
+        self.frame_size = self.width * self.height * 3
+        self._buffers = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(max(2, buffers))]
+        self._views = [memoryview(buf).cast('B') for buf in self._buffers]
+        self._index = 0
+
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if hwaccel:
+            if hwaccel == "auto" or hwaccel in available_hwaccels():
+                command += ["-hwaccel", hwaccel]
+            else:
+                logger.warning(f"Hardware acceleration '{hwaccel}' not available, decoding on CPU")
+        if self.source.startswith("rtsp://"):
+            command += ["-rtsp_transport", rtsp_transport]
+        if timeout and "://" in self.source:
+            # ffmpeg exits on a stalled network stream, which ends the pipe instead of blocking read()
+            command += ["-rw_timeout", str(int(timeout * 1e6))]
+        command += ["-i", self.source, "-an", "-sn", "-dn"]
+
+        filters = []
+        if fps:
+            filters.append(f"fps={fps}")
+        if (self.width, self.height) != (self._info['width'], self._info['height']):
+            filters.append(f"scale={self.width}:{self.height}:flags=area")
+        if filters:
+            command += ["-vf", ",".join(filters)]
+        command += ["-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+
+        try:
+            # Unbuffered pipe: readinto() lands directly in our frame buffers
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        except OSError as e:
+            logger.error(f"Error starting ffmpeg: {e}")
+            self.process = None
+
+    def _output_size(self, width, height):
+        src_w, src_h = self._info['width'], self._info['height']
+        if width and not height:
+            height = round(src_h * width / src_w)
+        elif height and not width:
+            width = round(src_w * height / src_h)
+        elif not width and not height:
+            width, height = src_w, src_h
+        # Most pixel formats and scalers want even dimensions
+        return int(width) // 2 * 2, int(height) // 2 * 2
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def read(self):
+        """Read the next frame into the ring and return (ok, frame view)"""
+        if self.process is None:
+            return False, None
+        view = self._views[self._index]
+        filled = 0
+        while filled < self.frame_size:
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+        frame = self._buffers[self._index]
+        self._index = (self._index + 1) % len(self._buffers)
+        return True, frame
+
+    def grab(self):
+        ok, _ = self.read()
+        return ok
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(getattr(self, 'width', 0))
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(getattr(self, 'height', 0))
+        if prop == cv2.CAP_PROP_FPS:
+            return float(getattr(self, 'fps', 0.0))
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self._info['frames'])
+        return 0.0
+
+    def set(self, prop, value):
+        # Seeking is not supported on a pipe
+        return False
+
+    def release(self):
+        if self.process is not None:
+            self.process.kill()
+            try:
+                self.process.stdout.close()
+            finally:
+                self.process.wait()
+            self.process = None
+
+
+class SyntheticCapture:
+    """
+    Simulated live camera for load tests, opened from a URL such as
+    `synthetic://cam1?video=Violence/violence.mp4&fps=15&width=1280&height=720`.
+    It loops the given video, or draws moving shapes over noise when there is
+    none, resized to the requested resolution and paced to `fps` like a real
+    stream, so a slow consumer falls behind instead of reading faster.
+    """
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        self.name = parsed.netloc or "synthetic"
+        self.video = params.get('video')
+        self.fps = float(params.get('fps', 15))
+        self.width = int(params.get('width', 1280))
+        self.height = int(params.get('height', 720))
+        self._cap = None
+        if self.video:
+            self._cap = cv2.VideoCapture(self.video)
+            if not self._cap.isOpened():
+                logger.error(f"Could not open {self.video} for synthetic source {self.name}")
+                self._cap = None
+        self._opened = self._cap is not None or not self.video
+        self._rng = np.random.default_rng(abs(hash(self.name)) % 2 ** 32)
+        self._background = self._rng.integers(0, 64, (self.height, self.width, 3), dtype=np.uint8)
+        self._started = None
+        self._index = 0
+
+    def isOpened(self):
+        return self._opened
+
+    def _next_frame(self):
+        if self._cap is not None:
+            ok, frame = self._cap.read()
+            if not ok:
+                # Loop the video
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self._cap.read()
+                if not ok:
+                    return None
+            if frame.shape[:2] != (self.height, self.width):
+                frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+            return frame
+        frame = self._background.copy()
+        # A box moving across the frame plus a little noise, so motion gating and hashing see change
+        x = int((self._index * 8) % max(1, self.width - 80))
+        cv2.rectangle(frame, (x, self.height // 3), (x + 80, self.height // 3 + 160), (255, 255, 255), -1)
+        frame[::16, ::16] = self._rng.integers(0, 255, frame[::16, ::16].shape, dtype=np.uint8)
+        return frame
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        if self._started is None:
+            self._started = time.monotonic()
+        # Frame i is due at i / fps; frames that are late are dropped, as a live source would
+        due = self._started + self._index / self.fps
+        now = time.monotonic()
+        if now < due:
+            time.sleep(due - now)
+        else:
+            behind = int((now - due) * self.fps)
+            for _ in range(behind):
+                if self._cap is not None:
+                    self._cap.grab()
+            self._index += behind
+        frame = self._next_frame()
+        self._index += 1
+        return frame is not None, frame
+
+    def grab(self):
+        ok, _ = self.read()
+        return ok
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self._index / self.fps * 1000
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self._opened = False
+
+
+def open_capture(source, backend="opencv", width=None, fps=None, hwaccel=None, timeout=None):
+    """Open a video source with the requested capture backend; `timeout` (seconds) bounds stalled network reads"""
+    if str(source).startswith("synthetic://"):
+        return SyntheticCapture(source)
+    if backend == "ffmpeg" and not isinstance(source, int):
+        return FFmpegCapture(source, width=width, fps=fps, hwaccel=hwaccel, timeout=timeout)
+    if backend not in ("opencv", "ffmpeg"):
+        raise ValueError(f"Unknown capture backend: {backend}")
+    if timeout and not isinstance(source, int) and hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+        # OpenCV >= 4.6 (FFmpeg backend): a stalled stream fails the read instead of blocking
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(timeout * 1000), cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(timeout * 1000)]
+        return cv2.VideoCapture(source, cv2.CAP_ANY, params)
+    return cv2.VideoCapture(source)
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be honoured."""
+
+
+class Upload:
+    """Metadata for one resumable upload, persisted next to the data file."""
+
+    def __init__(self, upload_id: str, filename: str, size: Optional[int] = None, sha256: Optional[str] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256.lower() if sha256 else None
+        self.received = 0
+        self.complete = False
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def to_dict(self) -> dict:
+        return {
+            'uploadId': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'sha256': self.sha256,
+            'received': self.received,
+            'complete': self.complete,
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Upload":
+        upload = cls(data['uploadId'], data['filename'], data.get('size'), data.get('sha256'))
+        upload.received = data.get('received', 0)
+        upload.complete = data.get('complete', False)
+        upload.created_at = data.get('createdAt', upload.created_at)
+        upload.updated_at = data.get('updatedAt', upload.updated_at)
+        return upload
+
+
+class UploadStore:
+    """
+    Stores uploaded videos on disk under a unique id per file.
+    Chunks are streamed straight to disk at the offset the client resumes from,
+    and the content hash is checked when the upload is completed. A chunk
+    that fails part way is cut off again, so the data file always ends at the
+    last committed offset. Writing, completing and deleting an upload take
+    its lock, so none of them sees another half done. Incomplete uploads
+    left alone for too long are removed by expire().
+    """
+
+    def __init__(self, root: str, max_size: Optional[int] = None):
+        self.root = root
+        self.max_size = max_size
+        self._uploads = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.bin")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.json")
+
+    def _save(self, upload: Upload):
+        upload.updated_at = time.time()
+        tmp_path = self._meta_path(upload.upload_id) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(upload.to_dict(), f)
+        os.replace(tmp_path, self._meta_path(upload.upload_id))
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename: str, size: Optional[int] = None, sha256: Optional[str] = None) -> Upload:
+        """Register a new upload and create its empty data file."""
+        if size is not None and self.max_size and size > self.max_size:
+            raise UploadError(f"Upload exceeds the maximum size of {self.max_size} bytes")
+        upload = Upload(uuid.uuid4().hex, os.path.basename(filename or "video.mp4"), size, sha256)
+        open(self._data_path(upload.upload_id), 'wb').close()
+        self._save(upload)
+        with self._lock:
+            self._uploads[upload.upload_id] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Optional[Upload]:
+        """Look up an upload, reloading its metadata from disk after a restart."""
+        upload = self._uploads.get(upload_id)
+        if upload is None and all(c in "0123456789abcdef" for c in upload_id) and os.path.exists(self._meta_path(upload_id)):
+            with open(self._meta_path(upload_id)) as f:
+                upload = Upload.from_dict(json.load(f))
+            # Trust the bytes actually on disk over the last saved offset
+            upload.received = os.path.getsize(self._data_path(upload_id))
+            with self._lock:
+                self._uploads[upload_id] = upload
+        return upload
+
+    async def write_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                          chunk_sha256: Optional[str] = None) -> Upload:
+        """Append a streamed chunk at offset, which must equal the bytes received so far."""
+        upload = self.get(upload_id)
+        if upload is None:
+            raise KeyError(upload_id)
+        lock = self._upload_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("Another chunk is being written to this upload")
+        try:
+            if upload_id not in self._uploads:
+                raise KeyError(upload_id)  # deleted while waiting for the lock
+            if upload.complete:
+                raise UploadError("Upload is already complete")
+            if offset != upload.received:
+                raise UploadError(f"Expected offset {upload.received}, got {offset}")
+
+            hasher = hashlib.sha256()
+            written = 0
+            limit = upload.size if upload.size is not None else self.max_size
+            # Disk writes and hashing run on a worker thread so the event loop keeps serving requests
+            f = await asyncio.to_thread(open, self._data_path(upload_id), 'r+b')
+            try:
+                f.seek(offset)
+                async for data in chunks:
+                    if not data:
+                        continue
+                    written += len(data)
+                    if limit and offset + written > limit:
+                        raise UploadError("Chunk runs past the declared upload size")
+                    await asyncio.to_thread(self._write_block, f, hasher, data)
+
+                if chunk_sha256 and hasher.hexdigest() != chunk_sha256.lower():
+                    raise UploadError("Chunk hash mismatch")
+            except BaseException:
+                # Drop the partial chunk (bad hash, client gone, ...) so the client can resend it
+                f.truncate(offset)
+                raise
+            finally:
+                f.close()
+
+            upload.received = offset + written
+            self._save(upload)
+            return upload
+        finally:
+            lock.release()
+
+    @staticmethod
+    def _write_block(f, hasher, data: bytes):
+        f.write(data)
+        hasher.update(data)
+
+    def complete(self, upload_id: str) -> Upload:
+        """Verify size and content hash, then mark the upload usable."""
+        upload = self.get(upload_id)
+        if upload is None:
+            raise KeyError(upload_id)
+        lock = self._upload_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("A chunk is being written to this upload")
+        try:
+            if upload_id not in self._uploads:
+                raise KeyError(upload_id)
+            return self._complete(upload)
+        finally:
+            lock.release()
+
+    def _complete(self, upload: Upload) -> Upload:
+        upload_id = upload.upload_id
+        if upload.complete:
+            return upload
+        if upload.size is not None and upload.received != upload.size:
+            raise UploadError(f"Upload incomplete: {upload.received} of {upload.size} bytes received")
+
+        hasher = hashlib.sha256()
+        with open(self._data_path(upload_id), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        if upload.sha256 and digest != upload.sha256:
+            raise UploadError("Content hash mismatch")
+
+        upload.sha256 = digest
+        upload.size = upload.received
+        upload.complete = True
+        self._save(upload)
+        return upload
+
+    def path(self, upload_id: str) -> str:
+        """Return the data file of a completed upload."""
+        upload = self.get(upload_id)
+        if upload is None:
+            raise KeyError(upload_id)
+        if not upload.complete:
+            raise UploadError("Upload is not complete")
+        return self._data_path(upload_id)
+
+    def delete(self, upload_id: str):
+        """Remove an upload and its data."""
+        lock = self._upload_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("A chunk is being written to this upload")
+        try:
+            self._delete(upload_id)
+        finally:
+            lock.release()
+
+    def _delete(self, upload_id: str):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+        for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self, max_age: float) -> int:
+        """Delete incomplete uploads not written to for `max_age` seconds; returns how many were deleted."""
+        now = time.time()
+        expired = 0
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            upload = self.get(name[:-5])
+            if upload is None or upload.complete or now - upload.updated_at <= max_age:
+                continue
+            lock = self._upload_lock(upload.upload_id)
+            if not lock.acquire(blocking=False):
+                continue  # a chunk is being written right now
+            try:
+                self._delete(upload.upload_id)
+                expired += 1
+            finally:
+                lock.release()
+        return expired